@@ -1,66 +1,116 @@
+import time
+
+STARTED = time.perf_counter()
+
+from bisect import bisect_left
+from collections import OrderedDict
 from decimal import Decimal
+import logging
+import os
+import re
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QTableWidget, QTableWidgetItem, \
-QVBoxLayout, QHBoxLayout, QDialog, QLineEdit, QPushButton, QMessageBox, QFormLayout, QFileDialog
-import mysql.connector as sql
-from pandas import DataFrame
+import threading
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QWidget, QTableView, \
+QVBoxLayout, QHBoxLayout, QDialog, QLineEdit, QPushButton, QMessageBox, QFormLayout, QFileDialog, QProgressDialog, \
+QLabel, QTableWidget, QTableWidgetItem
+from audit import AuditLog
+from bulk import default_rejects_path, import_customers, post_transactions, post_transfers
+from cache import AccountCache
+from database import (SORT_COLUMNS, AccountNotFound, BankError, UpdateConflict, customer_page_query, db_errors,
+                      load_config, open_database, sort_columns)
+from exporter import EXPORT_COLUMNS, EXPORT_FILTERS, ExportCancelled, export_customers
+from metrics import fingerprint
+from service import BankService
+from snapshot import CustomerSnapshot
+from workers import OutcomeUnknown, QueryExecutor
+
+IMPORTED = time.perf_counter()
+
+startup_logger = logging.getLogger('bankdb.startup')
 
 class BankApp(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.init_ui()
+        self.startup_phases = [('imports', IMPORTED - STARTED)]
 
-        self.db = sql.connect(
-            host="localhost",
-            user="root",
-            password="tani",
-        )
-        self.cursor = self.db.cursor()
+        self.init_ui()
 
+        config = load_config()
+        self.db = open_database(config)
+        self.customers = self.db.repository(AccountCache.from_config(config))
+        self.service = BankService(self.customers, AuditLog.from_config(self.db, config))
+        self.executor = QueryExecutor(self.db, parent=self)
+        self.refresh_interval = float(config['refresh_interval'])
+        self.record_startup('initialized')
+
+        self.prune_timer = QTimer(self)
+        self.prune_timer.setInterval(self.service.prune_interval * 1000)
+        self.prune_timer.timeout.connect(self.prune_changes)
+        self.prune_timer.start()
+
+        self.compact_timer = QTimer(self)
+        self.compact_timer.setInterval(self.service.compact_interval * 1000)
+        self.compact_timer.timeout.connect(self.compact_reports)
+        self.compact_timer.start()
+
+        # The window is usable while the database is reached and migrated in the background.
+        QTimer.singleShot(0, lambda: self.record_startup('window shown'))
         self.check_database()
 
+    def record_startup(self, phase):
+        self.startup_phases.append((phase, time.perf_counter() - STARTED))
+
+    def report_startup(self):
+        for phase, seconds in self.startup_phases:
+            self.db.metrics.record('startup', phase, seconds)
+
+        startup_logger.info("Startup: %s", ", ".join(f"{phase} {seconds * 1000:.0f} ms"
+                                                     for phase, seconds in self.startup_phases))
+
+    def prune_changes(self):
+
+        self.executor.submit(self.service.prune_changes, timeout=0)
+
+    def compact_reports(self):
+
+        self.executor.submit(self.service.compact_reports, timeout=0)
+
     def check_database(self):
 
-        self.cursor.execute("SHOW DATABASES LIKE 'TanishkBankDB'")
-        result = self.cursor.fetchone()
+        self.executor.submit(self.service.check_database, on_result=self.database_checked,
+                             on_error=self.database_check_failed, timeout=0)
+
+    def database_checked(self, exists):
+
+        self.record_startup('database ready')
+        self.report_startup()
 
-        if not result:
+        if not exists:
             QMessageBox.critical(self, "Error", "Database not detected. Setup Database before use.")
-        else:
-            self.cursor.execute("use TanishkBankDB")
+
+    def database_check_failed(self, error):
+
+        self.record_startup('database unavailable')
+        self.report_startup()
+        self.show_query_error(error)
 
     def setup_database(self):
 
-        self.cursor.execute("SHOW DATABASES LIKE 'TanishkBankDB'")
-        result = self.cursor.fetchone()
+        self.executor.submit(self.service.setup_database, on_result=self.database_setup_finished,
+                             on_error=self.show_query_error, timeout=0)
 
-        if not result:
+    def database_setup_finished(self, created):
 
-            self.cursor.execute("CREATE DATABASE TanishkBankDB")
-            self.db.commit()
+        if created:
             QMessageBox.information(self, "Success!", "Database has been successfully setup.")
         else:
             QMessageBox.warning(self, "Error", "Database already setup.")
 
-        self.cursor.execute("USE TanishkBankDB")
-
-        self.cursor.execute("SHOW TABLES LIKE 'customers'")
-        result = self.cursor.fetchone()
+    def show_query_error(self, error):
 
-        if not result:
-
-            create_table_query = """
-            CREATE TABLE customers (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                first_name VARCHAR(50) NOT NULL,
-                last_name VARCHAR(50) NOT NULL,
-                account_number VARCHAR(20) UNIQUE NOT NULL,
-                balance DECIMAL(10,2) DEFAULT 0.00
-            )
-            """
-            self.cursor.execute(create_table_query)
-            self.db.commit()
+        QMessageBox.warning(self, "Database Error", str(error))
 
     def init_ui(self):
 
@@ -90,6 +140,10 @@ class BankApp(QWidget):
         btn_withdraw.clicked.connect(self.show_withdraw_dialog)
         layout.addWidget(btn_withdraw)
 
+        btn_transfer = QPushButton('Transfer Amount', self)
+        btn_transfer.clicked.connect(self.show_transfer_dialog)
+        layout.addWidget(btn_transfer)
+
         btn_setup_database = QPushButton('Setup Database', self)
         btn_setup_database.clicked.connect(self.setup_database)
         layout.addWidget(btn_setup_database)
@@ -98,10 +152,22 @@ class BankApp(QWidget):
         btn_show_all_customers.clicked.connect(self.show_all_customers)
         layout.addWidget(btn_show_all_customers)
 
+        btn_bulk_import = QPushButton('Bulk Import', self)
+        btn_bulk_import.clicked.connect(self.show_bulk_import_dialog)
+        layout.addWidget(btn_bulk_import)
+
+        btn_reports = QPushButton('Reports', self)
+        btn_reports.clicked.connect(self.show_report_dialog)
+        layout.addWidget(btn_reports)
+
+        btn_diagnostics = QPushButton('Diagnostics', self)
+        btn_diagnostics.clicked.connect(self.show_diagnostics_dialog)
+        layout.addWidget(btn_diagnostics)
+
         self.setLayout(layout)
 
         self.setWindowTitle('Bank Database Management System')
-        self.setFixedSize(350, 400)  
+        self.setFixedSize(350, 520)  
         self.show()
 
     def show_add_customer_dialog(self):
@@ -128,15 +194,68 @@ class BankApp(QWidget):
         dialog = WithdrawDialog(self)
         dialog.exec_()
 
+    def show_transfer_dialog(self):
+        dialog = TransferDialog(self)
+        dialog.exec_()
+
     def show_all_customers(self):
         dialog = ShowAllCustomersDialog(self)
         dialog.exec_()
 
+    def show_bulk_import_dialog(self):
+        dialog = BulkImportDialog(self)
+        dialog.exec_()
+
+    def show_report_dialog(self):
+        dialog = ReportDialog(self)
+        dialog.exec_()
+
+    def show_diagnostics_dialog(self):
+        dialog = DiagnosticsDialog(self)
+        dialog.exec_()
+
     def closeEvent(self, event):
 
-        self.db.close()
+        # Closing the service writes out whatever audit entries are still queued.
+        self.executor.shutdown()
+        self.service.close()
+
+class QueryDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.service = parent.service
+        self.executor = parent.executor
+        self.pending_query = None
+
+    def run_query(self, fn, *args, on_result, writes=False):
+        if self.pending_query is not None:
+            return
+
+        self.setCursor(Qt.BusyCursor)
+        self.pending_query = self.executor.submit(fn, *args, on_result=on_result, on_error=self.query_failed,
+                                                  writes=writes)
+        self.pending_query.closed.connect(self.query_finished)
+
+    def query_finished(self):
+        self.pending_query = None
+        self.unsetCursor()
+
+    def query_failed(self, error):
+        if isinstance(error, BankError):
+            QMessageBox.warning(self, 'Error', str(error))
+        elif isinstance(error, OutcomeUnknown):
+            QMessageBox.warning(self, 'Outcome Unknown', str(error))
+        else:
+            QMessageBox.warning(self, 'Database Error', str(error))
+
+    def done(self, result):
+        if self.pending_query is not None:
+            self.pending_query.cancel()
+
+        super().done(result)
 
-class AddCustomerDialog(QDialog):
+class AddCustomerDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -173,31 +292,14 @@ class AddCustomerDialog(QDialog):
             QMessageBox.warning(self, 'Error', 'Please fill in all fields.')
             return
 
-        try:
-            balance = Decimal(balance_text)
-        except ValueError:
-            QMessageBox.warning(self, 'Error', 'Invalid balance. Please enter a valid decimal value.')
-            return
-
-        check_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(check_query, data)
-        result = parent.cursor.fetchone()
+        self.run_query(self.service.add_customer, first_name, last_name, account_number, balance_text,
+                       on_result=self.customerAdded, writes=True)
 
-        if result:
-            QMessageBox.warning(self, 'Error', 'Account number already exists. Please enter a different account number.')
-        else:
-            insert_query = "INSERT INTO customers (first_name, last_name, account_number, balance) VALUES (%s, %s, %s, %s)"
-            data = (first_name, last_name, account_number, balance)
-            parent.cursor.execute(insert_query, data)
-
-            parent.db.commit()
+    def customerAdded(self, customer):
+        QMessageBox.information(self, 'Success', 'Customer added successfully!')
+        self.accept()
 
-            QMessageBox.information(self, 'Success', 'Customer added successfully!')
-            self.accept()
-
-class ViewCustomerDialog(QDialog):
+class ViewCustomerDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -223,22 +325,26 @@ class ViewCustomerDialog(QDialog):
 
         account_number = self.account_number_input.text()
 
-        select_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(select_query, data)
+        self.run_query(self.service.get_customer, account_number, on_result=self.showDetails)
 
-        result = parent.cursor.fetchone()
+    def showDetails(self, customer):
 
-        if result:
-            QMessageBox.information(self, 'Customer Details',
-                                    f'First Name: {result[1]}\nLast Name: {result[2]}\nAccount Number: {result[3]}\nBalance: Rs.{result[4]:.2f}')
-        else:
-            QMessageBox.warning(self, 'Customer Not Found', 'Customer not found.')
+        QMessageBox.information(self, 'Customer Details',
+                                f"First Name: {customer['first_name']}\nLast Name: {customer['last_name']}\n"
+                                f"Account Number: {customer['account_number']}\nBalance: Rs.{customer['balance']:.2f}")
 
         self.accept()  
 
-class UpdateCustomerDialog(QDialog):
+    def query_failed(self, error):
+
+        if isinstance(error, AccountNotFound):
+            QMessageBox.warning(self, 'Customer Not Found', 'Customer not found.')
+        else:
+            super().query_failed(error)
+
+        self.accept()
+
+class UpdateCustomerDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -265,55 +371,59 @@ class UpdateCustomerDialog(QDialog):
         cancel_button.clicked.connect(self.reject)
         update_details_button.clicked.connect(self.acceptAndUpdate)
 
-    def acceptAndUpdate(self):
+        # The customer as loaded when the account number was entered; the update is checked
+        # against it so that changes made meanwhile by another teller are not overwritten.
+        self.loaded_customer = None
+        self.account_number_input.editingFinished.connect(self.loadCustomer)
+
+    def loadCustomer(self):
         account_number = self.account_number_input.text()
-        new_first_name = self.new_first_name_input.text()
-        new_last_name = self.new_last_name_input.text()
-        new_balance_input_text = self.new_balance_input.text()
 
-        check_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(check_query, data)
-        result = parent.cursor.fetchone()
+        if self.loaded_customer is not None and self.loaded_customer['account_number'] == account_number:
+            return
 
-        if not result:
-            QMessageBox.warning(self, 'Error', 'Customer not found.')
-        elif not any([new_first_name, new_last_name, new_balance_input_text]):
-            QMessageBox.warning(self, 'Error', 'Please fill in at least one field.')
-        else:
-            update_fields = []
+        self.loaded_customer = None
+        self.show_current_values(None)
 
-            if not new_first_name:
-                update_fields.append(("first_name", result[1]))  
-            else:
-                update_fields.append(("first_name", new_first_name))
+        if account_number:
+            self.executor.submit(self.service.current_customer, account_number, on_result=self.customerLoaded)
 
-            if not new_last_name:
-                update_fields.append(("last_name", result[2]))  
-            else:
-                update_fields.append(("last_name", new_last_name))
+    def customerLoaded(self, customer):
+        if customer['account_number'] == self.account_number_input.text():
+            self.loaded_customer = customer
+            self.show_current_values(customer)
 
-            if not new_balance_input_text:
-                update_fields.append(("balance", result[4]))  
-            else:
-                new_balance = Decimal(new_balance_input_text)
-                update_fields.append(("balance", new_balance))
+    def show_current_values(self, customer):
+        for field, line_edit in (('first_name', self.new_first_name_input), ('last_name', self.new_last_name_input),
+                                 ('balance', self.new_balance_input)):
+            line_edit.setPlaceholderText(f"Currently: {customer[field]}" if customer is not None else '')
 
-            set_query = ", ".join([f"{field} = %s" for field, _ in update_fields])
+    def acceptAndUpdate(self):
+        account_number = self.account_number_input.text()
+        new_first_name = self.new_first_name_input.text()
+        new_last_name = self.new_last_name_input.text()
+        new_balance_input_text = self.new_balance_input.text()
 
-            update_query = f"UPDATE customers SET {set_query} WHERE account_number = %s"
+        expected = self.loaded_customer
+        if expected is not None and expected['account_number'] != account_number:
+            expected = None
 
-            update_values = [value for _, value in update_fields]
-            update_values.append(account_number)
+        self.run_query(self.service.update_customer, account_number, new_first_name, new_last_name,
+                       new_balance_input_text, expected, on_result=self.customerUpdated, writes=True)
 
-            parent.cursor.execute(update_query, update_values)
-            parent.db.commit()
+    def customerUpdated(self, customer):
+        QMessageBox.information(self, 'Success', 'Customer details updated successfully!')
+        self.accept()
 
-            QMessageBox.information(self, 'Success', 'Customer details updated successfully!')
-            self.accept()
+    def query_failed(self, error):
+        super().query_failed(error)
 
-class DeleteCustomerDialog(QDialog):
+        # Show what the other teller saved and check the next attempt against it.
+        if isinstance(error, UpdateConflict) and error.current is not None:
+            self.loaded_customer = error.current
+            self.show_current_values(error.current)
+
+class DeleteCustomerDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -339,33 +449,27 @@ class DeleteCustomerDialog(QDialog):
 
         account_number = self.account_number_input.text()
 
-        check_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(check_query, data)
-        result = parent.cursor.fetchone()
+        self.run_query(self.service.get_customer, account_number, on_result=self.confirmDelete)
 
-        if not result:
-            QMessageBox.warning(self, 'Error', 'Customer not found.')
-        else:
+    def confirmDelete(self, customer):
 
-            confirm = QMessageBox.question(self, 'Confirmation',
-                                           f"Do you really want to delete the customer {result[1]} {result[2]}?",
-                                           QMessageBox.Yes | QMessageBox.No)
+        confirm = QMessageBox.question(self, 'Confirmation',
+                                       f"Do you really want to delete the customer {customer['first_name']} {customer['last_name']}?",
+                                       QMessageBox.Yes | QMessageBox.No)
 
-            if confirm == QMessageBox.Yes:
+        if confirm == QMessageBox.Yes:
 
-                delete_query = "DELETE FROM customers WHERE account_number = %s"
-                parent.cursor.execute(delete_query, data)
+            self.run_query(self.service.delete_customer, customer['account_number'], on_result=self.customerDeleted,
+                           writes=True)
+        else:
+            QMessageBox.information(self, 'Deletion Canceled', 'Deletion canceled.')
 
-                parent.db.commit()
+    def customerDeleted(self, _):
 
-                QMessageBox.information(self, 'Success', 'Customer deleted successfully!')
-                self.accept()
-            else:
-                QMessageBox.information(self, 'Deletion Canceled', 'Deletion canceled.')
+        QMessageBox.information(self, 'Success', 'Customer deleted successfully!')
+        self.accept()
 
-class DepositDialog(QDialog):
+class DepositDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -391,37 +495,18 @@ class DepositDialog(QDialog):
     def acceptAndDeposit(self):
 
         account_number = self.account_number_input.text()
+        self.deposit_amount = self.deposit_amount_input.text()
 
-        check_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(check_query, data)
-        result = parent.cursor.fetchone()
-
-        if not result:
-            QMessageBox.warning(self, 'Error', 'Customer not found.')
-        else:
+        self.run_query(self.service.deposit, account_number, self.deposit_amount, on_result=self.depositCompleted,
+                       writes=True)
 
-            deposit_amount = Decimal(self.deposit_amount_input.text()) if self.deposit_amount_input.text() else None
+    def depositCompleted(self, new_balance):
 
-            if deposit_amount:
-                pass
-            else:
-                QMessageBox.warning(self, 'Error', 'Please enter an amount.')
-                return
+        QMessageBox.information(self, 'Success', f"Deposit of Rs.{Decimal(self.deposit_amount):.2f} successful. "
+                                                f"New balance: Rs.{new_balance:.2f}")
+        self.accept()
 
-            update_query = "UPDATE customers SET balance = balance + %s WHERE account_number = %s"
-            data = (deposit_amount, account_number)
-            parent.cursor.execute(update_query, data)
-
-            parent.db.commit()
-
-            new_balance = result[4] + deposit_amount if deposit_amount is not None else result[4]
-            QMessageBox.information(self, 'Success', f"Deposit of Rs.{deposit_amount:.2f} successful. "
-                                                    f"New balance: Rs.{new_balance:.2f}")
-            self.accept()
-
-class WithdrawDialog(QDialog):
+class WithdrawDialog(QueryDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -447,40 +532,497 @@ class WithdrawDialog(QDialog):
     def acceptAndWithdraw(self):
 
         account_number = self.account_number_input.text()
+        self.withdrawal_amount = self.withdrawal_amount_input.text()
 
-        check_query = "SELECT * FROM customers WHERE account_number = %s"
-        data = (account_number,)
-        parent = self.parent()
-        parent.cursor.execute(check_query, data)
-        result = parent.cursor.fetchone()
+        self.run_query(self.service.withdraw, account_number, self.withdrawal_amount,
+                       on_result=self.withdrawalCompleted, writes=True)
+
+    def withdrawalCompleted(self, new_balance):
+
+        QMessageBox.information(self, 'Success', f"Withdrawal of Rs.{Decimal(self.withdrawal_amount):.2f} successful. "
+                                                f"New balance: Rs.{new_balance:.2f}")
+        self.accept()
+
+class TransferDialog(QueryDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Transfer Money')
+
+        self.from_account_input = QLineEdit(self)
+        self.to_account_input = QLineEdit(self)
+        self.transfer_amount_input = QLineEdit(self)
+
+        layout = QFormLayout(self)
+        layout.addRow('From Account:', self.from_account_input)
+        layout.addRow('To Account:', self.to_account_input)
+        layout.addRow('Transfer Amount:', self.transfer_amount_input)
 
-        if not result:
-            QMessageBox.warning(self, 'Error', 'Customer not found.')
+        buttons_layout = QHBoxLayout()
+        cancel_button = QPushButton('Cancel')
+        transfer_button = QPushButton('Transfer')
+        buttons_layout.addWidget(cancel_button)
+        buttons_layout.addWidget(transfer_button)
+        layout.addRow(buttons_layout)
+
+        cancel_button.clicked.connect(self.reject)
+        transfer_button.clicked.connect(self.acceptAndTransfer)
+
+    def acceptAndTransfer(self):
+
+        self.run_query(self.service.transfer, self.from_account_input.text(), self.to_account_input.text(),
+                       self.transfer_amount_input.text(), on_result=self.transferCompleted, writes=True)
+
+    def transferCompleted(self, transfer):
+
+        QMessageBox.information(self, 'Success', f"Transfer of Rs.{transfer['amount']:.2f} successful.\n"
+                                                f"New balance of {transfer['from_account']}: "
+                                                f"Rs.{transfer['from_balance']:.2f}\n"
+                                                f"New balance of {transfer['to_account']}: "
+                                                f"Rs.{transfer['to_balance']:.2f}")
+        self.accept()
+
+class CustomerSearch(QObject):
+    results_ready = pyqtSignal(str, list, object)
+    search_failed = pyqtSignal(str)
+
+    def __init__(self, db, page_size, fulltext=False, delay=250, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.page_size = page_size
+        self.fulltext = fulltext
+        self.text = ''
+        self.order = ()
+
+        self.generation = 0
+        self.pending = None
+        self.active_connection_id = None
+        self.closed = False
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.submit)
+
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def search(self, text, order=()):
+        self.text = text
+        self.order = order
+        self.timer.start()
+
+    def submit(self):
+        with self.lock:
+            self.generation += 1
+            self.pending = (self.generation, self.text, self.order)
+            superseded_connection_id = self.active_connection_id
+            self.wakeup.notify()
+
+        if superseded_connection_id is not None:
+            self.cancel(superseded_connection_id)
+
+    def cancel(self, connection_id):
+        # Sent from its own thread, since the KILL needs a new connection.
+        threading.Thread(target=self.kill, args=(connection_id,), daemon=True).start()
+
+    def kill(self, connection_id):
+        try:
+            self.db.kill_query(connection_id)
+        except db_errors():
+            pass
+
+    def close(self):
+        self.timer.stop()
+
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+
+    def run(self):
+        search_db = None
+
+        while True:
+            with self.lock:
+                while self.pending is None and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    break
+                generation, text, order = self.pending
+                self.pending = None
+
+            try:
+                if search_db is None or not search_db.is_connected():
+                    search_db = self.db.connect()
+
+                with self.lock:
+                    self.active_connection_id = search_db.connection_id
+
+                cursor = search_db.cursor()
+                select_query, data = customer_page_query(None, self.page_size, text, self.fulltext, order,
+                                                         self.db.balance_sort_key)
+                with self.db.metrics.measure('query', fingerprint(select_query)) as sample:
+                    cursor.execute(select_query, data)
+                    rows = cursor.fetchall()
+                    sample.rows = len(rows)
+                cursor.close()
+            except db_errors() as e:
+                with self.lock:
+                    self.active_connection_id = None
+                    # A late KILL QUERY can hit the newest search; run it again in that case.
+                    if self.db.query_interrupted(e):
+                        if generation == self.generation and self.pending is None:
+                            self.pending = (generation, text, order)
+                        continue
+                    current = generation == self.generation
+                if current:
+                    self.search_failed.emit(str(e))
+                continue
+
+            with self.lock:
+                self.active_connection_id = None
+                current = generation == self.generation
+
+            if current:
+                self.results_ready.emit(text, rows, order)
+
+        if search_db is not None:
+            search_db.close()
+
+class CustomerTableModel(QAbstractTableModel):
+    columns = EXPORT_COLUMNS
+
+    load_failed = pyqtSignal(object)
+
+    def __init__(self, customers, executor, page_size=200, max_pages=500, prefetch_pages=1, fulltext=False, parent=None):
+        super().__init__(parent)
+
+        self.customers = customers
+        self.executor = executor
+        self.generation = 0
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.prefetch_pages = prefetch_pages
+        self.fulltext = fulltext
+        self.search_text = ''
+
+        # (column, descending) pairs the database sorts by; empty for id order. Rows are keyed by
+        # their values of sort_columns(order), which always end with the id.
+        self.order = ()
+        self.key_columns = [SORT_COLUMNS.index(column) for column, _ in sort_columns(self.order)]
+
+        self.reset_pages()
+
+    def reset_pages(self):
+        # page_starts[n] is the keyset boundary (key of the last row of page n - 1) for every page
+        # discovered so far, plus the next undiscovered page while the table is not exhausted.
+        self.pages = OrderedDict()
+        self.page_starts = [None]
+        self.row_count = 0
+        self.last_key = None
+        self.exhausted = False
+        self.loading_pages = set()
+        self.fetching = False
+
+        # Results of queries issued before a reset are recognised by their generation and dropped.
+        self.generation += 1
+
+    def set_search(self, text, first_page=None, order=None):
+        # A first page queried before the order last changed is dropped and loaded again.
+        if order is not None and order != self.order:
+            first_page = None
+
+        self.beginResetModel()
+        self.search_text = text
+        self.reset_pages()
+
+        if first_page is not None:
+            self.pages[0] = CustomerSnapshot(first_page)
+            self.row_count = len(first_page)
+
+            if first_page:
+                self.last_key = self.row_key(first_page[-1])
+
+            if len(first_page) < self.page_size:
+                self.exhausted = True
+            else:
+                self.page_starts.append(self.row_key(first_page[-1]))
+
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section]
+        return section + 1
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Sorting is done by the database, so that the first page of any order over the whole
+        # table comes straight off an index. A name sort orders by the other name next.
+        descending = order == Qt.DescendingOrder
+        sort_order = ((SORT_COLUMNS[column], descending),)
+
+        if SORT_COLUMNS[column] == 'first_name':
+            sort_order += (('last_name', descending),)
+        elif SORT_COLUMNS[column] == 'last_name':
+            sort_order += (('first_name', descending),)
+        elif sort_order == (('id', False),):
+            sort_order = ()
+
+        if sort_order == self.order:
+            return
+
+        self.order = sort_order
+        self.key_columns = [SORT_COLUMNS.index(name) for name, _ in sort_columns(sort_order)]
+        self.reload()
+
+    def row_key(self, row):
+        return tuple(row[index] for index in self.key_columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        page_number, offset = divmod(index.row(), self.page_size)
+        page = self.pages.get(page_number)
+
+        if page is None:
+            self.load_page(page_number)
+            return None
+
+        self.pages.move_to_end(page_number)
+        if offset < len(page):
+            return page.display(offset, index.column())
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+
+        self.fetch_last_page()
+
+    def fetch_last_page(self):
+        if self.fetching:
+            return
+
+        self.fetching = True
+        page_number = len(self.page_starts) - 1
+        generation = self.generation
+
+        self.executor.submit(self.query_rows, self.page_starts[page_number], self.page_size,
+                             on_result=lambda rows: self.more_loaded(generation, page_number, rows),
+                             on_error=lambda error: self.query_failed(generation, error))
+
+    def more_loaded(self, generation, page_number, page):
+        if generation != self.generation:
+            return
+
+        self.fetching = False
+
+        # Rows of this page the model already shows; only non-zero when a partial last page is
+        # fetched again to pick up rows added after the table was exhausted.
+        known = self.row_count - page_number * self.page_size
+        if len(page) < known:
+            self.reload()
+            return
+
+        self.cache_pages(page_number, page, 1)
+
+        if page:
+            self.last_key = self.row_key(page[-1])
+
+        if len(page) < self.page_size:
+            self.exhausted = True
         else:
+            self.exhausted = False
+            self.page_starts.append(self.row_key(page[-1]))
+
+        if known:
+            first_row = page_number * self.page_size
+            self.dataChanged.emit(self.index(first_row, 0), self.index(first_row + known - 1, len(self.columns) - 1))
+
+        if len(page) > known:
+            self.beginInsertRows(QModelIndex(), self.row_count, self.row_count + len(page) - known - 1)
+            self.row_count += len(page) - known
+            self.endInsertRows()
+
+    def load_page(self, page_number):
+        if page_number in self.loading_pages:
+            return
 
-            withdrawal_amount = Decimal(self.withdrawal_amount_input.text()) if self.withdrawal_amount_input.text() else None
+        # Fetch the requested page together with the following prefetch margin in a single
+        # keyset query, then split the rows back into pages.
+        known_pages = len(self.page_starts) - 1 if not self.exhausted else len(self.page_starts)
+        window = max(1, min(1 + self.prefetch_pages, known_pages - page_number))
+        generation = self.generation
 
-            if withdrawal_amount:
-                pass
+        self.loading_pages.update(range(page_number, page_number + window))
+        self.executor.submit(self.query_rows, self.page_starts[page_number], self.page_size * window,
+                             on_result=lambda rows: self.page_loaded(generation, page_number, window, rows),
+                             on_error=lambda error: self.query_failed(generation, error))
+
+    def page_loaded(self, generation, page_number, window, rows):
+        if generation != self.generation:
+            return
+
+        self.loading_pages.difference_update(range(page_number, page_number + window))
+        self.cache_pages(page_number, rows, window)
+
+        first_row = page_number * self.page_size
+        last_row = min(self.row_count, first_row + self.page_size * window) - 1
+        if last_row >= first_row:
+            self.dataChanged.emit(self.index(first_row, 0), self.index(last_row, len(self.columns) - 1))
+
+    def cache_pages(self, page_number, rows, window):
+        for number in range(page_number, page_number + window):
+            start = (number - page_number) * self.page_size
+            self.pages[number] = CustomerSnapshot(rows[start:start + self.page_size])
+            self.pages.move_to_end(number)
+
+        self.pages.move_to_end(page_number)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+    def reload(self):
+        self.set_search(self.search_text)
+
+    def apply_changes(self, changes):
+        # changes maps customer id to its current row (None once deleted), see changes_since.
+        if changes is None:
+            self.reload()
+            return
+
+        if self.order:
+            self.apply_sorted_changes(changes)
+            return
+
+        appended = False
+        shown_ids = []
+        unseen = []
+
+        for customer_id, row in changes.items():
+            if self.last_key is None or (customer_id,) > self.last_key:
+                appended = appended or row is not None
+                continue
+
+            # Page n holds the rows with page_starts[n] < (id,) <= page_starts[n + 1].
+            page_number = bisect_left(self.page_starts, (customer_id,), 1) - 1
+            page = self.pages.get(page_number)
+            offset = page.index_of(customer_id) if page is not None else -1
+            shown = offset >= 0
+
+            if row is None:
+                # Removing a row shifts every later keyset boundary, so anything but a row known
+                # to be filtered out of a cached page means starting over.
+                if page is None or shown:
+                    self.reload()
+                    return
+            elif shown:
+                page.replace(offset, row)
+                changed_row = page_number * self.page_size + offset
+                self.dataChanged.emit(self.index(changed_row, 0), self.index(changed_row, len(self.columns) - 1))
+                shown_ids.append(customer_id)
             else:
-                QMessageBox.warning(self, 'Error', 'Please enter an amount.')
+                unseen.append(customer_id)
+
+        # Without a search every row up to last_key is shown; with one, an update can move a row
+        # into or out of the results, which only the database can tell.
+        if self.search_text and (shown_ids or unseen):
+            self.check_rows(shown_ids, unseen)
+
+        # New rows past the end are only fetched eagerly once the table is exhausted; until then
+        # fetchMore reaches them on its own.
+        if appended and self.exhausted:
+            self.fetch_last_page()
+
+    def apply_sorted_changes(self, changes):
+        # Where a row belongs in a sorted table can only be told by the database (name order
+        # follows its collation). Shown rows that keep their sort key are updated in place; a
+        # shown row that moves or goes away means starting over.
+        known_pages = len(self.page_starts) - 1 if not self.exhausted else len(self.page_starts)
+        all_cached = len(self.pages) == known_pages
+        updated = []
+        unseen = []
+
+        for customer_id, row in changes.items():
+            for page_number, page in self.pages.items():
+                offset = page.find(customer_id)
+                if offset >= 0:
+                    break
+            else:
+                # With every loaded page still cached, a row found in none of them was not shown.
+                if not all_cached:
+                    self.reload()
+                    return
+                if row is not None:
+                    unseen.append(customer_id)
+                continue
+
+            if row is None or self.row_key(row) != self.row_key(page.row(offset)):
+                self.reload()
                 return
 
-            if withdrawal_amount is not None and result[4] < withdrawal_amount:
-                QMessageBox.warning(self, 'Error', 'Insufficient balance. Withdrawal canceled.')
+            updated.append((page_number, page, offset, row))
 
-            else:
+        for page_number, page, offset, row in updated:
+            page.replace(offset, row)
+            changed_row = page_number * self.page_size + offset
+            self.dataChanged.emit(self.index(changed_row, 0), self.index(changed_row, len(self.columns) - 1))
 
-                update_query = "UPDATE customers SET balance = balance - %s WHERE account_number = %s"
-                data = (withdrawal_amount, account_number)
-                parent.cursor.execute(update_query, data)
+        # Rows that were not shown only matter if they now sort into the loaded part of the table;
+        # past its end, fetchMore reaches them on its own. Shown rows are checked against the search.
+        shown_ids = [page.ids[offset] for _, page, offset, _ in updated] if self.search_text else []
 
-                parent.db.commit()
+        if unseen and self.last_key is None:
+            if self.exhausted:
+                self.fetch_last_page()
+        elif unseen or shown_ids:
+            self.check_rows(shown_ids, unseen)
 
-                new_balance = result[4] - withdrawal_amount if withdrawal_amount is not None else result[4]
-                QMessageBox.information(self, 'Success', f"Withdrawal of Rs.{withdrawal_amount:.2f} successful. "
-                                                        f"New balance: Rs.{new_balance:.2f}")
-                self.accept()
+    def check_rows(self, shown_ids, unseen):
+        generation = self.generation
+        self.executor.submit(self.customers.matching_through, shown_ids + unseen, self.last_key, self.search_text,
+                             self.fulltext, self.order,
+                             on_result=lambda matching: self.rows_checked(generation, shown_ids, unseen, matching),
+                             on_error=lambda error: self.query_failed(generation, error))
+
+    def rows_checked(self, generation, shown_ids, unseen, matching):
+        if generation != self.generation:
+            return
+
+        # A shown row that left the results, or another row that joined them within the loaded
+        # range, shifts the rows after it.
+        left = any(customer_id not in matching for customer_id in shown_ids)
+        joined = any(customer_id in matching for customer_id in unseen)
+
+        if left or joined:
+            self.reload()
+        elif unseen and self.order and self.exhausted:
+            self.fetch_last_page()
+
+    def query_failed(self, generation, error):
+        if generation != self.generation:
+            return
+
+        self.fetching = False
+        self.loading_pages.clear()
+        self.load_failed.emit(error)
+
+    def query_rows(self, after, limit):
+        return self.customers.page(after, limit, self.search_text, self.fulltext, self.order)
 
 class ShowAllCustomersDialog(QDialog):
     def __init__(self, parent=None):
@@ -492,55 +1034,427 @@ class ShowAllCustomersDialog(QDialog):
         self.search_input.setPlaceholderText('Search...')
         self.search_input.textChanged.connect(self.filter_table)
 
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(['ID', 'First Name', 'Last Name', 'Account Number', 'Balance'])
+        self.executor = parent.executor
+        self.model = CustomerTableModel(parent.customers, self.executor, parent=self)
+        self.model.load_failed.connect(self.show_load_error)
+
+        self.search = CustomerSearch(parent.db, self.model.page_size, parent=self)
+        self.search.results_ready.connect(self.model.set_search)
+        self.search.search_failed.connect(self.show_search_error)
+
+        self.executor.submit(parent.customers.has_fulltext_search, on_result=self.enable_fulltext_search)
+
+        self.customers = parent.customers
+        self.change_id = None
+        self.polling = False
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(int(parent.refresh_interval * 1000))
+        self.refresh_timer.timeout.connect(self.poll_changes)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
         self.table.setMinimumSize(650, 400)
+        self.table.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
 
-        self.export_button = QPushButton('Export to Excel', self)
-        self.export_button.clicked.connect(self.export_to_excel)
+        self.export_button = QPushButton('Export Customers', self)
+        self.export_button.clicked.connect(self.export_customers)
+        self.export_thread = None
 
         layout = QVBoxLayout(self)
         layout.addWidget(self.search_input)
         layout.addWidget(self.table)
         layout.addWidget(self.export_button)
 
-        self.populate_table()
+        # The change log position is read before the first page, so nothing written in between is missed.
+        self.executor.submit(self.customers.latest_change_id, on_result=self.start_refresh,
+                             on_error=lambda error: self.populate_table())
 
     def filter_table(self):
-        search_text = self.search_input.text().lower()
+        self.search.search(self.search_input.text().strip(), self.model.order)
+
+    def enable_fulltext_search(self, fulltext):
+        self.model.fulltext = fulltext
+        self.search.fulltext = fulltext
 
-        for row in range(self.table.rowCount()):
-            visible = any(search_text in self.table.item(row, col).text().lower() for col in range(self.table.columnCount()))
-            self.table.setRowHidden(row, not visible)
+    def show_search_error(self, message):
+        QMessageBox.warning(self, 'Search Failed', message)
+
+    def show_load_error(self, error):
+        QMessageBox.warning(self, 'Database Error', str(error))
 
     def populate_table(self):
-        parent = self.parent()
+        self.model.set_search('')
+
+    def start_refresh(self, change_id):
+        self.change_id = change_id
+        self.populate_table()
 
-        parent.cursor.execute("SELECT * FROM customers")
-        results = parent.cursor.fetchall()
+        if self.refresh_timer.interval() > 0:
+            self.refresh_timer.start()
 
-        for row_num, row_data in enumerate(results):
-            self.table.insertRow(row_num)
-            for col_num, col_data in enumerate(row_data):
-                item = QTableWidgetItem(str(col_data))
-                self.table.setItem(row_num, col_num, item)
+    def poll_changes(self):
+        if self.polling:
+            return
+
+        self.polling = True
+        self.executor.submit(self.customers.changes_since, self.change_id, on_result=self.changes_loaded,
+                             on_error=self.poll_failed)
+
+    def changes_loaded(self, result):
+        self.polling = False
+        self.change_id, changes = result
+        self.model.apply_changes(changes)
+
+    def poll_failed(self, error):
+        # The next poll simply retries from the same change id.
+        self.polling = False
+
+    def done(self, result):
+        self.refresh_timer.stop()
+        self.search.close()
+
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.export_thread.cancel()
+            self.export_thread.wait()
+
+        super().done(result)
+
+    def export_customers(self):
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "Export Customers", "", EXPORT_FILTERS)
+
+        if not file_path:
+            return
+
+        if not os.path.splitext(file_path)[1]:
+            file_path += re.search(r'\*(\.\w+)', selected_filter).group(1)
 
-    def export_to_excel(self):
         parent = self.parent()
 
-        parent.cursor.execute("SELECT * FROM customers")
-        results = parent.cursor.fetchall()
+        self.progress_dialog = QProgressDialog('Exporting customers...', 'Cancel', 0, 0, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setAutoReset(False)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setMinimumDuration(0)
+
+        self.export_thread = ExportThread(parent.db, file_path, self)
+        self.export_thread.estimated.connect(self.progress_dialog.setMaximum)
+        self.export_thread.progress.connect(self.update_export_progress)
+        self.export_thread.completed.connect(self.export_completed)
+        self.export_thread.canceled.connect(self.export_canceled)
+        self.export_thread.failed.connect(self.export_failed)
+        self.progress_dialog.canceled.connect(self.export_thread.cancel)
+
+        self.export_button.setEnabled(False)
+        self.export_thread.start()
+
+    def update_export_progress(self, exported):
+        # The row estimate comes from table statistics; switch to a busy indicator once it is exceeded.
+        if exported > self.progress_dialog.maximum() > 0:
+            self.progress_dialog.setMaximum(0)
+        else:
+            self.progress_dialog.setValue(exported)
+
+    def export_completed(self, exported):
+        self.progress_dialog.close()
+        self.export_button.setEnabled(True)
+        QMessageBox.information(self, 'Export Successful',
+                                f'{exported} customers exported to {self.export_thread.file_path}')
+
+    def export_canceled(self):
+        self.progress_dialog.close()
+        self.export_button.setEnabled(True)
+
+    def export_failed(self, message):
+        self.progress_dialog.close()
+        self.export_button.setEnabled(True)
+        QMessageBox.warning(self, 'Export Failed', message)
+
+class ExportThread(QThread):
+    estimated = pyqtSignal(int)
+    progress = pyqtSignal(int)
+    completed = pyqtSignal(int)
+    canceled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, db, file_path, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.file_path = file_path
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            export_db = self.db.connect()
+            try:
+                self.estimated.emit(self.db.estimate_row_count(export_db))
+                with self.db.metrics.measure('operation', 'export_customers') as sample:
+                    exported = export_customers(export_db, self.file_path, progress=self.progress.emit,
+                                                cancelled=lambda: self.cancelled)
+                    sample.rows = exported
+            finally:
+                export_db.close()
+        except ExportCancelled:
+            self.canceled.emit()
+        except (*db_errors(), OSError, ValueError, ImportError) as e:
+            self.failed.emit(str(e))
+        else:
+            self.completed.emit(exported)
+
+class BulkImportDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Bulk Import')
+
+        self.bulk_thread = None
+
+        import_customers_button = QPushButton('Import Customers...', self)
+        import_customers_button.clicked.connect(self.import_customers)
+
+        post_transactions_button = QPushButton('Post Deposits/Withdrawals...', self)
+        post_transactions_button.clicked.connect(self.post_transactions)
 
-        df = DataFrame(results, columns=['ID', 'First Name', 'Last Name', 'Account Number', 'Balance'])
+        post_transfers_button = QPushButton('Post Transfers...', self)
+        post_transfers_button.clicked.connect(self.post_transfers)
+
+        close_button = QPushButton('Close', self)
+        close_button.clicked.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(import_customers_button)
+        layout.addWidget(post_transactions_button)
+        layout.addWidget(post_transfers_button)
+        layout.addWidget(close_button)
+
+    def import_customers(self):
+        self.start_bulk_operation(import_customers, 'Import Customers', 'Imported')
+
+    def post_transactions(self):
+        self.start_bulk_operation(post_transactions, 'Post Deposits/Withdrawals', 'Posted')
+
+    def post_transfers(self):
+        self.start_bulk_operation(post_transfers, 'Post Transfers', 'Transferred')
+
+    def start_bulk_operation(self, operation, title, verb):
+        if self.bulk_thread is not None and self.bulk_thread.isRunning():
+            return
 
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Excel File", "", "Excel Files (*.xlsx);;All Files (*)")
+        file_path, _ = QFileDialog.getOpenFileName(self, title, "", "Data Files (*.csv *.xlsx);;All Files (*)")
 
-        if file_path:
-            df.to_excel(file_path, index=False)
-            QMessageBox.information(self, 'Export Successful', f'Data exported to {file_path}')
+        if not file_path:
+            return
+
+        self.verb = verb
+        self.progress_dialog = QProgressDialog(f'{title}...', 'Cancel', 0, 0, self)
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setAutoReset(False)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setMinimumDuration(0)
+
+        self.bulk_thread = BulkThread(operation, self.parent().service, file_path, self)
+        self.bulk_thread.progress.connect(self.update_bulk_progress)
+        self.bulk_thread.completed.connect(self.bulk_completed)
+        self.bulk_thread.failed.connect(self.bulk_failed)
+        self.progress_dialog.canceled.connect(self.bulk_thread.cancel)
+
+        self.bulk_thread.start()
+
+    def update_bulk_progress(self, processed):
+        self.progress_dialog.setLabelText(f'{processed:,} rows processed...')
+
+    def bulk_completed(self, result):
+        self.progress_dialog.close()
+        QMessageBox.information(self, 'Bulk Import', result.summary(self.verb))
+
+    def bulk_failed(self, message):
+        self.progress_dialog.close()
+        QMessageBox.warning(self, 'Bulk Import Failed', message)
+
+    def done(self, result):
+        if self.bulk_thread is not None and self.bulk_thread.isRunning():
+            self.bulk_thread.cancel()
+            self.bulk_thread.wait()
+
+        super().done(result)
+
+class BulkThread(QThread):
+    progress = pyqtSignal(int)
+    completed = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, operation, service, file_path, parent=None):
+        super().__init__(parent)
+
+        self.operation = operation
+        self.service = service
+        self.customers = service.customers
+        self.file_path = file_path
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            with self.customers.db.metrics.measure('operation', self.operation.__name__) as sample:
+                result = self.operation(self.customers, self.file_path,
+                                        rejects_path=default_rejects_path(self.file_path),
+                                        progress=self.progress.emit, cancelled=lambda: self.cancelled,
+                                        record=self.service.record)
+                sample.rows = result.processed
+        except (*db_errors(), OSError, ValueError, ImportError) as e:
+            self.failed.emit(str(e))
+        else:
+            self.completed.emit(result)
+
+def create_table(columns, parent):
+    table = QTableWidget(0, len(columns), parent)
+    table.setHorizontalHeaderLabels([title for title, _ in columns])
+    table.setEditTriggers(QTableWidget.NoEditTriggers)
+    table.verticalHeader().setVisible(False)
+    return table
+
+def fill_table(table, columns, entries):
+    table.setRowCount(len(entries))
+
+    for row, entry in enumerate(entries):
+        for column, (_, key) in enumerate(columns):
+            value = entry[key]
+            text = f"{value:.1f}" if isinstance(value, float) else '' if value is None else str(value)
+            table.setItem(row, column, QTableWidgetItem(text))
+
+class ReportDialog(QueryDialog):
+    band_columns = (('Balance Band', 'band'), ('Accounts', 'accounts'), ('Total', 'total'))
+    top_columns = (('Account Number', 'account_number'), ('First Name', 'first_name'), ('Last Name', 'last_name'),
+                   ('Balance', 'balance'))
+    daily_columns = (('Date', 'date'), ('Entries', 'entries'), ('Inflow', 'inflow'), ('Outflow', 'outflow'),
+                     ('Net', 'net'))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Reports')
+
+        self.summary_label = QLabel(self)
+        self.band_table = create_table(self.band_columns, self)
+        self.top_table = create_table(self.top_columns, self)
+        self.daily_table = create_table(self.daily_columns, self)
+
+        buttons_layout = QHBoxLayout()
+        refresh_button = QPushButton('Refresh')
+        close_button = QPushButton('Close')
+        buttons_layout.addWidget(refresh_button)
+        buttons_layout.addWidget(close_button)
+
+        refresh_button.clicked.connect(self.refresh)
+        close_button.clicked.connect(self.reject)
+
+        tables_layout = QHBoxLayout()
+        for title, table in (('Balance distribution:', self.band_table), ('Largest accounts:', self.top_table),
+                             ('Daily flows, last 30 days:', self.daily_table)):
+            column_layout = QVBoxLayout()
+            column_layout.addWidget(QLabel(title, self))
+            column_layout.addWidget(table)
+            tables_layout.addLayout(column_layout)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_label)
+        layout.addLayout(tables_layout)
+        layout.addLayout(buttons_layout)
+
+        self.resize(1100, 500)
+        self.refresh()
+
+    def refresh(self):
+        self.run_query(self.service.report, 10, 30, on_result=self.show_report)
+
+    def show_report(self, report):
+        self.summary_label.setText(f"Accounts: {report['accounts']:,}    Total balance: {report['total_balance']:,}    "
+                                   f"Average balance: {report['average_balance']:,}    "
+                                   f"Total deposits: {report['total_deposits']:,}    "
+                                   f"Total withdrawals: {report['total_withdrawals']:,}")
+        fill_table(self.band_table, self.band_columns, report['balance_bands'])
+        fill_table(self.top_table, self.top_columns, report['top_accounts'])
+        fill_table(self.daily_table, self.daily_columns, report['daily_flows'])
+
+class DiagnosticsDialog(QDialog):
+    series_columns = (('Kind', 'kind'), ('Query / Operation', 'name'), ('Count', 'count'), ('Errors', 'errors'),
+                      ('Slow', 'slow'), ('Rows', 'rows'), ('Mean ms', 'mean_ms'), ('p50 ms', 'p50_ms'),
+                      ('p95 ms', 'p95_ms'), ('p99 ms', 'p99_ms'), ('Max ms', 'max_ms'), ('Total ms', 'total_ms'))
+    slow_columns = (('Time', 'time'), ('Kind', 'kind'), ('Query / Operation', 'name'), ('ms', 'ms'), ('Rows', 'rows'))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.setWindowTitle('Diagnostics')
+
+        self.metrics = parent.db.metrics
+
+        self.summary_label = QLabel(self)
+        self.series_table = create_table(self.series_columns, self)
+        self.slow_table = create_table(self.slow_columns, self)
+
+        buttons_layout = QHBoxLayout()
+        reset_button = QPushButton('Reset')
+        export_button = QPushButton('Export...')
+        close_button = QPushButton('Close')
+        buttons_layout.addWidget(reset_button)
+        buttons_layout.addWidget(export_button)
+        buttons_layout.addWidget(close_button)
+
+        reset_button.clicked.connect(self.reset_metrics)
+        export_button.clicked.connect(self.export_metrics)
+        close_button.clicked.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.series_table, 3)
+        layout.addWidget(QLabel('Slow queries and operations (newest first):', self))
+        layout.addWidget(self.slow_table, 1)
+        layout.addLayout(buttons_layout)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+        self.resize(1000, 600)
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+
+        self.summary_label.setText(f"Collected since {snapshot['since']}. "
+                                   f"Slow threshold: {snapshot['slow_threshold_ms']:g} ms.")
+        fill_table(self.series_table, self.series_columns, snapshot['series'])
+        fill_table(self.slow_table, self.slow_columns, snapshot['slow'][::-1])
+
+    def reset_metrics(self):
+        self.metrics.reset()
+        self.refresh()
+
+    def export_metrics(self):
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "Export Metrics", "",
+                                                                 "JSON Files (*.json);;Prometheus Text Files (*.prom)")
+
+        if not file_path:
+            return
+
+        if not os.path.splitext(file_path)[1]:
+            file_path += re.search(r'\*(\.\w+)', selected_filter).group(1)
+
+        try:
+            self.metrics.write(file_path)
+        except OSError as e:
+            QMessageBox.warning(self, 'Export Failed', str(e))
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
     app = QApplication(sys.argv)
     bank_app = BankApp()
     sys.exit(app.exec_())
@@ -0,0 +1,188 @@
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from database import AccountNotFound, BankError, InsufficientFunds, UpdateConflict, db_errors
+from service import json_default
+
+MAX_PAGE_SIZE = 1000
+
+logger = logging.getLogger('bankdb.api')
+
+# The paths route() serves, with account numbers folded to <account>. Anything else is timed as
+# UNMATCHED_ROUTE, so that stray requests cannot add metric series without bound.
+ROUTES = {'/stats', '/report', '/transfers', '/changes', '/customers', '/customers/<account>',
+          '/customers/<account>/deposit', '/customers/<account>/withdraw'}
+UNMATCHED_ROUTE = '<unmatched>'
+
+class BankRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps client connections open between requests, which matters far more for
+    # request rate than anything else in this handler.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+
+        if method == 'GET' and parts == ['metrics']:
+            self.send_body(HTTPStatus.OK, self.server.service.db.metrics.prometheus().encode('utf-8'),
+                           'text/plain; version=0.0.4')
+            return
+
+        # Account numbers are folded out of the path so that requests are timed per route.
+        route = '/'.join(['', *parts[:1], *['<account>'] * (len(parts) > 1), *parts[2:]])
+        if route not in ROUTES:
+            route = UNMATCHED_ROUTE
+
+        try:
+            body = self.read_json()
+            with self.server.service.db.metrics.measure('http', f"{method} {route}"):
+                status, payload = self.route(method, parts, parse_qs(url.query), body)
+        except AccountNotFound as e:
+            status, payload = HTTPStatus.NOT_FOUND, {'error': str(e)}
+        except InsufficientFunds as e:
+            status, payload = HTTPStatus.CONFLICT, {'error': str(e)}
+        except UpdateConflict as e:
+            status, payload = HTTPStatus.CONFLICT, {'error': str(e), 'current': e.current}
+        except (BankError, ValueError, TypeError) as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except db_errors() as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'error': f"Database error: {e}"}
+
+        self.send_json(status, payload)
+
+    def route(self, method, parts, query, body):
+        service = self.server.service
+
+        if parts == ['stats'] and method == 'GET':
+            return HTTPStatus.OK, {'account_cache': service.cache_stats(), 'metrics': service.metrics_snapshot()}
+
+        if parts == ['report'] and method == 'GET':
+            top = min(int(query.get('top', ['10'])[0]), MAX_PAGE_SIZE)
+            return HTTPStatus.OK, service.report(top, int(query.get('days', ['30'])[0]))
+
+        if parts == ['transfers'] and method == 'POST':
+            if 'transfers' in body:
+                return HTTPStatus.OK, service.transfer_batch(body['transfers'])
+            return HTTPStatus.OK, service.transfer(body.get('from_account'), body.get('to_account'), body.get('amount'))
+
+        if parts == ['changes'] and method == 'GET':
+            after = int(query.get('after', ['0'])[0])
+            limit = min(int(query.get('limit', ['1000'])[0]), MAX_PAGE_SIZE)
+            return HTTPStatus.OK, service.customer_changes(after, limit)
+
+        if not parts or parts[0] != 'customers':
+            return HTTPStatus.NOT_FOUND, {'error': 'Not found.'}
+
+        if len(parts) == 1:
+            if method == 'GET':
+                after_id = int(query['after_id'][0]) if 'after_id' in query else None
+                limit = min(int(query.get('limit', ['100'])[0]), MAX_PAGE_SIZE)
+                search = query.get('search', [''])[0]
+                sort = query.get('sort', [''])[0]
+                return HTTPStatus.OK, {'customers': service.list_customers(after_id, limit, search, sort)}
+            if method == 'POST':
+                customer = service.add_customer(body.get('first_name'), body.get('last_name'),
+                                                body.get('account_number'), body.get('balance'))
+                return HTTPStatus.CREATED, customer
+
+        elif len(parts) == 2:
+            account_number = parts[1]
+            if method == 'GET':
+                return HTTPStatus.OK, service.get_customer(account_number)
+            if method == 'PATCH':
+                # Clients that send back the version they read get their update refused with 409
+                # if someone else has written the customer since.
+                expected = {'version': body['version']} if body.get('version') is not None else None
+                customer = service.update_customer(account_number, body.get('first_name'), body.get('last_name'),
+                                                   body.get('balance'), expected)
+                return HTTPStatus.OK, customer
+            if method == 'DELETE':
+                service.delete_customer(account_number)
+                return HTTPStatus.OK, {'deleted': account_number}
+
+        elif len(parts) == 3 and parts[2] in ('deposit', 'withdraw'):
+            account_number = parts[1]
+            if method == 'POST':
+                operation = service.deposit if parts[2] == 'deposit' else service.withdraw
+                balance = operation(account_number, body.get('amount'))
+                return HTTPStatus.OK, {'account_number': account_number, 'balance': balance}
+
+        else:
+            return HTTPStatus.NOT_FOUND, {'error': 'Not found.'}
+
+        return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"{method} is not supported here."}
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError('Request body must be a JSON object.')
+        return body
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload, default=json_default).encode('utf-8'), 'application/json')
+
+    def send_body(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class BankHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, address, verbose=False):
+        super().__init__(address, BankRequestHandler)
+
+        self.service = service
+        self.verbose = verbose
+
+def run_periodically(stopped, interval, task, description):
+    # Every posting adds change log and report delta rows; a server that runs for weeks must
+    # prune and compact them itself.
+    while not stopped.wait(interval):
+        try:
+            task()
+        except db_errors() as e:
+            logger.warning("Could not %s: %s", description, e)
+
+def serve(service, host='127.0.0.1', port=8080, verbose=False):
+    server = BankHTTPServer(service, (host, port), verbose)
+    stopped = threading.Event()
+    threading.Thread(target=run_periodically, args=(stopped, service.prune_interval, service.prune_changes,
+                                                    'prune the change log'), name='bankdb-prune', daemon=True).start()
+    threading.Thread(target=run_periodically, args=(stopped, service.compact_interval, service.compact_reports,
+                                                    'compact the report summaries'), name='bankdb-compact',
+                     daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        server.server_close()
@@ -0,0 +1,143 @@
+import getpass
+import json
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger('bankdb.audit')
+
+class AuditLog:
+    # Entries are queued by the caller and written by one background thread every
+    # flush_interval, or as soon as a full batch is waiting, so recording a change costs a queue
+    # put instead of a commit. The queue is bounded: when the writer falls that far behind,
+    # callers wait up to put_timeout and the entry is then dropped (and counted) rather than
+    # stalling the application indefinitely.
+    put_timeout = 1.0
+
+    def __init__(self, db, actor, file_path='', max_queue=10000, batch_size=500, flush_interval=1.0):
+        self.db = db
+        self.actor = actor
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.closed = False
+        self.stopping = False
+        self.wakeup = threading.Event()
+
+        # record() calls that are past the closed check but still putting their entry; close()
+        # waits for them so the writer cannot exit before their entries are queued.
+        self.putting = 0
+        self.lock = threading.Condition()
+
+        self.thread = threading.Thread(target=self.run, name='bankdb-audit', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, db, config):
+        return cls(db, config['audit_actor'] or getpass.getuser(), config['audit_file'],
+                   int(config['audit_queue_size']), int(config['audit_batch_size']),
+                   float(config['audit_flush_interval']))
+
+    def record(self, action, account_number=None, details=None):
+        # details is only serialized on the writer thread; callers pass a fresh dict.
+        entry = (self.db.current_timestamp(), action, account_number, self.actor, details)
+
+        with self.lock:
+            if self.closed:
+                self.dropped += 1
+                logger.warning("Audit log closed, dropped %s entry for %s", action, account_number)
+                return
+            self.putting += 1
+
+        try:
+            self.queue.put(entry, timeout=self.put_timeout)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            logger.warning("Audit queue full, dropped %s entry for %s (%d dropped so far)", action,
+                           account_number, self.dropped)
+            return
+        finally:
+            with self.lock:
+                self.putting -= 1
+                self.lock.notify_all()
+
+        if self.queue.qsize() >= self.batch_size:
+            self.wakeup.set()
+
+    def run(self):
+        pending = []
+
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            stopping = self.stopping
+
+            while True:
+                while len(pending) < self.batch_size:
+                    try:
+                        pending.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if not pending:
+                    break
+
+                try:
+                    self.write(pending)
+                except Exception as e:
+                    # The batch is kept and retried on the next round; meanwhile new entries back
+                    # up in the queue.
+                    logger.warning("Could not write %d audit entries: %s", len(pending), e)
+                    break
+
+                self.written += len(pending)
+                pending = []
+
+            if stopping:
+                if pending:
+                    logger.error("Audit log closed with %d entries unwritten", len(pending) + self.queue.qsize())
+                return
+
+    def write(self, entries):
+        with self.db.metrics.measure('operation', 'audit_flush') as sample:
+            sample.rows = len(entries)
+
+            if self.file_path:
+                with open(self.file_path, 'a', encoding='utf-8') as file:
+                    for occurred_at, action, account_number, actor, details in entries:
+                        file.write(json.dumps({'occurred_at': str(occurred_at), 'action': action,
+                                               'account_number': account_number, 'actor': actor,
+                                               'details': details}, default=str) + "\n")
+                    file.flush()
+                    os.fsync(file.fileno())
+            else:
+                insert_query = ("INSERT INTO audit_log (occurred_at, action, account_number, actor, details) "
+                                "VALUES (%s, %s, %s, %s, %s)")
+
+                rows = [(occurred_at, action, account_number, actor,
+                         json.dumps(details, default=str) if details is not None else None)
+                        for occurred_at, action, account_number, actor, details in entries]
+
+                with self.db.transaction() as session:
+                    session.executemany(insert_query, rows)
+
+    def close(self, timeout=5):
+        # Lets the writer drain the queue before it exits; entries recorded after this are
+        # dropped with a warning.
+        with self.lock:
+            self.closed = True
+            self.lock.wait_for(lambda: not self.putting)
+
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+        if self.thread.is_alive():
+            logger.error("Audit log did not finish writing within %ss; %d entries may be lost", timeout,
+                         self.queue.qsize())
@@ -0,0 +1,314 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from cache import AccountCache
+from database import SORT_COLUMNS, db_errors, load_config, open_database, sort_columns
+from exporter import export_customers
+from service import BankService
+
+FIRST_NAMES = ['Aarav', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Vivaan', 'Anaya', 'Arjun', 'Meera',
+               'Kabir', 'Nisha', 'Dev', 'Priya', 'Rahul', 'Sneha', 'Aditya', 'Pooja', 'Karan', 'Tara']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Iyer', 'Reddy', 'Nair', 'Patel', 'Singh', 'Khan', 'Das',
+              'Mehta', 'Joshi', 'Rao', 'Kapoor', 'Bose', 'Chopra', 'Malhotra', 'Pillai', 'Menon', 'Sethi']
+
+def account_number(index):
+    return f"BENCH{index:09d}"
+
+def summarize(samples, elapsed=None):
+    samples = sorted(samples)
+    count = len(samples)
+
+    def percentile(fraction):
+        return samples[min(count - 1, int(fraction * count))] * 1000
+
+    return {
+        'count': count,
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': samples[-1] * 1000,
+        'ops_per_sec': count / (elapsed if elapsed is not None else sum(samples)),
+    }
+
+def timed(operation, iterations):
+    samples = []
+
+    for i in range(iterations):
+        started = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - started)
+
+    return summarize(samples)
+
+def timed_concurrent(operation, iterations, concurrency):
+    # Database errors (deadlocks, lock wait timeouts) are counted instead of ending the run, so
+    # a scenario that deadlocks shows up in the results; see main().
+    errors = []
+
+    def run(i):
+        started = time.perf_counter()
+        try:
+            operation(i)
+        except db_errors() as e:
+            errors.append(str(e))
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(run, range(iterations)))
+
+    result = summarize(samples, time.perf_counter() - started)
+    result['concurrency'] = concurrency
+    result['errors'] = len(errors)
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+class Benchmark:
+    def __init__(self, config, iterations=200, concurrency=8, seed=42):
+        self.backend = config['backend']
+        self.db = open_database(config)
+        self.customers = self.db.repository()
+        self.service = BankService(self.customers)
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        self.seeded = 0
+
+    def close(self):
+        self.db.close()
+
+    def reset(self):
+        self.db.drop_database()
+        self.service.setup_database()
+        self.seeded = 0
+
+    def seed(self, size, batch_size=10000):
+        insert_query = "INSERT INTO customers (first_name, last_name, account_number, balance) VALUES (%s, %s, %s, %s)"
+
+        for start in range(self.seeded, size, batch_size):
+            rows = [(self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES), account_number(index),
+                     Decimal(self.random.randint(100, 10000000)) / 100)
+                    for index in range(start, min(size, start + batch_size))]
+
+            with self.db.transaction() as session:
+                session.executemany(insert_query, rows)
+
+        self.seeded = max(self.seeded, size)
+
+    def random_account(self):
+        return account_number(self.random.randrange(self.seeded))
+
+    def run(self, size, include_export=True):
+        accounts = [self.random_account() for _ in range(self.iterations)]
+        hot_accounts = accounts[:10]
+        new_accounts = [f"NEW{size:08d}{i:06d}" for i in range(self.iterations)]
+
+        results = {}
+
+        results['lookup'] = timed(lambda i: self.customers.find(accounts[i]), self.iterations)
+
+        cached = self.db.repository(AccountCache(max_size=1000, ttl=60))
+        results['lookup_hot_cached'] = timed(lambda i: cached.find(hot_accounts[i % len(hot_accounts)]),
+                                             self.iterations)
+
+        results['add'] = timed(lambda i: self.service.add_customer('Bench', 'Customer', new_accounts[i], '100.00'),
+                               self.iterations)
+
+        results['deposit'] = timed(lambda i: self.service.deposit(accounts[i], '10.00'), self.iterations)
+        results['withdraw'] = timed(lambda i: self.service.withdraw(accounts[i], '10.00'), self.iterations)
+
+        results['deposit_concurrent'] = timed_concurrent(
+            lambda i: self.service.deposit(accounts[i], '1.00'), self.iterations, self.concurrency)
+        results['deposit_concurrent_hot'] = timed_concurrent(
+            lambda i: self.service.deposit(hot_accounts[i % len(hot_accounts)], '1.00'),
+            self.iterations, self.concurrency)
+
+        # Pairs run in both directions, so the hot case only scales if lock ordering keeps
+        # opposing transfers from deadlocking.
+        pairs = [(accounts[i], accounts[i - 1]) for i in range(self.iterations) if accounts[i] != accounts[i - 1]]
+        hot_pairs = [(hot_accounts[i % 2], hot_accounts[1 - i % 2]) for i in range(self.iterations)]
+
+        results['transfer'] = timed(lambda i: self.service.transfer(*pairs[i % len(pairs)], '1.00'), self.iterations)
+        results['transfer_concurrent'] = timed_concurrent(
+            lambda i: self.service.transfer(*pairs[i % len(pairs)], '1.00'), self.iterations, self.concurrency)
+        results['transfer_concurrent_hot'] = timed_concurrent(
+            lambda i: self.service.transfer(*hot_pairs[i], '1.00'), self.iterations, self.concurrency)
+
+        # Random directions among a few accounts, single and in batches held open for a while,
+        # so concurrent transactions touch the same customer and report rows in every order.
+        mixed_pairs = [tuple(self.random.sample(hot_accounts, 2)) for _ in range(self.iterations)]
+        results['transfer_concurrent_mixed'] = timed_concurrent(
+            lambda i: self.service.transfer(*mixed_pairs[i], '1.00'), self.iterations, self.concurrency)
+
+        batch = [(source, target, Decimal('1.00')) for source, target in pairs[:100]]
+        results['transfer_batch_100'] = timed(lambda i: self.customers.transfer_batch(batch),
+                                              max(1, self.iterations // 10))
+
+        mixed_batches = [[(source, target, Decimal('1.00')) for source, target in self.random.sample(mixed_pairs, 20)]
+                         for _ in range(max(1, self.iterations // 10))]
+        results['transfer_batch_concurrent_mixed'] = timed_concurrent(
+            lambda i: self.customers.transfer_batch(mixed_batches[i]), len(mixed_batches), self.concurrency)
+        results['report_compact'] = timed(lambda i: self.service.compact_reports(), 1)
+
+        results['table_first_page'] = timed(lambda i: self.customers.page(None, 200), self.iterations)
+
+        def scroll(i):
+            after_id = self.random.randrange(size)
+            for _ in range(10):
+                rows = self.customers.page(after_id, 200)
+                if not rows:
+                    break
+                after_id = rows[-1][0]
+
+        results['table_scroll_10_pages'] = timed(scroll, max(1, self.iterations // 10))
+
+        for name, order in (('balance', (('balance', True),)),
+                            ('name', (('last_name', False), ('first_name', False)))):
+            results[f'table_first_page_by_{name}'] = timed(lambda i: self.customers.page(None, 200, order=order),
+                                                           self.iterations)
+
+            def sorted_scroll(i):
+                after = None
+                for _ in range(10):
+                    rows = self.customers.page(after, 200, order=order)
+                    if not rows:
+                        break
+                    after = tuple(rows[-1][SORT_COLUMNS.index(column)] for column, _ in sort_columns(order))
+
+            results[f'table_scroll_10_pages_by_{name}'] = timed(sorted_scroll, max(1, self.iterations // 10))
+
+        search_terms = [self.random.choice(LAST_NAMES)[:3] for _ in range(self.iterations)]
+        results['search_prefix'] = timed(lambda i: self.customers.page(None, 200, search_terms[i]), self.iterations)
+        results['search_account'] = timed(lambda i: self.customers.page(None, 200, accounts[i][:10]),
+                                           self.iterations)
+
+        results['report'] = timed(lambda i: self.service.report(), self.iterations)
+
+        if include_export:
+            file_path = os.path.join(tempfile.mkdtemp(), 'customers.csv')
+            export_db = self.db.connect()
+            try:
+                started = time.perf_counter()
+                exported = export_customers(export_db, file_path)
+                elapsed = time.perf_counter() - started
+            finally:
+                export_db.close()
+                os.remove(file_path)
+            results['export_csv'] = {'rows': exported, 'seconds': elapsed, 'rows_per_sec': exported / elapsed}
+
+        return results
+
+    def server_version(self):
+        version_query = "SELECT sqlite_version()" if self.backend == 'sqlite' else "SELECT VERSION()"
+
+        with self.db.session() as session:
+            return f"{self.backend} {session.execute_direct(version_query)[0][0]}"
+
+def compare(baseline, current, threshold):
+    regressions = []
+
+    for size, operations in current['results'].items():
+        for operation, stats in operations.items():
+            previous = baseline.get('results', {}).get(size, {}).get(operation)
+            if not previous:
+                continue
+
+            for key, higher_is_better in (('p50_ms', False), ('p99_ms', False), ('ops_per_sec', True),
+                                          ('rows_per_sec', True)):
+                if key not in stats or key not in previous or not previous[key]:
+                    continue
+
+                change = (stats[key] - previous[key]) / previous[key]
+                worse = -change if higher_is_better else change
+                line = f"{size:>9} {operation:<24} {key:<12} {previous[key]:>12.3f} -> {stats[key]:>12.3f} ({change:+.1%})"
+
+                print(line + ("  REGRESSION" if worse > threshold else ""))
+                if worse > threshold:
+                    regressions.append(line)
+
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Seed a scratch database and benchmark the BankDB operations. '
+                                                 'Run it against MySQL as well: the concurrent transfer scenarios '
+                                                 'fail the run if any transaction deadlocks.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], help='storage backend (default: from bankdb.ini)')
+    parser.add_argument('--database', default='TanishkBankDB_bench',
+                        help='scratch database (or SQLite file name) to (re)create; never point this at real data')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-export', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown reported as a regression')
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    config = dict(load_config(), database=args.database, sqlite_path=args.database + '.sqlite3',
+                  pool_size=str(max(args.concurrency, 2)))
+    if args.backend:
+        config['backend'] = args.backend
+
+    benchmark = Benchmark(config, args.iterations, args.concurrency, args.seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+
+    try:
+        benchmark.reset()
+        report['meta']['server'] = benchmark.server_version()
+
+        for size in sorted(args.sizes):
+            print(f"Seeding {size:,} customers...", file=sys.stderr)
+            benchmark.seed(size)
+            print(f"Benchmarking {size:,} customers...", file=sys.stderr)
+            report['results'][str(size)] = benchmark.run(size, include_export=not args.skip_export)
+    finally:
+        benchmark.close()
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    failed = [f"{size} {operation}: {stats['errors']} failed ({stats['first_error']})"
+              for size, operations in report['results'].items()
+              for operation, stats in operations.items() if stats.get('errors')]
+    for line in failed:
+        print(line, file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}", file=sys.stderr)
+            return 1
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
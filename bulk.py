@@ -0,0 +1,308 @@
+import csv
+from decimal import Decimal, InvalidOperation
+import os
+import time
+
+from database import integrity_errors
+
+CUSTOMER_FIELDS = ('first_name', 'last_name', 'account_number', 'balance')
+POSTING_FIELDS = ('account_number', 'amount')
+POSTING_KINDS = {'deposit': 1, 'withdrawal': -1, 'withdraw': -1}
+TRANSFER_FIELDS = ('from_account', 'to_account', 'amount')
+FIELD_LENGTHS = {'first_name': 50, 'last_name': 50, 'account_number': 20}
+MAX_AMOUNT = Decimal('10000000000000')
+
+class BulkResult:
+    def __init__(self, rejects_path=None):
+        self.rejects_path = rejects_path
+        self.processed = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.cancelled = False
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+        self.rejects_file = None
+        self.rejects_writer = None
+
+    def reject(self, line_number, reason, row):
+        self.rejected += 1
+
+        if self.rejects_path is None:
+            return
+
+        # Rejects are streamed to disk so a bad file cannot grow memory without bound.
+        if self.rejects_writer is None:
+            self.rejects_file = open(self.rejects_path, 'w', newline='', encoding='utf-8')
+            self.rejects_writer = csv.writer(self.rejects_file)
+            self.rejects_writer.writerow(['line', 'reason', *row.keys()])
+
+        self.rejects_writer.writerow([line_number, reason, *row.values()])
+
+    def close(self):
+        self.elapsed = time.perf_counter() - self.started
+
+        if self.rejects_file is not None:
+            self.rejects_file.close()
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def summary(self, verb):
+        summary = (f"{verb} {self.accepted:,} of {self.processed:,} rows in {self.elapsed:.2f}s "
+                   f"({self.rows_per_second:,.0f} rows/s).")
+        if self.rejected:
+            summary += f" {self.rejected:,} rows rejected"
+            summary += f", see {self.rejects_path}." if self.rejects_path else "."
+        if self.cancelled:
+            summary += " Canceled before the end of the file."
+        return summary
+
+def default_rejects_path(file_path):
+    return os.path.splitext(file_path)[0] + '.rejects.csv'
+
+def normalize_header(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+def read_rows(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+
+    if extension == '.csv':
+        with open(file_path, newline='', encoding='utf-8-sig') as file:
+            reader = csv.reader(file)
+            header = [normalize_header(name) for name in next(reader, [])]
+
+            for line_number, values in enumerate(reader, start=2):
+                if any(values):
+                    yield line_number, dict(zip(header, values))
+
+    elif extension == '.xlsx':
+        from openpyxl import load_workbook
+
+        # Read-only workbooks parse the sheet lazily instead of loading every cell up front.
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [normalize_header(name) for name in next(rows, ())]
+
+            for line_number, values in enumerate(rows, start=2):
+                values = ['' if value is None else str(value) for value in values]
+                if any(values):
+                    yield line_number, dict(zip(header, values))
+        finally:
+            workbook.close()
+
+    else:
+        raise ValueError(f"Unsupported input format: {file_path}")
+
+def batched(rows, batch_size):
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def check_amount(amount, text):
+    # Amounts must fit a DECIMAL(15,2) column without rounding; BankService applies the same rule.
+    if not amount.is_finite() or amount.as_tuple().exponent < -2:
+        raise ValueError(f"Invalid amount: {text!r}")
+    if abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"Amount out of range: {text!r}")
+
+    return amount
+
+def parse_amount(text):
+    try:
+        amount = Decimal(text.strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {text!r}")
+
+    return check_amount(amount, text)
+
+def check_fields(row, fields):
+    missing = [field for field in fields if not row.get(field, '').strip()]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+
+    for field, length in FIELD_LENGTHS.items():
+        if field in fields and len(row[field].strip()) > length:
+            raise ValueError(f"{field} is longer than {length} characters")
+
+def parse_customer(row):
+    check_fields(row, CUSTOMER_FIELDS)
+
+    return (row['first_name'].strip(), row['last_name'].strip(), row['account_number'].strip(),
+            parse_amount(row['balance']))
+
+def parse_posting(row):
+    check_fields(row, POSTING_FIELDS)
+
+    amount = parse_amount(row['amount'])
+    kind = normalize_header(row.get('type', ''))
+
+    if kind:
+        if kind not in POSTING_KINDS:
+            raise ValueError(f"Unknown transaction type: {row['type']!r}")
+        if amount <= 0:
+            raise ValueError("Amount must be positive")
+        amount *= POSTING_KINDS[kind]
+    elif amount == 0:
+        raise ValueError("Amount must not be zero")
+
+    return row['account_number'].strip(), amount, 'deposit' if amount > 0 else 'withdrawal'
+
+def parse_transfer(row):
+    check_fields(row, TRANSFER_FIELDS)
+
+    from_account = row['from_account'].strip()
+    to_account = row['to_account'].strip()
+    amount = parse_amount(row['amount'])
+
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    if from_account == to_account:
+        raise ValueError("Cannot transfer to the same account")
+
+    return from_account, to_account, amount
+
+def record_batch(record, action, file_path, batch, accepted, total):
+    # One audit entry per committed batch, naming the file and its lines; the audit log adds who
+    # ran it. Per-row entries would flood the audit queue on a large file.
+    if record is not None and accepted:
+        record(action, None, {'file': os.path.abspath(file_path), 'lines': [batch[0][0], batch[-1][0]],
+                              'accepted': accepted, 'total': total})
+
+def import_customers(customers, file_path, batch_size=5000, rejects_path=None, progress=None, cancelled=None,
+                     record=None):
+    result = BulkResult(rejects_path)
+
+    try:
+        for batch in batched(read_rows(file_path), batch_size):
+            if cancelled is not None and cancelled():
+                result.cancelled = True
+                break
+
+            valid = []
+            seen = set()
+
+            for line_number, row in batch:
+                try:
+                    customer = parse_customer(row)
+                except ValueError as e:
+                    result.reject(line_number, str(e), row)
+                    continue
+
+                if customer[2] in seen:
+                    result.reject(line_number, 'Duplicate account number in file.', row)
+                    continue
+
+                seen.add(customer[2])
+                valid.append((line_number, row, customer))
+
+            if valid:
+                new_customers = [customer for _, _, customer in valid]
+                try:
+                    existing = customers.add_many(new_customers)
+                except integrity_errors():
+                    # Another writer inserted one of these accounts after the duplicate check;
+                    # the batch was rolled back, so check again and retry it once.
+                    existing = customers.add_many(new_customers)
+
+                accepted = [customer for _, _, customer in valid if customer[2] not in existing]
+                for line_number, row, customer in valid:
+                    if customer[2] in existing:
+                        result.reject(line_number, 'Account number already exists.', row)
+
+                result.accepted += len(accepted)
+                record_batch(record, 'import_customers', file_path, batch, len(accepted),
+                             sum((customer[3] for customer in accepted), Decimal('0.00')))
+
+            result.processed += len(batch)
+            if progress is not None:
+                progress(result.processed)
+    finally:
+        result.close()
+
+    return result
+
+def post_transactions(customers, file_path, batch_size=1000, rejects_path=None, progress=None, cancelled=None,
+                      record=None):
+    result = BulkResult(rejects_path)
+
+    try:
+        for batch in batched(read_rows(file_path), batch_size):
+            if cancelled is not None and cancelled():
+                result.cancelled = True
+                break
+
+            valid = []
+
+            for line_number, row in batch:
+                try:
+                    valid.append((line_number, row, parse_posting(row)))
+                except ValueError as e:
+                    result.reject(line_number, str(e), row)
+
+            if valid:
+                rejects = dict(customers.post_batch([posting for _, _, posting in valid]))
+                accepted = [posting for index, (_, _, posting) in enumerate(valid) if index not in rejects]
+
+                for index, (line_number, row, _) in enumerate(valid):
+                    if index in rejects:
+                        result.reject(line_number, rejects[index], row)
+
+                result.accepted += len(accepted)
+                record_batch(record, 'post_transactions', file_path, batch, len(accepted),
+                             sum((posting[1] for posting in accepted), Decimal('0.00')))
+
+            result.processed += len(batch)
+            if progress is not None:
+                progress(result.processed)
+    finally:
+        result.close()
+
+    return result
+
+def post_transfers(customers, file_path, batch_size=1000, rejects_path=None, progress=None, cancelled=None,
+                   record=None):
+    result = BulkResult(rejects_path)
+
+    try:
+        for batch in batched(read_rows(file_path), batch_size):
+            if cancelled is not None and cancelled():
+                result.cancelled = True
+                break
+
+            valid = []
+
+            for line_number, row in batch:
+                try:
+                    valid.append((line_number, row, parse_transfer(row)))
+                except ValueError as e:
+                    result.reject(line_number, str(e), row)
+
+            if valid:
+                rejects = dict(customers.transfer_batch([transfer for _, _, transfer in valid]))
+                accepted = [transfer for index, (_, _, transfer) in enumerate(valid) if index not in rejects]
+
+                for index, (line_number, row, _) in enumerate(valid):
+                    if index in rejects:
+                        result.reject(line_number, rejects[index], row)
+
+                result.accepted += len(accepted)
+                record_batch(record, 'post_transfers', file_path, batch, len(accepted),
+                             sum((transfer[2] for transfer in accepted), Decimal('0.00')))
+
+            result.processed += len(batch)
+            if progress is not None:
+                progress(result.processed)
+    finally:
+        result.close()
+
+    return result
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import threading
+import time
+
+MISSING = object()
+
+class AccountCache:
+    def __init__(self, max_size=10000, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # account_number -> [stamp, expires_at, row]; invalidated accounts keep a tombstone whose
+        # row is MISSING so that a read which started before the write cannot re-cache stale data.
+        self.entries = OrderedDict()
+        self.stamp = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_config(cls, config):
+        max_size = int(config['cache_size'])
+        return cls(max_size, float(config['cache_ttl'])) if max_size > 0 else None
+
+    def token(self):
+        with self.lock:
+            return self.stamp
+
+    def get(self, account_number):
+        with self.lock:
+            entry = self.entries.get(account_number)
+
+            if entry is None or entry[2] is MISSING or entry[1] < time.monotonic():
+                self.misses += 1
+                return MISSING
+
+            self.entries.move_to_end(account_number)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, account_number, row, token):
+        with self.lock:
+            entry = self.entries.get(account_number)
+
+            if entry is not None and entry[0] > token:
+                return
+
+            self.entries[account_number] = [token, time.monotonic() + self.ttl, row]
+            self.entries.move_to_end(account_number)
+            self.evict()
+
+    def invalidate(self, account_number):
+        with self.lock:
+            self.stamp += 1
+            self.invalidations += 1
+            self.entries[account_number] = [self.stamp, 0, MISSING]
+            self.entries.move_to_end(account_number)
+            self.evict()
+
+    def invalidate_many(self, account_numbers):
+        for account_number in account_numbers:
+            self.invalidate(account_number)
+
+    def clear(self):
+        with self.lock:
+            self.stamp += 1
+            self.entries.clear()
+
+    def evict(self):
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
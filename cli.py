@@ -0,0 +1,131 @@
+import argparse
+import json
+import sys
+
+from bulk import default_rejects_path, import_customers, post_transactions, post_transfers
+from database import BankError, db_errors, load_config
+from service import BankService, json_default
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Bank database operations without the GUI.')
+    parser.add_argument('--config', help='path to a bankdb.ini file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('setup', help='create the database and schema')
+    subparsers.add_parser('migrate', help='apply pending schema migrations')
+
+    show_parser = subparsers.add_parser('show', help='show one customer')
+    show_parser.add_argument('account_number')
+
+    list_parser = subparsers.add_parser('list', help='list customers page by page')
+    list_parser.add_argument('--after-id', type=int)
+    list_parser.add_argument('--limit', type=int, default=100)
+    list_parser.add_argument('--search', default='')
+    list_parser.add_argument('--sort', default='', help='comma-separated columns, "-" prefix for descending, '
+                                                        'e.g. last_name,-balance')
+
+    add_parser = subparsers.add_parser('add', help='add a customer')
+    add_parser.add_argument('first_name')
+    add_parser.add_argument('last_name')
+    add_parser.add_argument('account_number')
+    add_parser.add_argument('balance')
+
+    update_parser = subparsers.add_parser('update', help='update customer details')
+    update_parser.add_argument('account_number')
+    update_parser.add_argument('--first-name')
+    update_parser.add_argument('--last-name')
+    update_parser.add_argument('--balance')
+    update_parser.add_argument('--expect-version', type=int, help='refuse the update if the customer has changed since')
+
+    delete_parser = subparsers.add_parser('delete', help='delete a customer')
+    delete_parser.add_argument('account_number')
+
+    for command in ('deposit', 'withdraw'):
+        amount_parser = subparsers.add_parser(command, help=f'{command} an amount')
+        amount_parser.add_argument('account_number')
+        amount_parser.add_argument('amount')
+
+    transfer_parser = subparsers.add_parser('transfer', help='move an amount between two accounts')
+    transfer_parser.add_argument('from_account')
+    transfer_parser.add_argument('to_account')
+    transfer_parser.add_argument('amount')
+
+    for command, batch_size in (('import', 5000), ('post', 1000), ('transfers', 1000)):
+        bulk_parser = subparsers.add_parser(command, help=f'bulk {command} from a CSV/xlsx file')
+        bulk_parser.add_argument('file')
+        bulk_parser.add_argument('--batch-size', type=int, default=batch_size)
+        bulk_parser.add_argument('--rejects', help='where to write rejected rows (default: <file>.rejects.csv)')
+
+    report_parser = subparsers.add_parser('report', help='balance totals, distribution, top accounts and daily flows')
+    report_parser.add_argument('--top', type=int, default=10, help='number of largest accounts to list')
+    report_parser.add_argument('--days', type=int, default=30, help='number of days of flows to list')
+    report_parser.add_argument('--rebuild', action='store_true', help='recompute the summary tables first')
+
+    serve_parser = subparsers.add_parser('serve', help='run the local HTTP/JSON API')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--verbose', action='store_true', help='log every request')
+
+    return parser
+
+def run(service, args):
+    if args.command == 'setup':
+        return {'created': service.setup_database()}
+    if args.command == 'migrate':
+        return {'applied': service.upgrade_schema()}
+    if args.command == 'show':
+        return service.get_customer(args.account_number)
+    if args.command == 'list':
+        return service.list_customers(args.after_id, args.limit, args.search, args.sort)
+    if args.command == 'add':
+        return service.add_customer(args.first_name, args.last_name, args.account_number, args.balance)
+    if args.command == 'update':
+        expected = {'version': args.expect_version} if args.expect_version is not None else None
+        return service.update_customer(args.account_number, args.first_name, args.last_name, args.balance, expected)
+    if args.command == 'delete':
+        service.delete_customer(args.account_number)
+        return {'deleted': args.account_number}
+    if args.command in ('deposit', 'withdraw'):
+        balance = getattr(service, args.command)(args.account_number, args.amount)
+        return {'account_number': args.account_number, 'balance': balance}
+    if args.command == 'transfer':
+        return service.transfer(args.from_account, args.to_account, args.amount)
+    if args.command in ('import', 'post', 'transfers'):
+        operation = {'import': import_customers, 'post': post_transactions, 'transfers': post_transfers}[args.command]
+        result = operation(service.customers, args.file, args.batch_size,
+                           args.rejects or default_rejects_path(args.file), record=service.record)
+        return {'processed': result.processed, 'accepted': result.accepted, 'rejected': result.rejected,
+                'rejects_file': result.rejects_path if result.rejected else None,
+                'seconds': round(result.elapsed, 3), 'rows_per_second': round(result.rows_per_second)}
+    if args.command == 'report':
+        if args.rebuild:
+            service.rebuild_reports()
+        return service.report(args.top, args.days)
+    if args.command == 'serve':
+        from api import serve
+
+        service.upgrade_schema()
+        print(f"Serving on http://{args.host}:{args.port}/customers", file=sys.stderr)
+        serve(service, args.host, args.port, args.verbose)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    service = BankService.from_config(load_config(args.config))
+
+    try:
+        result = run(service, args)
+    except BankError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except (*db_errors(), OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        service.close()
+
+    if result is not None:
+        print(json.dumps(result, default=json_default, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
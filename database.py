@@ -0,0 +1,866 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+import configparser
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from cache import MISSING
+from metrics import Metrics, fingerprint
+
+DEFAULT_CONFIG = {
+    'backend': 'mysql',
+    'sqlite_path': 'bankdb.sqlite3',
+    'host': 'localhost',
+    'port': '3306',
+    'user': '',
+    'password': '',
+    'database': 'TanishkBankDB',
+    'pool_size': '5',
+    'pool_timeout': '10',
+    'health_check_interval': '30',
+    'statement_cache_size': '64',
+    'query_timeout': '30',
+    'cache_size': '10000',
+    'cache_ttl': '30',
+    'slow_query_ms': '500',
+    'metrics_window': '1000',
+    'metrics_file': '',
+    'refresh_interval': '2',
+    'audit_file': '',
+    'audit_actor': '',
+    'audit_queue_size': '10000',
+    'audit_batch_size': '500',
+    'audit_flush_interval': '1',
+}
+
+logger = logging.getLogger('bankdb')
+
+# mysql.connector takes longer to import than the rest of the app together, so it is only
+# loaded once a MySQL connection is actually opened, normally on a worker thread.
+sql = pooling = None
+
+def load_mysql():
+    global sql, pooling
+
+    if sql is None:
+        try:
+            from mysql.connector import pooling
+            import mysql.connector as sql
+        except ImportError:
+            raise ImportError("The mysql backend needs mysql-connector-python; install it or set backend = sqlite.")
+
+def db_errors():
+    # Driver exceptions of every backend loaded so far, for callers that must not depend on one
+    # driver; a driver that was never imported cannot have raised anything.
+    mysql = sys.modules.get('mysql.connector')
+    return (sqlite3.Error,) + ((mysql.Error,) if mysql is not None else ())
+
+def integrity_errors():
+    mysql = sys.modules.get('mysql.connector')
+    return (sqlite3.IntegrityError,) + ((mysql.IntegrityError,) if mysql is not None else ())
+
+CONFIG_FILE = 'bankdb.ini'
+ENV_PREFIX = 'BANKDB_'
+
+# Columns customer listings can be sorted by, in the order page queries select them.
+SORT_COLUMNS = ('id', 'first_name', 'last_name', 'account_number', 'balance')
+
+class BankError(Exception):
+    message = 'The operation could not be completed.'
+
+    def __init__(self, message=None):
+        super().__init__(message or self.message)
+
+class AccountNotFound(BankError):
+    message = 'Customer not found.'
+
+class InsufficientFunds(BankError):
+    message = 'Insufficient balance. Withdrawal canceled.'
+
+class MissingCredentials(BankError):
+    message = ("No MySQL credentials are configured. Set user and password in the [database] section of "
+               "bankdb.ini or in BANKDB_USER and BANKDB_PASSWORD, or use backend = sqlite.")
+
+class UpdateConflict(BankError):
+    message = 'This customer was changed by someone else in the meantime.'
+
+    def __init__(self, current=None, fields=()):
+        message = self.message
+        if fields:
+            message += f" Conflicting fields: {', '.join(fields)}."
+        super().__init__(message + " Review the current details and try again.")
+
+        self.current = current
+        self.fields = fields
+
+def load_config(path=None):
+    # Defaults < [database] section of bankdb.ini (or $BANKDB_CONFIG) < BANKDB_* environment variables.
+    config = dict(DEFAULT_CONFIG)
+
+    parser = configparser.ConfigParser()
+    parser.read(path or os.environ.get(ENV_PREFIX + 'CONFIG', CONFIG_FILE))
+    if parser.has_section('database'):
+        config.update(parser['database'])
+
+    for key in config:
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            config[key] = value
+
+    return config
+
+class Session:
+    def __init__(self, database, connection):
+        self.database = database
+        self.connection = connection
+
+    def statement(self, query):
+        # Prepared cursors are cached per server connection, so the same statement is only
+        # prepared once for as long as the pooled connection lives.
+        statements = self.database.statements_for(self.connection)
+        cursor = statements.get(query)
+
+        if cursor is None:
+            cursor = self.connection.cursor(prepared=True)
+            statements[query] = cursor
+            while len(statements) > self.database.statement_cache_size:
+                _, evicted = statements.popitem(last=False)
+                evicted.close()
+        else:
+            statements.move_to_end(query)
+
+        return cursor
+
+    def measure(self, query):
+        return self.database.metrics.measure('query', fingerprint(query))
+
+    def execute(self, query, data=()):
+        with self.measure(query) as sample:
+            cursor = self.statement(query)
+            cursor.execute(query, tuple(data))
+            sample.rows = cursor.rowcount
+        return cursor
+
+    def fetchone(self, query, data=()):
+        rows = self.fetchall(query, data)
+        return rows[0] if rows else None
+
+    def fetchall(self, query, data=()):
+        with self.measure(query) as sample:
+            cursor = self.statement(query)
+            cursor.execute(query, tuple(data))
+            rows = cursor.fetchall()
+            sample.rows = len(rows)
+        return rows
+
+    def executemany(self, query, data):
+        with self.measure(query) as sample:
+            cursor = self.connection.cursor()
+            cursor.executemany(query, data)
+            sample.rows = rowcount = cursor.rowcount
+            cursor.close()
+        return rowcount
+
+    def execute_direct(self, query, data=()):
+        with self.measure(query) as sample:
+            cursor = self.connection.cursor()
+            cursor.execute(query, tuple(data))
+            rows = cursor.fetchall() if cursor.with_rows else []
+            sample.rows = len(rows) if cursor.with_rows else cursor.rowcount
+            cursor.close()
+        return rows
+
+    def call(self, procedure, args):
+        # One CALL with the arguments in it; cursor.callproc would first SET them as session
+        # variables and then SELECT them back, three round trips in all. Returns the first row of
+        # the procedure's result set, after reading off the status result that follows it.
+        query = f"CALL {procedure}({', '.join(['%s'] * len(args))})"
+
+        with self.measure(query) as sample:
+            cursor = self.connection.cursor()
+            cursor.execute(query, tuple(args))
+            row = cursor.fetchone()
+            while cursor.nextset():
+                pass
+            sample.rows = 1
+            cursor.close()
+        return row
+
+class Database:
+    QUERY_INTERRUPTED = 1317
+
+    # Appended to reads that must lock the rows they return until the transaction ends.
+    lock_clause = " FOR UPDATE"
+
+    # What ORDER BY uses to sort customers by balance.
+    balance_sort_key = "balance"
+
+    # Seconds to wait for the connection that sends KILL QUERY; a cancel is moot after that.
+    kill_timeout = 5
+
+    def __init__(self, config=None):
+        config = load_config() if config is None else config
+
+        self.name = config['database']
+        self.pool_size = int(config['pool_size'])
+        self.pool_timeout = float(config['pool_timeout'])
+        self.health_check_interval = float(config['health_check_interval'])
+        self.statement_cache_size = int(config['statement_cache_size'])
+        self.query_timeout = float(config['query_timeout'])
+        self.metrics = Metrics.from_config(config)
+        self.metrics_file = config['metrics_file']
+        self.connect_args = {
+            'host': config['host'],
+            'port': int(config['port']),
+            'user': config['user'],
+            'password': config['password'],
+        }
+
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.pool_size)
+        self.statements = {}
+        self.last_used = {}
+        self.active_connections = {}
+
+    def credentials(self):
+        # Checked on every connect rather than at startup, so the GUI can come up and report it.
+        if not self.connect_args['user']:
+            raise MissingCredentials()
+        return self.connect_args
+
+    def connect(self, database=True):
+        # A dedicated connection outside the pool, for long-running streams and admin commands.
+        load_mysql()
+
+        if database:
+            return sql.connect(database=self.name, **self.credentials())
+        return sql.connect(**self.credentials())
+
+    def repository(self, cache=None):
+        return CustomerRepository(self, cache)
+
+    @staticmethod
+    def cents_sql(column):
+        return f"CAST({column} * 100 AS SIGNED)"
+
+    @staticmethod
+    def current_timestamp():
+        # Session-local time, like CURRENT_TIMESTAMP.
+        return datetime.now()
+
+    def database_exists(self):
+        server = self.connect(database=False)
+        try:
+            cursor = server.cursor()
+            cursor.execute("SHOW DATABASES LIKE %s", (self.name,))
+            return cursor.fetchone() is not None
+        finally:
+            server.close()
+
+    def create_database(self):
+        server = self.connect(database=False)
+        try:
+            cursor = server.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.name}`")
+        finally:
+            server.close()
+
+    def drop_database(self):
+        self.close()
+
+        server = self.connect(database=False)
+        try:
+            cursor = server.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.name}`")
+        finally:
+            server.close()
+
+    def migrate(self):
+        from migrations import migrate
+
+        return migrate(self)
+
+    def estimate_row_count(self, connection):
+        cursor = connection.cursor()
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'customers'")
+        result = cursor.fetchone()
+        cursor.close()
+
+        return int(result[0] or 0) if result else 0
+
+    def query_interrupted(self, error):
+        return getattr(error, 'errno', None) == self.QUERY_INTERRUPTED
+
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                # Session reset is disabled because COM_RESET_CONNECTION would drop the cached
+                # prepared statements every time a connection goes back to the pool.
+                self.pool = pooling.MySQLConnectionPool(pool_name=f"bankdb_{id(self)}", pool_size=self.pool_size,
+                                                        pool_reset_session=False, autocommit=True,
+                                                        database=self.name, **self.credentials())
+            return self.pool
+
+    def statements_for(self, connection):
+        return self.statements.setdefault(connection.connection_id, OrderedDict())
+
+    def checkout(self):
+        load_mysql()
+
+        started = time.perf_counter()
+        acquired = self.slots.acquire(timeout=self.pool_timeout)
+        self.metrics.record('pool', 'checkout', time.perf_counter() - started, error=not acquired)
+
+        if not acquired:
+            raise sql.PoolError(f"No database connection available after {self.pool_timeout:g}s")
+
+        try:
+            connection = self.get_pool().get_connection()
+        except BaseException:
+            self.slots.release()
+            raise
+
+        connection_id = connection.connection_id
+        idle = time.monotonic() - self.last_used.get(connection_id, 0)
+
+        if idle > self.health_check_interval:
+            try:
+                connection.ping()
+            except sql.Error:
+                self.statements.pop(connection_id, None)
+                self.last_used.pop(connection_id, None)
+                try:
+                    connection.reconnect(attempts=3, delay=1)
+                except BaseException:
+                    connection.close()
+                    self.slots.release()
+                    raise
+
+        return connection
+
+    def release(self, connection, healthy=True):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            # A connection that raised a database error is health-checked on its next checkout.
+            self.last_used[connection.connection_id] = time.monotonic() if healthy else 0
+        except sql.Error:
+            pass
+        finally:
+            connection.close()
+            self.slots.release()
+
+    @contextmanager
+    def session(self):
+        connection = self.checkout()
+        thread_ident = threading.get_ident()
+        self.active_connections[thread_ident] = connection.connection_id
+        healthy = True
+        try:
+            yield Session(self, connection)
+        except sql.Error:
+            healthy = False
+            raise
+        finally:
+            self.active_connections.pop(thread_ident, None)
+            self.release(connection, healthy)
+
+    @contextmanager
+    def transaction(self):
+        with self.session() as session:
+            session.connection.start_transaction()
+            try:
+                yield session
+            except BaseException:
+                session.connection.rollback()
+                raise
+            with self.metrics.measure('query', 'COMMIT'):
+                session.connection.commit()
+
+    def kill_query(self, connection_id):
+        # Killing goes through a dedicated connection so it never waits for a pool slot
+        # held by the very query it is meant to stop.
+        load_mysql()
+        control = sql.connect(connection_timeout=self.kill_timeout, **self.credentials())
+        try:
+            cursor = control.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+        finally:
+            control.close()
+
+    def cancel_thread_query(self, thread_ident):
+        connection_id = self.active_connections.get(thread_ident)
+        if connection_id is not None:
+            try:
+                self.kill_query(connection_id)
+            except sql.Error:
+                pass
+
+    def close(self):
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool._remove_connections()
+                self.pool = None
+        self.statements.clear()
+        self.last_used.clear()
+
+        if self.metrics_file:
+            try:
+                self.metrics.write(self.metrics_file)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", self.metrics_file, e)
+
+def open_database(config=None):
+    config = load_config() if config is None else config
+    backend = config['backend'].strip().lower()
+
+    if backend == 'sqlite':
+        from sqlite_backend import SQLiteDatabase
+
+        return SQLiteDatabase(config)
+    if backend == 'mysql':
+        return Database(config)
+
+    raise ValueError(f"Unknown storage backend: {config['backend']!r} (expected mysql or sqlite)")
+
+def escape_like(text):
+    # '!' rather than the backslash, because string literals escape differently per backend.
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+def search_condition(text, fulltext=False):
+    # Only prefix patterns are used so that every branch can be served by an index
+    # (the unique key on account_number and the name indexes from migrations.py).
+    words = text.split()
+
+    if not words:
+        return "", []
+
+    if len(words) == 1:
+        prefix = escape_like(words[0]) + '%'
+        condition = "(account_number LIKE %s ESCAPE '!' OR last_name LIKE %s ESCAPE '!' OR first_name LIKE %s ESCAPE '!'"
+        data = [prefix, prefix, prefix]
+
+        if words[0].isdigit():
+            condition += " OR id = %s"
+            data.append(int(words[0]))
+
+        return condition + ")", data
+
+    terms = [re.sub(r'\W', '', word) for word in words]
+    if fulltext and all(terms):
+        boolean_query = " ".join(f"+{term}*" for term in terms)
+        return "MATCH (first_name, last_name) AGAINST (%s IN BOOLEAN MODE)", [boolean_query]
+
+    first_prefix = escape_like(words[0]) + '%'
+    last_prefix = escape_like(" ".join(words[1:])) + '%'
+    return "(first_name LIKE %s ESCAPE '!' AND last_name LIKE %s ESCAPE '!')", [first_prefix, last_prefix]
+
+def parse_sort(text):
+    # "last_name,-balance" sorts by last name, then by balance in descending order.
+    order = []
+
+    for name in text.split(','):
+        name = name.strip()
+        if not name:
+            continue
+
+        column = name.lstrip('-')
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {column!r} (expected one of {', '.join(SORT_COLUMNS)})")
+        order.append((column, name.startswith('-')))
+
+    return tuple(order)
+
+def sort_columns(order=()):
+    # The (column, descending) pairs a listing is actually ordered by: id breaks every tie, so
+    # each row has a distinct key to continue after. Nothing after id can matter.
+    columns = []
+
+    for column, descending in order:
+        columns.append((column, descending))
+        if column == 'id':
+            return tuple(columns)
+
+    return tuple(columns) + (('id', columns[0][1] if columns else False),)
+
+def keyset_condition(order, after, balance_sort_key='balance'):
+    # Rows that come after the key `after` in the given order, spelled out as
+    # k1 > v1 OR (k1 = v1 AND k2 > v2) OR ... so that it works for mixed directions on both
+    # backends. The leading k1 >= v1 gives the optimizer a range to start the index scan at.
+    # Boundary values pass through the same expression as their column.
+    keys = []
+    for column, descending in sort_columns(order):
+        if column == 'balance':
+            keys.append((balance_sort_key, balance_sort_key.replace('balance', '%s'), descending))
+        else:
+            keys.append((column, '%s', descending))
+
+    terms = []
+    data = []
+
+    for position, (expression, placeholder, descending) in enumerate(keys):
+        equal = [f"{previous} = {previous_placeholder}" for previous, previous_placeholder, _ in keys[:position]]
+        terms.append(" AND ".join(equal + [f"{expression} {'<' if descending else '>'} {placeholder}"]))
+        data.extend(after[:position + 1])
+
+    if len(terms) == 1:
+        return terms[0], data
+
+    expression, placeholder, descending = keys[0]
+    condition = f"{expression} {'<=' if descending else '>='} {placeholder} AND ({' OR '.join(f'({term})' for term in terms)})"
+    return condition, [after[0]] + data
+
+def customer_page_query(after, limit, search_text='', fulltext=False, order=(), balance_sort_key='balance'):
+    # after is the key of the last row already seen: its id, or with an order the values of
+    # its sort_columns in that order.
+    conditions = []
+    data = []
+
+    if after is not None:
+        condition, condition_data = keyset_condition(order, after if isinstance(after, tuple) else (after,),
+                                                     balance_sort_key)
+        conditions.append(condition)
+        data.extend(condition_data)
+
+    condition, condition_data = search_condition(search_text, fulltext)
+    if condition:
+        conditions.append(condition)
+        data.extend(condition_data)
+
+    order_by = ", ".join(f"{balance_sort_key if column == 'balance' else column}{' DESC' if descending else ''}"
+                         for column, descending in sort_columns(order))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    select_query = (f"SELECT id, first_name, last_name, account_number, balance FROM customers {where} "
+                    f"ORDER BY {order_by} LIMIT %s")
+    data.append(limit)
+
+    return select_query, data
+
+class CustomerRepository:
+    columns = ('id', 'first_name', 'last_name', 'account_number', 'balance', 'version')
+    updatable_columns = ('first_name', 'last_name', 'balance')
+    change_retention = 24 * 3600
+
+    # Change log ids are taken at insert time but become visible at commit, so a missing id may
+    # still show up. Readers wait this many seconds for one before moving past it.
+    change_grace = 60
+
+    def __init__(self, db, cache=None):
+        self.db = db
+        self.cache = cache
+
+    def invalidate(self, *account_numbers):
+        if self.cache is not None:
+            self.cache.invalidate_many(account_numbers)
+
+    def has_fulltext_search(self):
+        with self.db.session() as session:
+            return bool(session.execute_direct("SHOW INDEX FROM customers WHERE Key_name = 'ft_customers_names'"))
+
+    def find(self, account_number, cached=True):
+        select_query = ("SELECT id, first_name, last_name, account_number, balance, version FROM customers "
+                        "WHERE account_number = %s")
+
+        if not cached:
+            with self.db.session() as session:
+                return session.fetchone(select_query, (account_number,))
+
+        if self.cache is not None:
+            result = self.cache.get(account_number)
+            if result is not MISSING:
+                return result
+            token = self.cache.token()
+
+        with self.db.session() as session:
+            result = session.fetchone(select_query, (account_number,))
+
+        if self.cache is not None:
+            self.cache.put(account_number, result, token)
+        return result
+
+    def page(self, after, limit, search_text='', fulltext=False, order=()):
+        select_query, data = customer_page_query(after, limit, search_text, fulltext, order, self.db.balance_sort_key)
+
+        with self.db.session() as session:
+            return session.fetchall(select_query, data)
+
+    def matching_through(self, customer_ids, through, search_text='', fulltext=False, order=()):
+        # The ids among the given customers that match the search and sort at or before the key
+        # `through` (anywhere, if it is None).
+        conditions = [f"id IN ({', '.join(['%s'] * len(customer_ids))})"]
+        data = list(customer_ids)
+
+        if through is not None:
+            condition, condition_data = keyset_condition(order, through, self.db.balance_sort_key)
+            conditions.append(f"NOT ({condition})")
+            data.extend(condition_data)
+
+        condition, condition_data = search_condition(search_text, fulltext)
+        if condition:
+            conditions.append(condition)
+            data.extend(condition_data)
+
+        with self.db.session() as session:
+            return {row[0] for row in session.fetchall(f"SELECT id FROM customers WHERE {' AND '.join(conditions)}", data)}
+
+    def sort_key(self, customer_id, order=()):
+        # The key page() continues after, for a customer given by id.
+        select_query = f"SELECT {', '.join(column for column, _ in sort_columns(order))} FROM customers WHERE id = %s"
+
+        with self.db.session() as session:
+            return session.fetchone(select_query, (customer_id,))
+
+    def recent_change_sql(self, column):
+        # A condition that holds for change log rows written within change_grace, and its parameter.
+        return f"{column} >= NOW(6) - INTERVAL %s SECOND", self.change_grace
+
+    def latest_change_id(self):
+        # A position to read changes from: everything after it that is not yet visible can still
+        # show up within change_grace, and the first read after it starts that far back.
+        recent, data = self.recent_change_sql('created_at')
+
+        with self.db.session() as session:
+            return session.fetchone(f"SELECT COALESCE(MAX(id), 0) FROM customer_changes WHERE NOT ({recent})",
+                                    (data,))[0]
+
+    def changes_since(self, change_id, limit=1000):
+        # Returns (position, {customer id: current row, or None once deleted}). The rows are read
+        # as they are now rather than as of each change, so applying them is idempotent. The
+        # position stops before an id missing from a recent stretch of the log, since that
+        # change may not be committed yet; the changes after it are returned again next time.
+        # When more than limit changes are pending the mapping is None and the caller should
+        # reload instead of patching.
+        recent, data = self.recent_change_sql('ch.created_at')
+        select_query = (f"SELECT ch.id, {recent}, ch.customer_id, c.id, c.first_name, c.last_name, "
+                        f"c.account_number, c.balance "
+                        f"FROM customer_changes ch LEFT JOIN customers c ON c.id = ch.customer_id "
+                        f"WHERE ch.id > %s ORDER BY ch.id LIMIT %s")
+
+        with self.db.session() as session:
+            rows = session.fetchall(select_query, (data, change_id, limit + 1))
+
+        position = change_id
+        for row in rows[:limit]:
+            # The missing ids were taken before this row was written; once it is old enough,
+            # they belong to transactions that rolled back (or to pruned rows).
+            if row[0] != position + 1 and row[1]:
+                break
+            position = row[0]
+
+        if len(rows) > limit:
+            return position, None
+
+        changes = {row[2]: (row[3:] if row[3] is not None else None) for row in rows}
+        return position, changes
+
+    def prune_changes(self):
+        delete_query = "DELETE FROM customer_changes WHERE created_at < NOW(6) - INTERVAL %s SECOND"
+
+        with self.db.session() as session:
+            return session.execute(delete_query, (self.change_retention,)).rowcount
+
+    def add(self, first_name, last_name, account_number, balance):
+        insert_query = "INSERT INTO customers (first_name, last_name, account_number, balance) VALUES (%s, %s, %s, %s)"
+
+        try:
+            with self.db.session() as session:
+                return session.execute(insert_query, (first_name, last_name, account_number, balance)).lastrowid
+        finally:
+            self.invalidate(account_number)
+
+    def add_many(self, rows):
+        # Rows whose account number already exists are skipped and returned, the rest are
+        # inserted with one multi-row INSERT and one commit.
+        account_numbers = [row[2] for row in rows]
+        placeholders = ", ".join(["%s"] * len(account_numbers))
+        select_query = f"SELECT account_number FROM customers WHERE account_number IN ({placeholders})"
+        insert_query = "INSERT INTO customers (first_name, last_name, account_number, balance) VALUES (%s, %s, %s, %s)"
+
+        with self.db.transaction() as session:
+            existing = {row[0] for row in session.execute_direct(select_query, account_numbers)}
+            new_rows = [row for row in rows if row[2] not in existing]
+
+            if new_rows:
+                session.executemany(insert_query, new_rows)
+
+        self.invalidate(*(row[2] for row in new_rows))
+        return existing
+
+    def update(self, account_number, update_fields, version=None):
+        # With a version, the row is only written if nobody else has written it since that
+        # version was read; a row count of 0 then means a conflict (or a deleted row).
+        for field, _ in update_fields:
+            if field not in self.updatable_columns:
+                raise ValueError(f"Column {field} cannot be updated")
+
+        set_query = ", ".join([f"{field} = %s" for field, _ in update_fields])
+        update_query = f"UPDATE customers SET {set_query}, version = version + 1 WHERE account_number = %s"
+
+        update_values = [value for _, value in update_fields]
+        update_values.append(account_number)
+
+        if version is not None:
+            update_query += " AND version = %s"
+            update_values.append(version)
+
+        try:
+            with self.db.session() as session:
+                return session.execute(update_query, update_values).rowcount
+        finally:
+            self.invalidate(account_number)
+
+    def delete(self, account_number):
+        delete_query = "DELETE FROM customers WHERE account_number = %s"
+
+        try:
+            with self.db.session() as session:
+                return session.execute(delete_query, (account_number,)).rowcount
+        finally:
+            self.invalidate(account_number)
+
+    def post_transaction(self, account_number, amount, kind):
+        try:
+            with self.db.session() as session:
+                status, balance = session.call('post_transaction', (account_number, amount, kind))
+        finally:
+            self.invalidate(account_number)
+
+        if status == 'not_found':
+            raise AccountNotFound()
+        if status == 'insufficient_funds':
+            raise InsufficientFunds()
+
+        return balance
+
+    def lock_accounts(self, session, account_numbers):
+        # Returns {account_number: [id, balance]} with the rows locked until the transaction ends.
+        # Rows are always locked in id order, so batches that share accounts queue behind each
+        # other instead of deadlocking.
+        placeholders = ", ".join(["%s"] * len(account_numbers))
+        ids_query = f"SELECT id FROM customers WHERE account_number IN ({placeholders})"
+        ids = sorted(row[0] for row in session.execute_direct(ids_query, account_numbers))
+
+        if not ids:
+            return {}
+
+        id_placeholders = ", ".join(["%s"] * len(ids))
+        lock_query = (f"SELECT account_number, id, balance FROM customers WHERE id IN ({id_placeholders}) "
+                      f"ORDER BY id{self.db.lock_clause}")
+        return {row[0]: [row[1], row[2]] for row in session.execute_direct(lock_query, ids)}
+
+    def write_balances(self, session, changed, ledger):
+        # changed maps customer id to its new balance; ledger holds the transactions rows to append.
+        insert_query = ("INSERT INTO transactions (customer_id, account_number, kind, amount, balance_after) "
+                        "VALUES (%s, %s, %s, %s, %s)")
+
+        if changed:
+            cases = " ".join(["WHEN %s THEN %s"] * len(changed))
+            id_placeholders = ", ".join(["%s"] * len(changed))
+            update_query = (f"UPDATE customers SET balance = CASE id {cases} END, version = version + 1 "
+                            f"WHERE id IN ({id_placeholders})")
+            data = [value for item in changed.items() for value in item] + list(changed)
+            session.execute_direct(update_query, data)
+
+        if ledger:
+            session.executemany(insert_query, ledger)
+
+    def post_batch(self, postings):
+        # postings is a list of (account_number, signed amount, kind). All accounts touched by the
+        # batch are locked up front, so balances can be checked in order without further reads.
+        account_numbers = sorted({posting[0] for posting in postings})
+
+        rejects = []
+        ledger = []
+
+        with self.db.transaction() as session:
+            accounts = self.lock_accounts(session, account_numbers)
+            changed = {}
+
+            for index, (account_number, amount, kind) in enumerate(postings):
+                account = accounts.get(account_number)
+
+                if account is None:
+                    rejects.append((index, AccountNotFound.message))
+                elif account[1] + amount < 0:
+                    rejects.append((index, InsufficientFunds.message))
+                else:
+                    account[1] += amount
+                    changed[account[0]] = account[1]
+                    ledger.append((account[0], account_number, kind, amount, account[1]))
+
+            self.write_balances(session, changed, ledger)
+
+        self.invalidate(*account_numbers)
+        return rejects
+
+    def apply_transfers(self, transfers):
+        # transfers is a list of (from account, to account, amount). Each transfer debits and
+        # credits in full or not at all, all of them commit together, and both legs go into the
+        # ledger. Returns ([(index, error)], {account_number: balance after the batch}).
+        account_numbers = sorted({account for transfer in transfers for account in transfer[:2]})
+
+        rejects = []
+        ledger = []
+
+        with self.db.transaction() as session:
+            accounts = self.lock_accounts(session, account_numbers)
+            changed = {}
+
+            for index, (source_number, target_number, amount) in enumerate(transfers):
+                source = accounts.get(source_number)
+                target = accounts.get(target_number)
+
+                if amount <= 0:
+                    rejects.append((index, BankError('Transfer amount must be positive.')))
+                elif source_number == target_number:
+                    rejects.append((index, BankError('Cannot transfer to the same account.')))
+                elif source is None or target is None:
+                    missing = source_number if source is None else target_number
+                    rejects.append((index, AccountNotFound(f"Customer {missing} not found.")))
+                elif source[1] - amount < 0:
+                    rejects.append((index, InsufficientFunds('Insufficient balance. Transfer canceled.')))
+                else:
+                    source[1] -= amount
+                    target[1] += amount
+                    changed[source[0]] = source[1]
+                    changed[target[0]] = target[1]
+                    ledger.append((source[0], source_number, 'transfer_out', -amount, source[1]))
+                    ledger.append((target[0], target_number, 'transfer_in', amount, target[1]))
+
+            self.write_balances(session, changed, ledger)
+
+        self.invalidate(*account_numbers)
+        return rejects, {account_number: account[1] for account_number, account in accounts.items()}
+
+    def transfer(self, from_account, to_account, amount):
+        rejects, balances = self.apply_transfers([(from_account, to_account, amount)])
+
+        if rejects:
+            raise rejects[0][1]
+
+        return balances[from_account], balances[to_account]
+
+    def transfer_batch(self, transfers):
+        rejects, _ = self.apply_transfers(transfers)
+        return [(index, str(error)) for index, error in rejects]
+
+    def deposit(self, account_number, amount):
+        if amount <= 0:
+            raise BankError('Deposit amount must be positive.')
+
+        return self.post_transaction(account_number, amount, 'deposit')
+
+    def withdraw(self, account_number, amount):
+        if amount <= 0:
+            raise BankError('Withdrawal amount must be positive.')
+
+        return self.post_transaction(account_number, -amount, 'withdrawal')
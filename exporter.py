@@ -0,0 +1,108 @@
+import csv
+import os
+
+EXPORT_COLUMNS = ['ID', 'First Name', 'Last Name', 'Account Number', 'Balance']
+EXPORT_QUERY = "SELECT id, first_name, last_name, account_number, balance FROM customers ORDER BY id"
+EXPORT_FILTERS = "Excel Files (*.xlsx);;CSV Files (*.csv);;Parquet Files (*.parquet)"
+
+class ExportCancelled(Exception):
+    pass
+
+class CsvExportWriter:
+    def __init__(self, file_path, columns):
+        self.file = open(file_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class XlsxExportWriter:
+    def __init__(self, file_path, columns):
+        from openpyxl import Workbook
+
+        # Write-only workbooks stream rows to disk instead of keeping a cell object per value.
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Customers')
+        self.sheet.append(columns)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.file_path)
+
+class ParquetExportWriter:
+    def __init__(self, file_path, columns):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema(list(zip(columns, [
+            pyarrow.int64(),
+            pyarrow.string(),
+            pyarrow.string(),
+            pyarrow.string(),
+            pyarrow.decimal128(18, 2),
+        ])))
+        self.writer = pyarrow.parquet.ParquetWriter(file_path, self.schema)
+
+    def write_rows(self, rows):
+        arrays = [self.pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+EXPORT_WRITERS = {
+    '.xlsx': XlsxExportWriter,
+    '.csv': CsvExportWriter,
+    '.parquet': ParquetExportWriter,
+}
+
+def export_customers(connection, file_path, chunk_size=5000, progress=None, cancelled=None):
+    writer_class = EXPORT_WRITERS.get(os.path.splitext(file_path)[1].lower())
+
+    if writer_class is None:
+        raise ValueError(f"Unsupported export format: {file_path}")
+
+    # An unbuffered cursor keeps only the current chunk in memory; the rest of the
+    # result set stays on the server until it is fetched.
+    cursor = connection.cursor(buffered=False)
+    writer = writer_class(file_path, EXPORT_COLUMNS)
+    exported = 0
+
+    try:
+        cursor.execute(EXPORT_QUERY)
+
+        while True:
+            if cancelled is not None and cancelled():
+                raise ExportCancelled()
+
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            writer.write_rows(rows)
+            exported += len(rows)
+
+            if progress is not None:
+                progress(exported)
+
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    cursor.close()
+    return exported
@@ -0,0 +1,176 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+import json
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger('bankdb.slow')
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    # Literals, placeholders and value lists are collapsed so that every execution of the
+    # same statement shape lands in one series, whatever its parameters or batch size.
+    query = re.sub(r"'(?:[^'\\]|\\.)*'", '?', query)
+    query = re.sub(r'%s|\b\d+(?:\.\d+)?\b', '?', query)
+    query = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', query)
+    query = re.sub(r'(?:WHEN \? THEN \?\s*)+', 'WHEN ? THEN ? ', query)
+    return ' '.join(query.split())
+
+class Sample:
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+class Histogram:
+    def __init__(self, window):
+        # Percentiles come from a rolling window of recent samples; the bucket counts and
+        # totals are cumulative since start-up, as Prometheus expects.
+        self.samples = deque(maxlen=window)
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+    def add(self, seconds, rows, error, slow):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows or 0
+        self.errors += error
+        self.slow += slow
+
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def summary(self):
+        samples = sorted(self.samples)
+
+        def percentile(fraction):
+            return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000 if samples else 0.0
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'slow': self.slow,
+            'rows': self.rows,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': self.max * 1000,
+        }
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    def __init__(self, window=1000, slow_threshold=0.5, slow_log_size=200):
+        self.window = window
+        self.slow_threshold = slow_threshold
+
+        self.series = {}
+        self.slow_log = deque(maxlen=slow_log_size)
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(int(config['metrics_window']), float(config['slow_query_ms']) / 1000)
+
+    @contextmanager
+    def measure(self, kind, name):
+        sample = Sample()
+        error = False
+        started = time.perf_counter()
+        try:
+            yield sample
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(kind, name, time.perf_counter() - started, sample.rows, error)
+
+    def record(self, kind, name, seconds, rows=None, error=False):
+        slow = seconds >= self.slow_threshold
+
+        with self.lock:
+            histogram = self.series.get((kind, name))
+            if histogram is None:
+                histogram = self.series[(kind, name)] = Histogram(self.window)
+            histogram.add(seconds, rows, error, slow)
+
+            if slow:
+                self.slow_log.append({'time': datetime.now().isoformat(timespec='seconds'), 'kind': kind,
+                                      'name': name, 'ms': seconds * 1000, 'rows': rows, 'error': error})
+
+        if slow:
+            logger.warning("Slow %s (%.1f ms, %s rows%s): %s", kind, seconds * 1000, rows,
+                           ", failed" if error else "", name)
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.slow_log.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            series = [dict(kind=kind, name=name, **histogram.summary())
+                      for (kind, name), histogram in self.series.items()]
+            slow_log = list(self.slow_log)
+
+        series.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        return {'since': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'slow_threshold_ms': self.slow_threshold * 1000, 'series': series, 'slow': slow_log}
+
+    def prometheus(self):
+        lines = [
+            "# HELP bankdb_duration_seconds Duration of database queries and application operations.",
+            "# TYPE bankdb_duration_seconds histogram",
+        ]
+        counters = {'rows': [], 'errors': [], 'slow': []}
+
+        with self.lock:
+            for (kind, name), histogram in sorted(self.series.items()):
+                labels = f'kind="{escape_label(kind)}",name="{escape_label(name)}"'
+                cumulative = 0
+
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'bankdb_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'bankdb_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'bankdb_duration_seconds_sum{{{labels}}} {histogram.total:.6f}')
+                lines.append(f'bankdb_duration_seconds_count{{{labels}}} {histogram.count}')
+
+                counters['rows'].append(f'bankdb_rows_total{{{labels}}} {histogram.rows}')
+                counters['errors'].append(f'bankdb_errors_total{{{labels}}} {histogram.errors}')
+                counters['slow'].append(f'bankdb_slow_total{{{labels}}} {histogram.slow}')
+
+        for counter, help_text in (('rows', 'Rows returned or affected.'), ('errors', 'Failed executions.'),
+                                   ('slow', 'Executions above the slow threshold.')):
+            lines.append(f"# HELP bankdb_{counter}_total {help_text}")
+            lines.append(f"# TYPE bankdb_{counter}_total counter")
+            lines.extend(counters[counter])
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as file:
+            if file_path.endswith('.prom'):
+                file.write(self.prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=2)
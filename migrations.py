@@ -0,0 +1,425 @@
+from datetime import date
+
+from database import BankError
+from reports import SUMMARY_SLOTS, band_delta, band_update, rebuild_summaries, recount_summaries
+
+LOCK_NAME = 'bankdb_migrations'
+LOCK_TIMEOUT = 60
+PARTITION_MONTHS_AHEAD = 3
+
+# Tables partitioned by month on their timestamp column; see partition_by_month.
+PARTITIONED_TABLES = {
+    'transactions': 'created_at',
+    'audit_log': 'occurred_at',
+}
+
+def index_exists(session, table, index_name):
+    return bool(session.execute_direct(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index_name,)))
+
+def create_index(session, table, index_name, definition):
+    if not index_exists(session, table, index_name):
+        session.execute_direct(f"CREATE {definition}")
+
+def drop_index(session, table, index_name):
+    if index_exists(session, table, index_name):
+        session.execute_direct(f"DROP INDEX {index_name} ON {table}")
+
+def column_type(session, table, column):
+    rows = session.execute_direct("SELECT COLUMN_TYPE FROM information_schema.COLUMNS "
+                                  "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+                                  (table, column))
+    return rows[0][0].lower() if rows else None
+
+def partition_names(session, table):
+    rows = session.execute_direct("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                                  "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+                                  "ORDER BY PARTITION_ORDINAL_POSITION", (table,))
+    return [row[0] for row in rows]
+
+def month_start(day, offset=0):
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+def month_partition(start):
+    # Partition pYYYYMM holds the rows of that month.
+    return f"PARTITION p{start:%Y%m} VALUES LESS THAN ('{month_start(start, 1):%Y-%m-%d} 00:00:00')"
+
+def create_tables(session):
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS customers (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        first_name VARCHAR(50) NOT NULL,
+        last_name VARCHAR(50) NOT NULL,
+        account_number VARCHAR(20) UNIQUE NOT NULL,
+        balance DECIMAL(10,2) DEFAULT 0.00
+    )
+    """)
+
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS transactions (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        customer_id INT NOT NULL,
+        account_number VARCHAR(20) NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        amount DECIMAL(10,2) NOT NULL,
+        balance_after DECIMAL(10,2) NOT NULL,
+        created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        KEY idx_transactions_customer (customer_id, id),
+        KEY idx_transactions_created_at (created_at)
+    )
+    """)
+
+def create_search_indexes(session):
+    create_index(session, 'customers', 'idx_customers_last_name',
+                 "INDEX idx_customers_last_name ON customers (last_name)")
+    create_index(session, 'customers', 'idx_customers_first_name',
+                 "INDEX idx_customers_first_name ON customers (first_name)")
+    create_index(session, 'customers', 'ft_customers_names',
+                 "FULLTEXT INDEX ft_customers_names ON customers (first_name, last_name)")
+
+def widen_balances(session):
+    # DECIMAL(10,2) tops out just under 100 million; DECIMAL(15,2) leaves room for a trillion.
+    if column_type(session, 'customers', 'balance') != 'decimal(15,2)':
+        session.execute_direct("UPDATE customers SET balance = 0.00 WHERE balance IS NULL")
+        session.execute_direct("ALTER TABLE customers MODIFY balance DECIMAL(15,2) NOT NULL DEFAULT 0.00")
+
+    if column_type(session, 'transactions', 'amount') != 'decimal(15,2)':
+        session.execute_direct("ALTER TABLE transactions MODIFY amount DECIMAL(15,2) NOT NULL, "
+                               "MODIFY balance_after DECIMAL(15,2) NOT NULL")
+
+def create_post_transaction(session):
+    # Locks the account row, checks the balance, applies the change and appends the ledger
+    # entry in one transaction, so a posting costs a single round trip from the client.
+    session.execute_direct("DROP PROCEDURE IF EXISTS post_transaction")
+    session.execute_direct("""
+    CREATE PROCEDURE post_transaction(IN p_account_number VARCHAR(20), IN p_amount DECIMAL(15,2),
+                                      IN p_kind VARCHAR(20))
+    BEGIN
+        DECLARE v_customer_id INT DEFAULT NULL;
+        DECLARE v_balance DECIMAL(15,2) DEFAULT NULL;
+        DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_customer_id = NULL;
+        DECLARE EXIT HANDLER FOR SQLEXCEPTION
+        BEGIN
+            ROLLBACK;
+            RESIGNAL;
+        END;
+
+        START TRANSACTION;
+
+        SELECT id, balance INTO v_customer_id, v_balance
+        FROM customers WHERE account_number = p_account_number FOR UPDATE;
+
+        IF v_customer_id IS NULL THEN
+            ROLLBACK;
+            SELECT 'not_found', NULL;
+        ELSEIF v_balance + p_amount < 0 THEN
+            ROLLBACK;
+            SELECT 'insufficient_funds', v_balance;
+        ELSE
+            UPDATE customers SET balance = balance + p_amount WHERE id = v_customer_id;
+            INSERT INTO transactions (customer_id, account_number, kind, amount, balance_after)
+            VALUES (v_customer_id, p_account_number, p_kind, p_amount, v_balance + p_amount);
+            COMMIT;
+            SELECT 'ok', v_balance + p_amount;
+        END IF;
+    END
+    """)
+
+def create_covering_indexes(session):
+    # The list view and name searches read every customer column, so the name indexes carry
+    # them all (InnoDB appends the primary key) and are answered from the index alone. They
+    # supersede the single-column name indexes, which are dropped.
+    create_index(session, 'customers', 'idx_customers_last_name_cover',
+                 "INDEX idx_customers_last_name_cover ON customers (last_name, first_name, account_number, balance)")
+    create_index(session, 'customers', 'idx_customers_first_name_cover',
+                 "INDEX idx_customers_first_name_cover ON customers (first_name, last_name, account_number, balance)")
+    drop_index(session, 'customers', 'idx_customers_last_name')
+    drop_index(session, 'customers', 'idx_customers_first_name')
+
+    # Ledger rows are never updated, so a covering index for per-account history costs nothing
+    # beyond the insert.
+    create_index(session, 'transactions', 'idx_transactions_customer_cover',
+                 "INDEX idx_transactions_customer_cover ON transactions (customer_id, id, kind, amount, balance_after)")
+    drop_index(session, 'transactions', 'idx_transactions_customer')
+
+def create_audit_log(session):
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id BIGINT AUTO_INCREMENT,
+        occurred_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        action VARCHAR(30) NOT NULL,
+        account_number VARCHAR(20) NULL,
+        details TEXT NULL,
+        PRIMARY KEY (id, occurred_at),
+        KEY idx_audit_log_account (account_number, id)
+    )
+    """)
+
+def partition_by_month(session, table, column):
+    if partition_names(session, table):
+        return
+
+    # RANGE partitioning needs an integer expression, and UNIX_TIMESTAMP() of a TIMESTAMP(6) is a
+    # DECIMAL. RANGE COLUMNS takes a DATETIME column as it is, so the column is converted first
+    # (keeping its microseconds) and partitioned by value.
+    if column_type(session, table, column) != 'datetime(6)':
+        session.execute_direct(f"ALTER TABLE {table} MODIFY {column} DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)")
+
+    # Every unique key of a partitioned table must contain the partitioning column.
+    primary_key = session.execute_direct(f"SHOW INDEX FROM {table} WHERE Key_name = 'PRIMARY'")
+    if column not in {row[4] for row in primary_key}:
+        session.execute_direct(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})")
+
+    current = month_start(date.today())
+    partitions = [f"PARTITION p_history VALUES LESS THAN ('{current:%Y-%m-%d} 00:00:00')"]
+    partitions += [month_partition(month_start(current, offset)) for offset in range(PARTITION_MONTHS_AHEAD + 1)]
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+    session.execute_direct(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS ({column}) "
+                           f"({', '.join(partitions)})")
+
+def partition_tables(session):
+    for table, column in PARTITIONED_TABLES.items():
+        partition_by_month(session, table, column)
+
+def ensure_partitions(session, table, months_ahead=PARTITION_MONTHS_AHEAD):
+    # Splits upcoming months out of the catch-all pmax partition so that recent rows never pile
+    # up there, and old months can later be dropped as whole partitions.
+    existing = set(partition_names(session, table))
+    if 'pmax' not in existing:
+        return
+
+    current = month_start(date.today())
+    for offset in range(months_ahead + 1):
+        start = month_start(current, offset)
+        if f"p{start:%Y%m}" not in existing:
+            session.execute_direct(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                                   f"({month_partition(start)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+
+def create_change_log(session):
+    # Every write to customers, whichever path it takes (dialogs, bulk import, the ledger
+    # procedure), leaves one row here, so readers can catch up on just what changed.
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS customer_changes (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        customer_id INT NOT NULL,
+        change_type CHAR(1) NOT NULL,
+        created_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+        KEY idx_customer_changes_created_at (created_at)
+    )
+    """)
+
+    for trigger, event, change_type, row in (('customers_after_insert', 'INSERT', 'I', 'NEW'),
+                                             ('customers_after_update', 'UPDATE', 'U', 'NEW'),
+                                             ('customers_after_delete', 'DELETE', 'D', 'OLD')):
+        session.execute_direct(f"DROP TRIGGER IF EXISTS {trigger}")
+        session.execute_direct(f"CREATE TRIGGER {trigger} AFTER {event} ON customers FOR EACH ROW "
+                               f"INSERT INTO customer_changes (customer_id, change_type) VALUES ({row}.id, '{change_type}')")
+
+def create_summaries(session):
+    # Reports read these small tables instead of scanning customers and the ledger. Triggers keep
+    # them current on every write path, the same way as the change log.
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS balance_bands (
+        band TINYINT NOT NULL,
+        slot TINYINT NOT NULL,
+        accounts BIGINT NOT NULL DEFAULT 0,
+        total_cents BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (band, slot)
+    )
+    """)
+
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS daily_flows (
+        flow_date DATE NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        slot TINYINT NOT NULL,
+        entries BIGINT NOT NULL DEFAULT 0,
+        total_cents BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (flow_date, kind, slot)
+    )
+    """)
+
+    # Top-N by balance reads the end of this index backwards.
+    create_index(session, 'customers', 'idx_customers_balance',
+                 "INDEX idx_customers_balance ON customers (balance, id)")
+
+    db = session.database
+    triggers = {
+        'customers_summary_after_insert': f"AFTER INSERT ON customers FOR EACH ROW {band_update(db, 'NEW', '+')}",
+        'customers_summary_after_update': (f"AFTER UPDATE ON customers FOR EACH ROW BEGIN "
+                                           f"IF OLD.balance <> NEW.balance THEN "
+                                           f"{band_update(db, 'OLD', '-')}; {band_update(db, 'NEW', '+')}; "
+                                           f"END IF; END"),
+        'customers_summary_after_delete': f"AFTER DELETE ON customers FOR EACH ROW {band_update(db, 'OLD', '-')}",
+        'transactions_after_insert': (f"AFTER INSERT ON transactions FOR EACH ROW "
+                                      f"INSERT INTO daily_flows (flow_date, kind, slot, entries, total_cents) "
+                                      f"VALUES (DATE(NEW.created_at), NEW.kind, NEW.customer_id % {SUMMARY_SLOTS}, 1, "
+                                      f"{db.cents_sql('NEW.amount')}) "
+                                      f"ON DUPLICATE KEY UPDATE entries = entries + 1, "
+                                      f"total_cents = total_cents + VALUES(total_cents)"),
+    }
+
+    for trigger, definition in triggers.items():
+        session.execute_direct(f"DROP TRIGGER IF EXISTS {trigger}")
+        session.execute_direct(f"CREATE TRIGGER {trigger} {definition}")
+
+    rebuild_summaries(session)
+
+def add_customer_versions(session):
+    # Every write to a customer row bumps its version, so a writer can tell whether the row is
+    # still what it read (see BankService.update_customer). The procedure is replaced by one that
+    # does so; migration 4 keeps its original definition.
+    if column_type(session, 'customers', 'version') is None:
+        session.execute_direct("ALTER TABLE customers ADD COLUMN version INT UNSIGNED NOT NULL DEFAULT 0")
+
+    session.execute_direct("DROP PROCEDURE IF EXISTS post_transaction")
+    session.execute_direct("""
+    CREATE PROCEDURE post_transaction(IN p_account_number VARCHAR(20), IN p_amount DECIMAL(15,2),
+                                      IN p_kind VARCHAR(20))
+    BEGIN
+        DECLARE v_customer_id INT DEFAULT NULL;
+        DECLARE v_balance DECIMAL(15,2) DEFAULT NULL;
+        DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_customer_id = NULL;
+        DECLARE EXIT HANDLER FOR SQLEXCEPTION
+        BEGIN
+            ROLLBACK;
+            RESIGNAL;
+        END;
+
+        START TRANSACTION;
+
+        SELECT id, balance INTO v_customer_id, v_balance
+        FROM customers WHERE account_number = p_account_number FOR UPDATE;
+
+        IF v_customer_id IS NULL THEN
+            ROLLBACK;
+            SELECT 'not_found', NULL;
+        ELSEIF v_balance + p_amount < 0 THEN
+            ROLLBACK;
+            SELECT 'insufficient_funds', v_balance;
+        ELSE
+            UPDATE customers SET balance = balance + p_amount, version = version + 1 WHERE id = v_customer_id;
+            INSERT INTO transactions (customer_id, account_number, kind, amount, balance_after)
+            VALUES (v_customer_id, p_account_number, p_kind, p_amount, v_balance + p_amount);
+            COMMIT;
+            SELECT 'ok', v_balance + p_amount;
+        END IF;
+    END
+    """)
+
+def add_audit_actor(session):
+    if column_type(session, 'audit_log', 'actor') is None:
+        session.execute_direct("ALTER TABLE audit_log ADD COLUMN actor VARCHAR(64) NULL AFTER account_number")
+
+def create_sort_indexes(session):
+    # The list view pages through name sorts on (last_name, first_name, id). InnoDB appends the
+    # primary key after every indexed column, so the covering name indexes break ties by account
+    # number instead and such a sort would need a filesort. Placing id right after the names
+    # serves the sort and still covers the list view and name searches. Balance sorts use
+    # idx_customers_balance and account number sorts the unique key.
+    create_index(session, 'customers', 'idx_customers_last_name_sort',
+                 "INDEX idx_customers_last_name_sort ON customers (last_name, first_name, id, account_number, balance)")
+    create_index(session, 'customers', 'idx_customers_first_name_sort',
+                 "INDEX idx_customers_first_name_sort ON customers (first_name, last_name, id, account_number, balance)")
+    drop_index(session, 'customers', 'idx_customers_last_name_cover')
+    drop_index(session, 'customers', 'idx_customers_first_name_cover')
+
+def create_summary_deltas(session):
+    # Migration 9's triggers update shared counter rows inside every posting, in whatever order
+    # the postings touch customers, so two transfers can deadlock on them and a long batch holds
+    # them until it commits. Postings now only insert into these tables; readers add the deltas
+    # and compact_summaries folds them into the counters.
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS balance_band_deltas (
+        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        band TINYINT NOT NULL,
+        accounts INT NOT NULL,
+        total_cents BIGINT NOT NULL
+    )
+    """)
+
+    session.execute_direct("""
+    CREATE TABLE IF NOT EXISTS daily_flow_deltas (
+        id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        flow_date DATE NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        entries INT NOT NULL,
+        total_cents BIGINT NOT NULL
+    )
+    """)
+
+    db = session.database
+    insert_bands = "INSERT INTO balance_band_deltas (band, accounts, total_cents) VALUES"
+    triggers = {
+        'customers_summary_after_insert': f"AFTER INSERT ON customers FOR EACH ROW {insert_bands} {band_delta(db, 'NEW', 1)}",
+        'customers_summary_after_update': (f"AFTER UPDATE ON customers FOR EACH ROW BEGIN "
+                                           f"IF OLD.balance <> NEW.balance THEN "
+                                           f"{insert_bands} {band_delta(db, 'OLD', -1)}, {band_delta(db, 'NEW', 1)}; "
+                                           f"END IF; END"),
+        'customers_summary_after_delete': f"AFTER DELETE ON customers FOR EACH ROW {insert_bands} {band_delta(db, 'OLD', -1)}",
+        'transactions_after_insert': (f"AFTER INSERT ON transactions FOR EACH ROW "
+                                      f"INSERT INTO daily_flow_deltas (flow_date, kind, entries, total_cents) "
+                                      f"VALUES (DATE(NEW.created_at), NEW.kind, 1, {db.cents_sql('NEW.amount')})"),
+    }
+
+    for trigger, definition in triggers.items():
+        session.execute_direct(f"DROP TRIGGER IF EXISTS {trigger}")
+        session.execute_direct(f"CREATE TRIGGER {trigger} {definition}")
+
+    # Anything posted between dropping the old triggers and creating the new ones is recounted.
+    recount_summaries(session)
+
+# Applied in order, each exactly once per database. Every step is also written to be safe on a
+# schema that already has its changes, since older releases created parts of it ad hoc.
+MIGRATIONS = (
+    (1, 'customers and transactions tables', create_tables),
+    (2, 'name search indexes', create_search_indexes),
+    (3, 'widen balance columns to DECIMAL(15,2)', widen_balances),
+    (4, 'post_transaction procedure', create_post_transaction),
+    (5, 'covering indexes for list view and ledger', create_covering_indexes),
+    (6, 'audit_log table', create_audit_log),
+    (7, 'monthly partitions for transactions and audit_log', partition_tables),
+    (8, 'customer change log and triggers', create_change_log),
+    (9, 'balance band and daily flow summaries', create_summaries),
+    (10, 'customer row versions', add_customer_versions),
+    (11, 'audit log actor', add_audit_actor),
+    (12, 'customer sort indexes', create_sort_indexes),
+    (13, 'append-only summary deltas', create_summary_deltas),
+)
+
+def migrate(db):
+    create_migrations_query = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+
+    applied = []
+
+    with db.session() as session:
+        # A named lock keeps two instances starting at once from running the same DDL twice.
+        if not session.execute_direct("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))[0][0]:
+            raise BankError('Another process is upgrading the database schema. Try again shortly.')
+
+        try:
+            session.execute_direct(create_migrations_query)
+            done = {row[0] for row in session.execute_direct("SELECT version FROM schema_migrations")}
+
+            for version, name, upgrade in MIGRATIONS:
+                if version in done:
+                    continue
+
+                upgrade(session)
+                session.execute_direct("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                       (version, name))
+                applied.append(version)
+
+            for table in PARTITIONED_TABLES:
+                ensure_partitions(session, table)
+        finally:
+            session.execute_direct("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+
+    return applied
@@ -0,0 +1,185 @@
+from datetime import date
+from decimal import Decimal
+
+# Lower bounds of the balance bands, in whole currency units. Band 0 holds negative balances
+# and the last band everything from the last bound up.
+BALANCE_BANDS = (0, 100, 1000, 10000, 100000, 1000000)
+
+# The summary tables keep one row per band (or day and kind) and slot. Migration 9's triggers
+# spread postings over the slots by customer id; since migration 13 postings only append to the
+# delta tables and compaction folds those into slot 0. Readers sum over the slots and deltas.
+SUMMARY_SLOTS = 16
+
+# Delta rows folded into the summary tables per compaction.
+COMPACT_BATCH = 10000
+
+def band_label(band):
+    if band == 0:
+        return f"below {BALANCE_BANDS[0]:,}"
+    if band == len(BALANCE_BANDS):
+        return f"{BALANCE_BANDS[-1]:,} and over"
+    return f"{BALANCE_BANDS[band - 1]:,} to {BALANCE_BANDS[band]:,}"
+
+def band_case(cents):
+    whens = " ".join(f"WHEN {cents} < {bound * 100} THEN {band}" for band, bound in enumerate(BALANCE_BANDS))
+    return f"CASE {whens} ELSE {len(BALANCE_BANDS)} END"
+
+def from_cents(value):
+    return Decimal(int(value or 0)).scaleb(-2)
+
+def band_update(db, row, sign):
+    # Moves one customer row (NEW or OLD inside a trigger) into or out of its balance band.
+    cents = db.cents_sql(f"{row}.balance")
+    return (f"UPDATE balance_bands SET accounts = accounts {sign} 1, total_cents = total_cents {sign} {cents} "
+            f"WHERE band = {band_case(cents)} AND slot = {row}.id % {SUMMARY_SLOTS}")
+
+def band_delta(db, row, sign):
+    # The balance_band_deltas values that move one customer row into (1) or out of (-1) its band.
+    cents = db.cents_sql(f"{row}.balance")
+    return f"({band_case(cents)}, {sign}, {sign} * {cents})"
+
+def add_to_summary(session, table, key, values):
+    # Only compaction writes the summary tables, one at a time, so update-or-insert is safe here.
+    # Deltas that cancel out are skipped; an UPDATE that changes nothing may report no rows.
+    if not any(values.values()):
+        return
+
+    where = " AND ".join(f"{column} = %s" for column in key)
+    updates = ", ".join(f"{column} = {column} + %s" for column in values)
+
+    if not session.execute(f"UPDATE {table} SET {updates} WHERE {where}",
+                           tuple(values.values()) + tuple(key.values())).rowcount:
+        columns = tuple(key) + tuple(values)
+        session.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                        tuple(key.values()) + tuple(values.values()))
+
+def compact_summaries(session, limit=COMPACT_BATCH):
+    # Folds up to `limit` delta rows of each kind into the summary tables and deletes them.
+    # Compactions queue on the band rows, which postings never touch, so each delta is folded
+    # once. The plain reads only see committed deltas and those are deleted by id, so nothing
+    # here waits on a posting in progress or blocks one from appending.
+    session.execute_direct(f"SELECT band, slot FROM balance_bands ORDER BY band, slot{session.database.lock_clause}")
+    folded = 0
+
+    bands = {}
+    deltas = session.execute_direct("SELECT id, band, accounts, total_cents FROM balance_band_deltas "
+                                    "ORDER BY id LIMIT %s", (limit,))
+    for _, band, accounts, total_cents in deltas:
+        totals = bands.setdefault(int(band), [0, 0])
+        totals[0] += int(accounts)
+        totals[1] += int(total_cents)
+
+    for band, (accounts, total_cents) in sorted(bands.items()):
+        add_to_summary(session, 'balance_bands', {'band': band, 'slot': 0},
+                       {'accounts': accounts, 'total_cents': total_cents})
+    folded += delete_deltas(session, 'balance_band_deltas', [row[0] for row in deltas])
+
+    flows = {}
+    deltas = session.execute_direct("SELECT id, flow_date, kind, entries, total_cents FROM daily_flow_deltas "
+                                    "ORDER BY id LIMIT %s", (limit,))
+    for _, flow_date, kind, entries, total_cents in deltas:
+        totals = flows.setdefault((flow_date, kind), [0, 0])
+        totals[0] += int(entries)
+        totals[1] += int(total_cents)
+
+    for (flow_date, kind), (entries, total_cents) in sorted(flows.items()):
+        add_to_summary(session, 'daily_flows', {'flow_date': flow_date, 'kind': kind, 'slot': 0},
+                       {'entries': entries, 'total_cents': total_cents})
+    folded += delete_deltas(session, 'daily_flow_deltas', [row[0] for row in deltas])
+
+    return folded
+
+def delete_deltas(session, table, ids, chunk=1000):
+    for start in range(0, len(ids), chunk):
+        part = ids[start:start + chunk]
+        session.execute_direct(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(part))})", part)
+    return len(ids)
+
+def rebuild_summaries(session):
+    # Recomputes both summary tables from the base tables with one scan each. The triggers keep
+    # them current afterwards; this is only needed once, or to repair them.
+    cents = session.database.cents_sql
+    balance_cents = cents('balance')
+
+    session.execute_direct("DELETE FROM balance_bands")
+    session.execute_direct(f"INSERT INTO balance_bands (band, slot, accounts, total_cents) "
+                           f"SELECT band, slot, COUNT(*), SUM(cents) FROM ("
+                           f"SELECT {band_case(balance_cents)} AS band, id % {SUMMARY_SLOTS} AS slot, "
+                           f"{balance_cents} AS cents FROM customers) balances GROUP BY band, slot")
+
+    # The band triggers only update existing rows, so every band and slot needs one.
+    existing = set(session.execute_direct("SELECT band, slot FROM balance_bands"))
+    missing = [(band, slot, 0, 0) for band in range(len(BALANCE_BANDS) + 1) for slot in range(SUMMARY_SLOTS)
+               if (band, slot) not in existing]
+    if missing:
+        session.executemany("INSERT INTO balance_bands (band, slot, accounts, total_cents) VALUES (%s, %s, %s, %s)",
+                            missing)
+
+    session.execute_direct("DELETE FROM daily_flows")
+    session.execute_direct(f"INSERT INTO daily_flows (flow_date, kind, slot, entries, total_cents) "
+                           f"SELECT DATE(created_at), kind, customer_id % {SUMMARY_SLOTS}, COUNT(*), "
+                           f"SUM({cents('amount')}) FROM transactions "
+                           f"GROUP BY DATE(created_at), kind, customer_id % {SUMMARY_SLOTS}")
+
+def recount_summaries(session):
+    # rebuild_summaries for a schema with delta tables. It is a repair: recounting from the base
+    # tables holds locks on them until it commits.
+    session.execute_direct(f"SELECT band, slot FROM balance_bands ORDER BY band, slot{session.database.lock_clause}")
+    session.execute_direct("DELETE FROM balance_band_deltas")
+    session.execute_direct("DELETE FROM daily_flow_deltas")
+    rebuild_summaries(session)
+
+class ReportRepository:
+    def __init__(self, db):
+        self.db = db
+
+    def balance_bands(self):
+        select_query = ("SELECT band, SUM(accounts), SUM(total_cents) FROM ("
+                        "SELECT band, accounts, total_cents FROM balance_bands UNION ALL "
+                        "SELECT band, accounts, total_cents FROM balance_band_deltas) bands "
+                        "GROUP BY band ORDER BY band")
+
+        with self.db.session() as session:
+            return session.fetchall(select_query)
+
+    def flow_totals(self):
+        select_query = ("SELECT kind, SUM(entries), SUM(total_cents) FROM ("
+                        "SELECT kind, entries, total_cents FROM daily_flows UNION ALL "
+                        "SELECT kind, entries, total_cents FROM daily_flow_deltas) flows "
+                        "GROUP BY kind ORDER BY kind")
+
+        with self.db.session() as session:
+            return session.fetchall(select_query)
+
+    def today(self):
+        # The date DATE(created_at) gives a ledger row written now: session time on MySQL, UTC on
+        # SQLite. Report windows count back from it, not from the client's clock.
+        select_query = "SELECT CURRENT_DATE"
+
+        with self.db.session() as session:
+            return date.fromisoformat(str(session.fetchone(select_query)[0]))
+
+    def daily_flows(self, since):
+        select_query = ("SELECT flow_date, kind, SUM(entries), SUM(total_cents) FROM ("
+                        "SELECT flow_date, kind, entries, total_cents FROM daily_flows WHERE flow_date >= %s "
+                        "UNION ALL SELECT flow_date, kind, entries, total_cents FROM daily_flow_deltas "
+                        "WHERE flow_date >= %s) flows "
+                        "GROUP BY flow_date, kind ORDER BY flow_date DESC, kind")
+
+        with self.db.session() as session:
+            return session.fetchall(select_query, (since.isoformat(), since.isoformat()))
+
+    def top_accounts(self, limit):
+        select_query = (f"SELECT id, first_name, last_name, account_number, balance FROM customers "
+                        f"ORDER BY {self.db.balance_sort_key} DESC, id DESC LIMIT %s")
+
+        with self.db.session() as session:
+            return session.fetchall(select_query, (limit,))
+
+    def compact(self):
+        with self.db.transaction() as session:
+            return compact_summaries(session)
+
+    def rebuild(self):
+        with self.db.transaction() as session:
+            recount_summaries(session)
@@ -0,0 +1,336 @@
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from audit import AuditLog
+from bulk import MAX_AMOUNT, check_amount
+from cache import AccountCache
+from database import (AccountNotFound, BankError, CustomerRepository, UpdateConflict, integrity_errors, load_config,
+                      open_database, parse_sort)
+from reports import ReportRepository, band_label, from_cents
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class BankService:
+    # Attempts after a version conflict that turned out to involve none of the fields being written.
+    update_retries = 3
+
+    # Seconds between change log prunes in long-running front ends (the API server, the GUI).
+    prune_interval = 3600
+
+    # Seconds between folding the report deltas into their summary tables (see compact_summaries).
+    compact_interval = 60
+
+    def __init__(self, customers, audit=None):
+        self.customers = customers
+        self.db = customers.db
+        self.reports = ReportRepository(self.db)
+        self.audit = audit
+
+    @classmethod
+    def from_config(cls, config=None):
+        config = load_config() if config is None else config
+        db = open_database(config)
+        return cls(db.repository(AccountCache.from_config(config)), AuditLog.from_config(db, config))
+
+    def close(self):
+        if self.audit is not None:
+            self.audit.close()
+        self.db.close()
+
+    def record(self, action, account_number, details=None):
+        if self.audit is not None:
+            self.audit.record(action, account_number, details)
+
+    @staticmethod
+    def customer_dict(row):
+        return dict(zip(CustomerRepository.columns, row))
+
+    @staticmethod
+    def parse_decimal(value, message):
+        if not isinstance(value, Decimal):
+            try:
+                value = Decimal(str(value).strip())
+            except InvalidOperation:
+                raise BankError(message)
+
+        if not value.is_finite():
+            raise BankError(message)
+
+        try:
+            return check_amount(value, str(value))
+        except ValueError as e:
+            raise BankError(f"{e}. Amounts must be below {MAX_AMOUNT:,} and have at most two decimal places.")
+
+    def parse_amount(self, value):
+        if value is None or str(value).strip() == '':
+            raise BankError('Please enter an amount.')
+
+        amount = self.parse_decimal(value, 'Invalid amount. Please enter a valid decimal value.')
+        if amount <= 0:
+            raise BankError('Amount must be greater than zero.')
+
+        return amount
+
+    def cache_stats(self):
+        return self.customers.cache.stats() if self.customers.cache is not None else None
+
+    def metrics_snapshot(self):
+        return self.db.metrics.snapshot()
+
+    def setup_database(self):
+        created = not self.db.database_exists()
+
+        if created:
+            self.db.create_database()
+
+        self.upgrade_schema()
+        return created
+
+    def check_database(self):
+        if not self.db.database_exists():
+            return False
+
+        self.upgrade_schema()
+        return True
+
+    def upgrade_schema(self):
+        applied = self.db.migrate()
+
+        if applied and self.customers.cache is not None:
+            self.customers.cache.clear()
+
+        self.customers.prune_changes()
+        return applied
+
+    def prune_changes(self):
+        return self.customers.prune_changes()
+
+    def get_customer(self, account_number):
+        result = self.customers.find(account_number)
+
+        if not result:
+            raise AccountNotFound()
+
+        return self.customer_dict(result)
+
+    @staticmethod
+    def check_limit(limit):
+        # LIMIT -1 means no limit at all on SQLite.
+        if not isinstance(limit, int) or limit < 1:
+            raise BankError('The number of rows to return must be at least 1.')
+
+    def list_customers(self, after_id=None, limit=100, search='', sort=''):
+        self.check_limit(limit)
+        order = parse_sort(sort)
+        after = after_id
+
+        # Sorted listings continue after the sort key of the last customer seen.
+        if order and after_id is not None:
+            after = self.customers.sort_key(after_id, order)
+            if after is None:
+                raise AccountNotFound(f"No customer with id {after_id}.")
+
+        return [self.customer_dict(row) for row in self.customers.page(after, limit, search, order=order)]
+
+    def customer_changes(self, after=0, limit=1000):
+        self.check_limit(limit)
+        change_id, changes = self.customers.changes_since(after, limit)
+
+        if changes is None:
+            return {'last_change_id': change_id, 'truncated': True, 'changed': [], 'deleted': []}
+
+        return {
+            'last_change_id': change_id,
+            'truncated': False,
+            'changed': [self.customer_dict(row) for row in changes.values() if row is not None],
+            'deleted': [customer_id for customer_id, row in changes.items() if row is None],
+        }
+
+    def report(self, top=10, days=30):
+        if top < 1 or days < 1:
+            raise BankError('The number of accounts and days must be positive.')
+
+        bands = [{'band': band_label(band), 'accounts': int(accounts), 'total': from_cents(total)}
+                 for band, accounts, total in self.reports.balance_bands()]
+        accounts = sum(band['accounts'] for band in bands)
+        total_balance = sum((band['total'] for band in bands), Decimal('0.00'))
+
+        flows = {kind: {'entries': int(entries), 'total': from_cents(total)}
+                 for kind, entries, total in self.reports.flow_totals()}
+
+        # Postings are signed, so a day's inflow and outflow are its positive and negative kinds.
+        daily = {}
+        for flow_date, kind, entries, total in self.reports.daily_flows(self.reports.today() - timedelta(days=days - 1)):
+            day = daily.setdefault(str(flow_date), {'date': str(flow_date), 'entries': 0, 'inflow': Decimal('0.00'),
+                                                    'outflow': Decimal('0.00'), 'net': Decimal('0.00')})
+            total = from_cents(total)
+            day['entries'] += int(entries)
+            day['inflow' if total >= 0 else 'outflow'] += abs(total)
+            day['net'] += total
+
+        return {
+            'accounts': accounts,
+            'total_balance': total_balance,
+            'average_balance': (total_balance / accounts).quantize(Decimal('0.01')) if accounts else Decimal('0.00'),
+            'total_deposits': flows.get('deposit', {}).get('total', Decimal('0.00')),
+            'total_withdrawals': -flows.get('withdrawal', {}).get('total', Decimal('0.00')),
+            'flows_by_kind': flows,
+            'balance_bands': bands,
+            'top_accounts': [self.customer_dict(row) for row in self.reports.top_accounts(top)],
+            'daily_flows': list(daily.values()),
+        }
+
+    def rebuild_reports(self):
+        self.reports.rebuild()
+
+    def compact_reports(self):
+        return self.reports.compact()
+
+    def add_customer(self, first_name, last_name, account_number, balance):
+        if not first_name or not last_name or not account_number or balance in (None, ''):
+            raise BankError('Please fill in all fields.')
+        if not all(isinstance(value, str) for value in (first_name, last_name, account_number)):
+            raise BankError('Names and account numbers must be text.')
+
+        balance = self.parse_decimal(balance, 'Invalid balance. Please enter a valid decimal value.')
+        duplicate = BankError('Account number already exists. Please enter a different account number.')
+
+        if self.customers.find(account_number):
+            raise duplicate
+
+        try:
+            customer_id = self.customers.add(first_name, last_name, account_number, balance)
+        except integrity_errors():
+            raise duplicate
+
+        self.record('add_customer', account_number, {'first_name': first_name, 'last_name': last_name,
+                                                     'balance': balance})
+        return self.customer_dict((customer_id, first_name, last_name, account_number, balance, 0))
+
+    def current_customer(self, account_number):
+        result = self.customers.find(account_number, cached=False)
+
+        if not result:
+            raise AccountNotFound()
+
+        return self.customer_dict(result)
+
+    def update_customer(self, account_number, first_name=None, last_name=None, balance=None, expected=None):
+        # expected is the customer as the caller last saw it (at least its version). Only fields
+        # that are given and differ from the stored row are written, guarded by the row version.
+        # If the row moved on in between, the write is retried as long as none of those fields
+        # were changed by someone else since the caller's view; otherwise it is a conflict.
+        if not any([first_name, last_name, balance not in (None, '')]):
+            raise BankError('Please fill in at least one field.')
+        if not all(isinstance(value, str) for value in (first_name, last_name) if value):
+            raise BankError('Names must be text.')
+        if expected is not None and type(expected.get('version')) is not int:
+            raise BankError('The expected version must be a whole number.')
+
+        requested = {}
+
+        if first_name:
+            requested['first_name'] = first_name
+        if last_name:
+            requested['last_name'] = last_name
+        if balance not in (None, ''):
+            requested['balance'] = self.parse_decimal(balance, 'Invalid balance. Please enter a valid decimal value.')
+
+        current = self.current_customer(account_number)
+        base = current if expected is None else expected
+
+        for _ in range(self.update_retries + 1):
+            if current['version'] != base.get('version'):
+                # A caller that sent only a version cannot say which fields it saw; any newer
+                # version is a conflict, without blaming particular fields.
+                if not any(field in base for field in self.customers.updatable_columns):
+                    raise UpdateConflict(current)
+
+                stale = [field for field in requested if field not in base or current[field] != base[field]]
+                if stale:
+                    raise UpdateConflict(current, stale)
+
+            update_fields = [(field, value) for field, value in requested.items() if value != current[field]]
+            if not update_fields:
+                return current
+
+            if self.customers.update(account_number, update_fields, current['version']):
+                self.record('update_customer', account_number,
+                            {field: {'old': current[field], 'new': value} for field, value in update_fields})
+                return dict(current, **dict(update_fields), version=current['version'] + 1)
+
+            current = self.current_customer(account_number)
+
+        raise UpdateConflict(current)
+
+    def delete_customer(self, account_number):
+        if not self.customers.delete(account_number):
+            raise AccountNotFound()
+
+        self.record('delete_customer', account_number)
+
+    def deposit(self, account_number, amount):
+        amount = self.parse_amount(amount)
+        balance = self.customers.deposit(account_number, amount)
+
+        self.record('deposit', account_number, {'amount': amount, 'balance': balance})
+        return balance
+
+    def withdraw(self, account_number, amount):
+        amount = self.parse_amount(amount)
+        balance = self.customers.withdraw(account_number, amount)
+
+        self.record('withdraw', account_number, {'amount': amount, 'balance': balance})
+        return balance
+
+    def parse_transfer(self, from_account, to_account, amount):
+        if not from_account or not to_account:
+            raise BankError('Please enter both account numbers.')
+        if not isinstance(from_account, str) or not isinstance(to_account, str):
+            raise BankError('Account numbers must be text.')
+        if from_account == to_account:
+            raise BankError('Cannot transfer to the same account.')
+
+        return from_account, to_account, self.parse_amount(amount)
+
+    def transfer(self, from_account, to_account, amount):
+        transfer = self.parse_transfer(from_account, to_account, amount)
+        from_balance, to_balance = self.customers.transfer(*transfer)
+
+        self.record('transfer', from_account, {'to_account': to_account, 'amount': transfer[2],
+                                               'from_balance': from_balance, 'to_balance': to_balance})
+        return {'from_account': from_account, 'to_account': to_account, 'amount': transfer[2],
+                'from_balance': from_balance, 'to_balance': to_balance}
+
+    def transfer_batch(self, transfers):
+        # transfers is a list of {'from_account', 'to_account', 'amount'}; the valid ones are
+        # executed in one transaction and the rest reported by index.
+        if not isinstance(transfers, list) or not all(isinstance(transfer, dict) for transfer in transfers):
+            raise BankError('Transfers must be a list of objects with from_account, to_account and amount.')
+
+        rejects = []
+        valid = []
+
+        for index, transfer in enumerate(transfers):
+            try:
+                valid.append((index, self.parse_transfer(transfer.get('from_account'), transfer.get('to_account'),
+                                                         transfer.get('amount'))))
+            except BankError as e:
+                rejects.append({'index': index, 'error': str(e)})
+
+        if valid:
+            failed = dict(self.customers.transfer_batch([transfer for _, transfer in valid]))
+
+            for position, (index, (from_account, to_account, amount)) in enumerate(valid):
+                if position in failed:
+                    rejects.append({'index': index, 'error': failed[position]})
+                else:
+                    self.record('transfer', from_account, {'to_account': to_account, 'amount': amount})
+
+        rejects.sort(key=lambda reject: reject['index'])
+        return {'accepted': len(transfers) - len(rejects), 'rejected': rejects}
@@ -0,0 +1,61 @@
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+from itertools import accumulate
+import sys
+
+class CustomerSnapshot:
+    # Customer rows (id, first_name, last_name, account_number, balance) stored column by column:
+    # ids and balances (in cents) as machine integers, names interned so that repeated names
+    # share one string, and account numbers packed into one string with end offsets. index_of
+    # needs the rows in id order, as pages of the unsorted list are; find works in any order.
+    __slots__ = ('ids', 'first_names', 'last_names', 'accounts', 'account_ends', 'balances')
+
+    def __init__(self, rows=()):
+        self.ids = array('q', (row[0] for row in rows))
+        self.first_names = [sys.intern(row[1]) for row in rows]
+        self.last_names = [sys.intern(row[2]) for row in rows]
+        self.accounts = ''.join(row[3] for row in rows)
+        self.account_ends = array('i', accumulate(len(row[3]) for row in rows))
+        self.balances = array('q', (int(row[4] * 100) for row in rows))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def account_number(self, index):
+        start = self.account_ends[index - 1] if index else 0
+        return self.accounts[start:self.account_ends[index]]
+
+    def balance(self, index):
+        return Decimal(self.balances[index]).scaleb(-2)
+
+    def row(self, index):
+        return (self.ids[index], self.first_names[index], self.last_names[index], self.account_number(index),
+                self.balance(index))
+
+    def display(self, index, column):
+        if column == 0:
+            return str(self.ids[index])
+        if column == 1:
+            return self.first_names[index]
+        if column == 2:
+            return self.last_names[index]
+        if column == 3:
+            return self.account_number(index)
+        return str(self.balance(index))
+
+    def index_of(self, customer_id):
+        index = bisect_left(self.ids, customer_id)
+        return index if index < len(self.ids) and self.ids[index] == customer_id else -1
+
+    def find(self, customer_id):
+        try:
+            return self.ids.index(customer_id)
+        except ValueError:
+            return -1
+
+    def replace(self, index, row):
+        # Live updates touch a handful of rows per poll, so repacking the page is cheap enough.
+        rows = [self.row(i) for i in range(len(self))]
+        rows[index] = row
+        self.__init__(rows)
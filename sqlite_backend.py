@@ -0,0 +1,405 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+import os
+import sqlite3
+import threading
+import weakref
+
+from database import AccountNotFound, CustomerRepository, InsufficientFunds, Session, logger
+from metrics import Metrics
+from reports import SUMMARY_SLOTS, band_delta, band_update, rebuild_summaries, recount_summaries
+
+CENTS = Decimal('0.01')
+
+# Balances are stored as exact decimal text, rounded to cents like a DECIMAL(15,2) column; the
+# declared type gives the columns TEXT affinity and lets the converter hand them back as Decimal.
+sqlite3.register_adapter(Decimal, lambda value: str(value.quantize(CENTS, ROUND_HALF_UP)))
+sqlite3.register_converter('DECIMAL_TEXT', lambda value: Decimal(value.decode()))
+
+SQLITE_INTERRUPT = 9
+
+class SQLiteCursor(sqlite3.Cursor):
+    # Accepts the %s placeholders the repository SQL is written with.
+    def execute(self, query, data=()):
+        return super().execute(query.replace('%s', '?'), data)
+
+    def executemany(self, query, data):
+        return super().executemany(query.replace('%s', '?'), data)
+
+    @property
+    def with_rows(self):
+        return self.description is not None
+
+class SQLiteConnection(sqlite3.Connection):
+    # Quacks like a mysql.connector connection where the rest of the code relies on it.
+    def cursor(self, buffered=None, prepared=None):
+        return super().cursor(SQLiteCursor)
+
+    @property
+    def connection_id(self):
+        return id(self)
+
+    def is_connected(self):
+        try:
+            self.total_changes
+        except sqlite3.ProgrammingError:
+            return False
+        return True
+
+def create_tables(session):
+    statements = (
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name VARCHAR(50) NOT NULL,
+            last_name VARCHAR(50) NOT NULL,
+            account_number VARCHAR(20) UNIQUE NOT NULL,
+            balance DECIMAL_TEXT NOT NULL DEFAULT '0.00'
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_customers_last_name ON customers (last_name, first_name)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_first_name ON customers (first_name, last_name)",
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            account_number VARCHAR(20) NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            amount DECIMAL_TEXT NOT NULL,
+            balance_after DECIMAL_TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_transactions_customer ON transactions (customer_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            occurred_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            action VARCHAR(30) NOT NULL,
+            account_number VARCHAR(20) NULL,
+            details TEXT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_audit_log_account ON audit_log (account_number, id)",
+        """
+        CREATE TABLE IF NOT EXISTS customer_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            change_type CHAR(1) NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_customer_changes_created_at ON customer_changes (created_at)",
+    )
+
+    for statement in statements:
+        session.execute_direct(statement)
+
+    for trigger, event, change_type, row in (('customers_after_insert', 'INSERT', 'I', 'NEW'),
+                                             ('customers_after_update', 'UPDATE', 'U', 'NEW'),
+                                             ('customers_after_delete', 'DELETE', 'D', 'OLD')):
+        session.execute_direct(f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON customers BEGIN "
+                               f"INSERT INTO customer_changes (customer_id, change_type) "
+                               f"VALUES ({row}.id, '{change_type}'); END")
+
+def create_summaries(session):
+    statements = (
+        """
+        CREATE TABLE IF NOT EXISTS balance_bands (
+            band INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            accounts INTEGER NOT NULL DEFAULT 0,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (band, slot)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_flows (
+            flow_date TEXT NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            slot INTEGER NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (flow_date, kind, slot)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_customers_balance ON customers (CAST(balance AS REAL), id)",
+    )
+
+    for statement in statements:
+        session.execute_direct(statement)
+
+    db = session.database
+    session.execute_direct(f"CREATE TRIGGER IF NOT EXISTS customers_summary_after_insert AFTER INSERT ON customers "
+                           f"BEGIN {band_update(db, 'NEW', '+')}; END")
+    session.execute_direct(f"CREATE TRIGGER IF NOT EXISTS customers_summary_after_update AFTER UPDATE OF balance "
+                           f"ON customers WHEN OLD.balance <> NEW.balance "
+                           f"BEGIN {band_update(db, 'OLD', '-')}; {band_update(db, 'NEW', '+')}; END")
+    session.execute_direct(f"CREATE TRIGGER IF NOT EXISTS customers_summary_after_delete AFTER DELETE ON customers "
+                           f"BEGIN {band_update(db, 'OLD', '-')}; END")
+    session.execute_direct(f"CREATE TRIGGER IF NOT EXISTS transactions_after_insert AFTER INSERT ON transactions "
+                           f"BEGIN INSERT INTO daily_flows (flow_date, kind, slot, entries, total_cents) "
+                           f"VALUES (DATE(NEW.created_at), NEW.kind, NEW.customer_id % {SUMMARY_SLOTS}, 1, "
+                           f"{db.cents_sql('NEW.amount')}) "
+                           f"ON CONFLICT (flow_date, kind, slot) DO UPDATE SET entries = entries + 1, "
+                           f"total_cents = total_cents + excluded.total_cents; END")
+
+    rebuild_summaries(session)
+
+def create_summary_deltas(session):
+    statements = (
+        """
+        CREATE TABLE IF NOT EXISTS balance_band_deltas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            band INTEGER NOT NULL,
+            accounts INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS daily_flow_deltas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flow_date TEXT NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            entries INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL
+        )
+        """,
+    )
+
+    for statement in statements:
+        session.execute_direct(statement)
+
+    db = session.database
+    insert_bands = "INSERT INTO balance_band_deltas (band, accounts, total_cents) VALUES"
+    triggers = {
+        'customers_summary_after_insert': f"AFTER INSERT ON customers BEGIN {insert_bands} {band_delta(db, 'NEW', 1)}; END",
+        'customers_summary_after_update': (f"AFTER UPDATE OF balance ON customers WHEN OLD.balance <> NEW.balance BEGIN "
+                                           f"{insert_bands} {band_delta(db, 'OLD', -1)}, {band_delta(db, 'NEW', 1)}; END"),
+        'customers_summary_after_delete': f"AFTER DELETE ON customers BEGIN {insert_bands} {band_delta(db, 'OLD', -1)}; END",
+        'transactions_after_insert': (f"AFTER INSERT ON transactions BEGIN "
+                                      f"INSERT INTO daily_flow_deltas (flow_date, kind, entries, total_cents) "
+                                      f"VALUES (DATE(NEW.created_at), NEW.kind, 1, {db.cents_sql('NEW.amount')}); END"),
+    }
+
+    for trigger, definition in triggers.items():
+        session.execute_direct(f"DROP TRIGGER IF EXISTS {trigger}")
+        session.execute_direct(f"CREATE TRIGGER {trigger} {definition}")
+
+    recount_summaries(session)
+
+def add_customer_versions(session):
+    session.execute_direct("ALTER TABLE customers ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+def add_audit_actor(session):
+    session.execute_direct("ALTER TABLE audit_log ADD COLUMN actor VARCHAR(64) NULL")
+
+# The SQLite schema starts at the equivalent of MySQL migration 8; partitioning, the stored
+# procedure and FULLTEXT have no counterpart here. Neither do the sort indexes of migration 12:
+# every SQLite index already ends in the rowid, so the name indexes serve (name, id) sorts.
+MIGRATIONS = (
+    (8, 'customers, ledger, audit log and change log', create_tables),
+    (9, 'balance band and daily flow summaries', create_summaries),
+    (10, 'customer row versions', add_customer_versions),
+    (11, 'audit log actor', add_audit_actor),
+    (13, 'append-only summary deltas', create_summary_deltas),
+)
+
+class SQLiteDatabase:
+    # BEGIN IMMEDIATE already holds the write lock for the whole transaction.
+    lock_clause = ""
+
+    # Balances have TEXT affinity and would sort as strings; the expression index on this key
+    # (see create_summaries) serves the top-balance queries.
+    balance_sort_key = "CAST(balance AS REAL)"
+
+    def __init__(self, config):
+        self.name = config['sqlite_path']
+        self.pool_size = int(config['pool_size'])
+        self.pool_timeout = float(config['pool_timeout'])
+        self.statement_cache_size = int(config['statement_cache_size'])
+        self.query_timeout = float(config['query_timeout'])
+        self.metrics = Metrics.from_config(config)
+        self.metrics_file = config['metrics_file']
+
+        # One connection per thread, opened on first use and kept until close().
+        self.thread_connections = {}
+        self.connections = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.active_connections = {}
+
+    def repository(self, cache=None):
+        return SQLiteCustomerRepository(self, cache)
+
+    @staticmethod
+    def cents_sql(column):
+        return f"CAST(ROUND({column} * 100) AS INTEGER)"
+
+    @staticmethod
+    def current_timestamp():
+        # UTC text in the format of the strftime('%Y-%m-%d %H:%M:%f', 'now') column defaults.
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+    def connect(self, database=True):
+        connection = sqlite3.connect(self.name, timeout=self.pool_timeout, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     cached_statements=self.statement_cache_size, factory=SQLiteConnection)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+
+        with self.lock:
+            self.connections[connection.connection_id] = connection
+        return connection
+
+    def database_exists(self):
+        return os.path.exists(self.name)
+
+    def create_database(self):
+        self.connect().close()
+
+    def drop_database(self):
+        self.close()
+
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.name + suffix):
+                os.remove(self.name + suffix)
+
+    def migrate(self):
+        create_migrations_query = """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+
+        applied = []
+
+        with self.transaction() as session:
+            session.execute_direct(create_migrations_query)
+            done = {row[0] for row in session.execute_direct("SELECT version FROM schema_migrations")}
+
+            for version, name, upgrade in MIGRATIONS:
+                if version not in done:
+                    upgrade(session)
+                    session.execute_direct("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                           (version, name))
+                    applied.append(version)
+
+        return applied
+
+    def estimate_row_count(self, connection):
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM customers")
+        result = cursor.fetchone()
+        cursor.close()
+
+        return int(result[0])
+
+    def query_interrupted(self, error):
+        return getattr(error, 'sqlite_errorcode', None) == SQLITE_INTERRUPT or str(error) == 'interrupted'
+
+    def statements_for(self, connection):
+        return self.statements.setdefault(connection.connection_id, OrderedDict())
+
+    def thread_connection(self):
+        thread_ident = threading.get_ident()
+        connection = self.thread_connections.get(thread_ident)
+
+        if connection is None:
+            connection = self.thread_connections[thread_ident] = self.connect()
+        return connection
+
+    @contextmanager
+    def session(self):
+        connection = self.thread_connection()
+        thread_ident = threading.get_ident()
+        self.active_connections[thread_ident] = connection.connection_id
+        try:
+            yield Session(self, connection)
+        finally:
+            self.active_connections.pop(thread_ident, None)
+
+    @contextmanager
+    def transaction(self):
+        with self.session() as session:
+            session.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield session
+            except BaseException:
+                session.connection.rollback()
+                raise
+            with self.metrics.measure('query', 'COMMIT'):
+                session.connection.commit()
+
+    def kill_query(self, connection_id):
+        connection = self.connections.get(connection_id)
+        if connection is not None:
+            connection.interrupt()
+
+    def cancel_thread_query(self, thread_ident):
+        connection_id = self.active_connections.get(thread_ident)
+        if connection_id is not None:
+            try:
+                self.kill_query(connection_id)
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        connections = list(self.thread_connections.values())
+        self.thread_connections.clear()
+        self.statements.clear()
+
+        for connection in connections:
+            connection.close()
+
+        if self.metrics_file:
+            try:
+                self.metrics.write(self.metrics_file)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", self.metrics_file, e)
+
+class SQLiteCustomerRepository(CustomerRepository):
+    def has_fulltext_search(self):
+        return False
+
+    def post_transaction(self, account_number, amount, kind):
+        select_query = "SELECT id, balance FROM customers WHERE account_number = %s"
+        update_query = "UPDATE customers SET balance = %s, version = version + 1 WHERE id = %s"
+        insert_query = ("INSERT INTO transactions (customer_id, account_number, kind, amount, balance_after) "
+                        "VALUES (%s, %s, %s, %s, %s)")
+
+        amount = amount.quantize(CENTS, ROUND_HALF_UP)
+
+        try:
+            with self.db.transaction() as session:
+                account = session.fetchone(select_query, (account_number,))
+
+                if account is None:
+                    raise AccountNotFound()
+
+                customer_id, balance = account
+                if balance + amount < 0:
+                    raise InsufficientFunds()
+
+                balance += amount
+                session.execute(update_query, (balance, customer_id))
+                session.execute(insert_query, (customer_id, account_number, kind, amount, balance))
+        finally:
+            self.invalidate(account_number)
+
+        return balance
+
+    def recent_change_sql(self, column):
+        return f"{column} >= strftime('%Y-%m-%d %H:%M:%f', 'now', %s)", f"-{self.change_grace} seconds"
+
+    def prune_changes(self):
+        delete_query = ("DELETE FROM customer_changes "
+                        "WHERE created_at < strftime('%Y-%m-%d %H:%M:%f', 'now', %s)")
+
+        with self.db.session() as session:
+            return session.execute(delete_query, (f"-{self.change_retention} seconds",)).rowcount
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DEFAULT_CONFIG
+from service import BankService
+
+@pytest.fixture
+def config(tmp_path):
+    # Built from the defaults alone, so a local bankdb.ini or BANKDB_* variables cannot point
+    # the tests at a real database.
+    return dict(DEFAULT_CONFIG, backend='sqlite', sqlite_path=str(tmp_path / 'bank.sqlite3'),
+                audit_actor='tests', audit_flush_interval='60')
+
+@pytest.fixture
+def service(config):
+    service = BankService.from_config(config)
+    service.setup_database()
+    yield service
+    service.close()
@@ -0,0 +1,106 @@
+from http.client import HTTPConnection
+import json
+import threading
+
+import pytest
+
+from api import BankHTTPServer
+
+@pytest.fixture
+def client(service):
+    server = BankHTTPServer(service, ('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    connection = HTTPConnection(*server.server_address, timeout=10)
+
+    def request(method, path, body=None, raw=None):
+        data = raw if raw is not None else (json.dumps(body).encode() if body is not None else None)
+        connection.request(method, path, data, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '50.00')
+    yield request
+
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+def test_customer_round_trip(client):
+    status, customer = client('POST', '/customers', {'first_name': 'Grace', 'last_name': 'Hopper',
+                                                     'account_number': 'ACC3', 'balance': '10.50'})
+    assert status == 201
+    assert client('GET', '/customers/ACC3') == (200, customer)
+
+    status, updated = client('PATCH', '/customers/ACC3', {'last_name': 'Murray', 'version': customer['version']})
+    assert status == 200
+    assert updated['version'] == customer['version'] + 1
+
+    assert client('POST', '/customers/ACC3/deposit', {'amount': '1.50'}) == (200, {'account_number': 'ACC3',
+                                                                                   'balance': '12.00'})
+    assert client('DELETE', '/customers/ACC3') == (200, {'deleted': 'ACC3'})
+    assert client('GET', '/customers/ACC3')[0] == 404
+
+@pytest.mark.parametrize('method, path, body', [
+    ('POST', '/customers', {'first_name': 'Grace', 'last_name': 'Hopper', 'account_number': ['x'], 'balance': '1'}),
+    ('POST', '/customers', {'first_name': {}, 'last_name': 'Hopper', 'account_number': 'ACC3', 'balance': '1'}),
+    ('POST', '/customers', {'first_name': 'Grace', 'last_name': 'Hopper', 'account_number': 'ACC3', 'balance': []}),
+    ('POST', '/customers', {'first_name': 'Grace'}),
+    ('PATCH', '/customers/ACC1', {'first_name': 'Augusta', 'version': []}),
+    ('PATCH', '/customers/ACC1', {'first_name': 'Augusta', 'version': {}}),
+    ('PATCH', '/customers/ACC1', {'first_name': 'Augusta', 'version': '0'}),
+    ('PATCH', '/customers/ACC1', {'first_name': ['Augusta']}),
+    ('PATCH', '/customers/ACC1', {}),
+    ('POST', '/customers/ACC1/deposit', {'amount': ['1']}),
+    ('POST', '/customers/ACC1/withdraw', {'amount': '-1'}),
+    ('POST', '/transfers', {'transfers': {'from_account': 'ACC1'}}),
+    ('POST', '/transfers', {'from_account': ['ACC1'], 'to_account': 'ACC2', 'amount': '1'}),
+    ('POST', '/transfers', {'from_account': 'ACC1', 'to_account': 'ACC2', 'amount': '1e20'}),
+    ('GET', '/customers?limit=-1', None),
+    ('GET', '/customers?limit=0', None),
+    ('GET', '/customers?limit=ten', None),
+    ('GET', '/customers?sort=balance;', None),
+    ('GET', '/changes?limit=-1', None),
+    ('GET', '/report?top=0', None),
+    ('GET', '/report?days=-1', None),
+])
+def test_bad_requests_get_400(client, method, path, body):
+    status, payload = client(method, path, body)
+
+    assert status == 400
+    assert payload['error']
+
+@pytest.mark.parametrize('raw', [b'{', b'[1, 2]', b'"text"', b'\xff'])
+def test_bodies_that_are_not_json_objects_get_400(client, raw):
+    assert client('POST', '/customers', raw=raw)[0] == 400
+
+def test_error_mapping(client):
+    assert client('GET', '/customers/NOPE')[0] == 404
+    assert client('POST', '/customers/NOPE/deposit', {'amount': '1'})[0] == 404
+    assert client('POST', '/customers/ACC2/withdraw', {'amount': '50.01'})[0] == 409
+    assert client('POST', '/transfers', {'from_account': 'ACC2', 'to_account': 'ACC1', 'amount': '60'})[0] == 409
+    assert client('GET', '/nothing/here')[0] == 404
+    assert client('DELETE', '/customers')[0] == 405
+
+    status, payload = client('POST', '/customers', {'first_name': 'Ada', 'last_name': 'Lovelace',
+                                                    'account_number': 'ACC1', 'balance': '1'})
+    assert status == 400
+
+def test_update_conflict_returns_the_current_customer(client):
+    _, customer = client('GET', '/customers/ACC1')
+    client('PATCH', '/customers/ACC1', {'first_name': 'Augusta', 'version': customer['version']})
+
+    status, payload = client('PATCH', '/customers/ACC1', {'last_name': 'King', 'version': customer['version']})
+
+    assert status == 409
+    assert payload['current']['first_name'] == 'Augusta'
+    assert payload['current']['version'] == customer['version'] + 1
+
+def test_limit_is_capped_and_paged(client):
+    status, payload = client('GET', '/customers?limit=1')
+    assert status == 200
+    assert [row['account_number'] for row in payload['customers']] == ['ACC1']
+
+    status, payload = client('GET', f"/customers?limit=5000&after_id={payload['customers'][0]['id']}")
+    assert [row['account_number'] for row in payload['customers']] == ['ACC2']
@@ -0,0 +1,67 @@
+import json
+
+from bulk import import_customers, post_transfers
+from database import open_database
+from service import BankService
+
+def audit_actions(config):
+    db = open_database(config)
+    try:
+        with db.session() as session:
+            return [row[0] for row in session.fetchall("SELECT action FROM audit_log ORDER BY id")]
+    finally:
+        db.close()
+
+def test_close_drains_the_audit_queue(config):
+    # The writer only wakes every minute here, so everything recorded must be written by close().
+    service = BankService.from_config(config)
+    service.setup_database()
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '50.00')
+    for _ in range(20):
+        service.deposit('ACC1', '1')
+    service.transfer('ACC1', 'ACC2', '5')
+    service.close()
+
+    assert audit_actions(config) == ['add_customer'] * 2 + ['deposit'] * 20 + ['transfer']
+    assert service.audit.written == 23
+    assert service.audit.dropped == 0
+
+def test_records_after_close_are_dropped(config):
+    service = BankService.from_config(config)
+    service.setup_database()
+    service.close()
+
+    service.record('deposit', 'ACC1')
+
+    assert service.audit.dropped == 1
+    assert audit_actions(config) == []
+
+def test_bulk_batches_are_audited(config, tmp_path):
+    customers_file = tmp_path / 'customers.csv'
+    customers_file.write_text("first_name,last_name,account_number,balance\n"
+                              "Ada,Lovelace,ACC1,100.00\nAlan,Turing,ACC2,50.00\nGrace,Hopper,ACC3,x\n"
+                              "Edsger,Dijkstra,ACC4,25.00\n")
+    transfers_file = tmp_path / 'transfers.csv'
+    transfers_file.write_text("from_account,to_account,amount\nACC1,ACC2,10\nACC2,NOPE,5\n")
+
+    service = BankService.from_config(config)
+    service.setup_database()
+    import_customers(service.customers, str(customers_file), batch_size=2, record=service.record)
+    post_transfers(service.customers, str(transfers_file), record=service.record)
+    service.close()
+
+    db = open_database(config)
+    try:
+        with db.session() as session:
+            rows = session.fetchall("SELECT action, account_number, actor, details FROM audit_log ORDER BY id")
+    finally:
+        db.close()
+
+    assert [(action, account_number, actor) for action, account_number, actor, _ in rows] == [
+        ('import_customers', None, 'tests'), ('import_customers', None, 'tests'), ('post_transfers', None, 'tests')]
+
+    details = [json.loads(row[3]) for row in rows]
+    assert [(entry['lines'], entry['accepted'], entry['total']) for entry in details] == [
+        ([2, 3], 2, '150.00'), ([4, 5], 1, '25.00'), ([2, 3], 1, '10.00')]
+    assert details[0]['file'] == str(customers_file)
@@ -0,0 +1,133 @@
+import csv
+from decimal import Decimal
+
+import pytest
+
+from bulk import import_customers, post_transactions, post_transfers
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+def read_rejects(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return [(int(row['line']), row['reason']) for row in csv.DictReader(file)]
+
+def balances(service, *account_numbers):
+    return [service.current_customer(account_number)['balance'] for account_number in account_numbers]
+
+@pytest.fixture
+def accounts(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '50.00')
+    return service
+
+def test_import_customers(service, tmp_path):
+    path = write_csv(tmp_path / 'customers.csv', ['First Name', 'Last Name', 'Account Number', 'Balance'], [
+        ['Ada', 'Lovelace', 'ACC1', '1,000.50'],
+        ['Alan', 'Turing', 'ACC2', '50'],
+        ['Grace', 'Hopper', 'ACC1', '10'],
+        ['Edsger', '', 'ACC3', '10'],
+        ['Barbara', 'Liskov', 'ACC4', '1.005'],
+        ['Donald', 'Knuth', 'ACC5', 'lots'],
+        ['', '', '', ''],
+        ['Ken', 'Thompson', 'X' * 21, '1'],
+        ['Dennis', 'Ritchie', 'ACC6', '-5'],
+    ])
+    rejects = str(tmp_path / 'rejects.csv')
+
+    result = import_customers(service.customers, path, batch_size=3, rejects_path=rejects)
+
+    assert (result.processed, result.accepted, result.rejected) == (8, 3, 5)
+    assert sorted(line for line, _ in read_rejects(rejects)) == [4, 5, 6, 7, 9]
+    assert balances(service, 'ACC1', 'ACC2', 'ACC6') == [Decimal('1000.50'), Decimal('50.00'), Decimal('-5.00')]
+
+def test_import_skips_existing_accounts(accounts, tmp_path):
+    path = write_csv(tmp_path / 'customers.csv', ['first_name', 'last_name', 'account_number', 'balance'], [
+        ['Ada', 'King', 'ACC1', '1'],
+        ['Grace', 'Hopper', 'ACC3', '10'],
+    ])
+    rejects = str(tmp_path / 'rejects.csv')
+
+    result = import_customers(accounts.customers, path, rejects_path=rejects)
+
+    assert (result.accepted, result.rejected) == (1, 1)
+    assert read_rejects(rejects) == [(2, 'Account number already exists.')]
+    assert accounts.current_customer('ACC1')['last_name'] == 'Lovelace'
+
+def test_post_transactions(accounts, tmp_path):
+    path = write_csv(tmp_path / 'postings.csv', ['account_number', 'amount', 'type'], [
+        ['ACC1', '10', 'deposit'],
+        ['ACC2', '20', 'Withdrawal'],
+        ['ACC2', '40', 'withdraw'],
+        ['ACC1', '-5', ''],
+        ['NOPE', '1', 'deposit'],
+        ['ACC1', '1', 'refund'],
+        ['ACC1', '-1', 'deposit'],
+        ['ACC1', '0', ''],
+    ])
+    rejects = str(tmp_path / 'rejects.csv')
+
+    result = post_transactions(accounts.customers, path, batch_size=3, rejects_path=rejects)
+
+    assert (result.processed, result.accepted, result.rejected) == (8, 3, 5)
+    assert sorted(line for line, _ in read_rejects(rejects)) == [4, 6, 7, 8, 9]
+    assert balances(accounts, 'ACC1', 'ACC2') == [Decimal('105.00'), Decimal('30.00')]
+
+    with accounts.db.session() as session:
+        ledger = session.fetchall("SELECT account_number, kind, amount FROM transactions ORDER BY id")
+    assert ledger == [('ACC1', 'deposit', Decimal('10.00')), ('ACC2', 'withdrawal', Decimal('-20.00')),
+                      ('ACC1', 'withdrawal', Decimal('-5.00'))]
+
+def test_post_transfers(accounts, tmp_path):
+    path = write_csv(tmp_path / 'transfers.csv', ['from_account', 'to_account', 'amount'], [
+        ['ACC1', 'ACC2', '60'],
+        ['ACC1', 'ACC2', '60'],
+        ['ACC2', 'ACC2', '1'],
+        ['ACC2', 'ACC1', '110'],
+        ['ACC2', 'NOPE', '1'],
+    ])
+    rejects = str(tmp_path / 'rejects.csv')
+
+    result = post_transfers(accounts.customers, path, batch_size=2, rejects_path=rejects)
+
+    assert (result.accepted, result.rejected) == (2, 3)
+    assert sorted(line for line, _ in read_rejects(rejects)) == [3, 4, 6]
+    assert balances(accounts, 'ACC1', 'ACC2') == [Decimal('150.00'), Decimal('0.00')]
+
+def test_cancel_stops_between_batches(accounts, tmp_path):
+    path = write_csv(tmp_path / 'postings.csv', ['account_number', 'amount'], [['ACC1', '1']] * 10)
+    progress = []
+
+    result = post_transactions(accounts.customers, path, batch_size=4, progress=progress.append,
+                               cancelled=lambda: len(progress) == 2)
+
+    assert result.cancelled
+    assert (result.processed, result.accepted, progress) == (8, 8, [4, 8])
+    assert balances(accounts, 'ACC1') == [Decimal('108.00')]
+
+def test_import_xlsx(service, tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['first_name', 'last_name', 'account_number', 'balance'])
+    sheet.append(['Ada', 'Lovelace', 'ACC1', 12.5])
+    sheet.append([None, None, None, None])
+    sheet.append(['Alan', 'Turing', 1002, 3])
+    path = str(tmp_path / 'customers.xlsx')
+    workbook.save(path)
+
+    result = import_customers(service.customers, path)
+
+    assert (result.processed, result.accepted) == (2, 2)
+    assert balances(service, 'ACC1', '1002') == [Decimal('12.50'), Decimal('3.00')]
+
+def test_unsupported_format(service, tmp_path):
+    path = tmp_path / 'customers.txt'
+    path.write_text('first_name\n')
+
+    with pytest.raises(ValueError):
+        import_customers(service.customers, str(path))
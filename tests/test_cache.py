@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+import pytest
+
+import cache
+from cache import MISSING, AccountCache
+from database import AccountNotFound
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_hits_and_misses():
+    accounts = AccountCache(max_size=10, ttl=30)
+
+    assert accounts.get('ACC1') is MISSING
+    accounts.put('ACC1', ('row',), accounts.token())
+
+    assert accounts.get('ACC1') == ('row',)
+    assert (accounts.stats()['hits'], accounts.stats()['misses']) == (1, 1)
+
+def test_entries_expire(clock):
+    accounts = AccountCache(max_size=10, ttl=30)
+    accounts.put('ACC1', ('row',), accounts.token())
+
+    clock[0] += 29
+    assert accounts.get('ACC1') == ('row',)
+    clock[0] += 2
+    assert accounts.get('ACC1') is MISSING
+
+def test_least_recently_used_is_evicted():
+    accounts = AccountCache(max_size=2, ttl=30)
+    for account_number in ('ACC1', 'ACC2'):
+        accounts.put(account_number, (account_number,), accounts.token())
+
+    accounts.get('ACC1')
+    accounts.put('ACC3', ('ACC3',), accounts.token())
+
+    assert accounts.get('ACC2') is MISSING
+    assert accounts.get('ACC1') == ('ACC1',)
+    assert accounts.stats()['evictions'] == 1
+
+def test_read_started_before_a_write_is_not_cached():
+    accounts = AccountCache(max_size=10, ttl=30)
+    token = accounts.token()
+
+    accounts.invalidate('ACC1')
+    accounts.put('ACC1', ('stale',), token)
+
+    assert accounts.get('ACC1') is MISSING
+    accounts.put('ACC1', ('fresh',), accounts.token())
+    assert accounts.get('ACC1') == ('fresh',)
+
+def test_disabled_by_config():
+    assert AccountCache.from_config({'cache_size': '0', 'cache_ttl': '30'}) is None
+
+def test_writes_invalidate_cached_customers(service):
+    assert service.customers.cache is not None
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '50.00')
+    service.get_customer('ACC1')
+    service.get_customer('ACC2')
+
+    service.deposit('ACC1', '1')
+    assert service.get_customer('ACC1')['balance'] == Decimal('101.00')
+
+    service.transfer('ACC1', 'ACC2', '1')
+    assert [service.get_customer(account)['balance'] for account in ('ACC1', 'ACC2')] == [Decimal('100.00'),
+                                                                                        Decimal('51.00')]
+
+    service.update_customer('ACC1', first_name='Augusta')
+    assert service.get_customer('ACC1')['first_name'] == 'Augusta'
+
+    service.delete_customer('ACC2')
+    with pytest.raises(AccountNotFound):
+        service.get_customer('ACC2')
+
+def test_unknown_accounts_are_cached_until_added(service):
+    with pytest.raises(AccountNotFound):
+        service.get_customer('ACC1')
+    hits = service.cache_stats()['hits']
+    with pytest.raises(AccountNotFound):
+        service.get_customer('ACC1')
+    assert service.cache_stats()['hits'] == hits + 1
+
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    assert service.get_customer('ACC1')['first_name'] == 'Ada'
@@ -0,0 +1,56 @@
+def log_change(service, change_id, customer_id, age=0):
+    # Writes a change log row with a chosen id, as a transaction committing out of id order would.
+    with service.db.session() as session:
+        session.execute("INSERT INTO customer_changes (id, customer_id, change_type, created_at) "
+                        "VALUES (%s, %s, 'U', strftime('%Y-%m-%d %H:%M:%f', 'now', %s))",
+                        (change_id, customer_id, f"-{age} seconds"))
+
+def test_changes_report_updates_and_deletes(service):
+    start = service.customers.latest_change_id()
+    ada = service.add_customer('Ada', 'Lovelace', 'ACC1', '10.00')
+    alan = service.add_customer('Alan', 'Turing', 'ACC2', '10.00')
+    service.deposit('ACC1', '5')
+    service.delete_customer('ACC2')
+
+    changes = service.customer_changes(start)
+
+    assert not changes['truncated']
+    assert [row['balance'] for row in changes['changed']] == [ada['balance'] + 5]
+    assert changes['deleted'] == [alan['id']]
+    assert service.customer_changes(changes['last_change_id'])['changed'] == []
+
+def test_changes_wait_for_a_missing_id(service):
+    ada = service.add_customer('Ada', 'Lovelace', 'ACC1', '10.00')
+    alan = service.add_customer('Alan', 'Turing', 'ACC2', '10.00')
+    position = service.customer_changes(0)['last_change_id']
+
+    # position + 1 is taken by a transaction that has not committed yet.
+    log_change(service, position + 2, ada['id'])
+    changes = service.customer_changes(position)
+
+    assert changes['last_change_id'] == position
+    assert [row['id'] for row in changes['changed']] == [ada['id']]
+
+    log_change(service, position + 1, alan['id'])
+    changes = service.customer_changes(position)
+
+    assert changes['last_change_id'] == position + 2
+    assert sorted(row['id'] for row in changes['changed']) == [ada['id'], alan['id']]
+
+def test_changes_move_past_an_old_missing_id(service):
+    ada = service.add_customer('Ada', 'Lovelace', 'ACC1', '10.00')
+    position = service.customer_changes(0)['last_change_id']
+
+    log_change(service, position + 2, ada['id'], age=service.customers.change_grace + 5)
+
+    assert service.customer_changes(position)['last_change_id'] == position + 2
+
+def test_latest_change_id_starts_before_recent_changes(service):
+    old = service.add_customer('Ada', 'Lovelace', 'ACC1', '10.00')
+    log_change(service, 100, old['id'], age=service.customers.change_grace + 5)
+    service.deposit('ACC1', '1')
+
+    position = service.customers.latest_change_id()
+
+    assert position == 100
+    assert [row['id'] for row in service.customer_changes(position)['changed']] == [old['id']]
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import pytest
+
+from database import AccountNotFound
+
+NAMES = ['Turing', 'Hopper', 'Lovelace', 'Hopper', 'Knuth', 'Turing', 'Hopper', 'Dijkstra']
+
+@pytest.fixture
+def customers(service):
+    # Repeated names and balances, so pages have to break ties on the later keys and the id.
+    for index, last_name in enumerate(NAMES * 3):
+        service.add_customer(f"First{index % 4}", last_name, f"ACC{index:03d}", f"{(index * 37) % 5 * 10}.50")
+    return service.list_customers(limit=1000)
+
+def read_pages(service, sort, limit):
+    rows = []
+    after_id = None
+
+    while True:
+        page = service.list_customers(after_id, limit, sort=sort)
+        assert len(page) <= limit
+        rows += page
+        if len(page) < limit:
+            return rows
+        after_id = page[-1]['id']
+
+def full_sort(rows, keys):
+    # Stable sorts from the last key to the first; descending text keys cannot be negated.
+    rows = list(rows)
+    for column, descending in reversed(keys):
+        rows.sort(key=lambda row: Decimal(row[column]) if column == 'balance' else row[column], reverse=descending)
+    return rows
+
+# Ties on every sort column are broken by id, in the direction of the first column.
+@pytest.mark.parametrize('sort, keys', [
+    ('last_name', [('last_name', False), ('id', False)]),
+    ('-balance', [('balance', True), ('id', True)]),
+    ('last_name,-balance', [('last_name', False), ('balance', True), ('id', False)]),
+    ('-first_name,balance,-last_name', [('first_name', True), ('balance', False), ('last_name', True), ('id', True)]),
+])
+@pytest.mark.parametrize('limit', [1, 4, 7, 100])
+def test_sorted_pages_match_a_full_sort(service, customers, sort, keys, limit):
+    expected = full_sort(customers, keys)
+
+    assert [row['id'] for row in read_pages(service, sort, limit)] == [row['id'] for row in expected]
+
+def test_sorted_page_after_unknown_customer(service, customers):
+    with pytest.raises(AccountNotFound):
+        service.list_customers(after_id=10 ** 6, sort='last_name')
+
+def test_sorted_pages_with_awkward_names(service):
+    # Boundary values are bound as parameters, so quotes and LIKE wildcards in them are plain text.
+    for index, last_name in enumerate(["O'Brien", "O'Brien", '50%', '5_0', 'a!b', 'a"b', "'; --", '%', '_']):
+        service.add_customer('First', last_name, f"ACC{index:03d}", '1.00')
+    customers = service.list_customers(limit=1000)
+    expected = full_sort(customers, [('last_name', True), ('id', True)])
+
+    assert [row['id'] for row in read_pages(service, '-last_name', 2)] == [row['id'] for row in expected]
+
+def test_sorted_pages_with_search(service, customers):
+    expected = full_sort([row for row in customers if row['last_name'] == 'Hopper'], [('balance', True), ('id', True)])
+    rows = []
+    after_id = None
+
+    while True:
+        page = service.list_customers(after_id, 2, search='Hop', sort='-balance')
+        rows += page
+        if len(page) < 2:
+            break
+        after_id = page[-1]['id']
+
+    assert [row['id'] for row in rows] == [row['id'] for row in expected]
+
+@pytest.mark.parametrize('sort', ['nope', 'balance,password', '-', 'last_name; DROP TABLE customers'])
+def test_unknown_sort_column(service, sort):
+    with pytest.raises(ValueError):
+        service.list_customers(sort=sort)
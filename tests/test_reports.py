@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+def test_report_totals(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '50.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '150.25')
+    service.add_customer('Grace', 'Hopper', 'ACC3', '2000000.00')
+    service.add_customer('Edsger', 'Dijkstra', 'ACC4', '-5.00')
+    service.deposit('ACC1', '100')
+    service.withdraw('ACC2', '50.25')
+    service.transfer('ACC3', 'ACC1', '10')
+    service.update_customer('ACC3', balance='999')
+    service.delete_customer('ACC4')
+
+    report = service.report(top=2, days=7)
+
+    assert report['accounts'] == 3
+    assert report['total_balance'] == Decimal('1259.00')
+    assert report['average_balance'] == Decimal('419.67')
+    assert report['total_deposits'] == Decimal('100.00')
+    assert report['total_withdrawals'] == Decimal('50.25')
+    assert [row['account_number'] for row in report['top_accounts']] == ['ACC3', 'ACC1']
+    assert sum(band['accounts'] for band in report['balance_bands']) == 3
+
+    [today] = report['daily_flows']
+    assert today['date'] == str(service.reports.today())
+    assert (today['entries'], today['inflow'], today['outflow']) == (4, Decimal('110.00'), Decimal('60.25'))
+    assert today['net'] == Decimal('49.75')
+
+def test_rebuilt_summaries_match_the_triggers(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '50.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '150.25')
+    service.deposit('ACC1', '100')
+    service.transfer('ACC2', 'ACC1', '0.25')
+    report = service.report()
+
+    service.rebuild_reports()
+
+    assert service.report() == report
+
+def test_compaction_keeps_the_totals(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '50.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '150.25')
+    service.deposit('ACC1', '100')
+    service.transfer('ACC2', 'ACC1', '0.25')
+    report = service.report()
+
+    assert service.compact_reports() > 0
+    assert service.report() == report
+
+    with service.db.session() as session:
+        assert session.fetchone("SELECT COUNT(*) FROM balance_band_deltas")[0] == 0
+        assert session.fetchone("SELECT COUNT(*) FROM daily_flow_deltas")[0] == 0
+
+    service.withdraw('ACC1', '150')
+    service.compact_reports()
+
+    assert service.report()['total_balance'] == report['total_balance'] - 150
+    assert service.compact_reports() == 0
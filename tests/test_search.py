@@ -0,0 +1,71 @@
+import pytest
+
+from database import escape_like, search_condition
+
+@pytest.fixture
+def customers(service):
+    for first_name, last_name, account_number in [
+        ('Ada', 'Lovelace', '500'),
+        ('Percy', '50% Off', 'P-1'),
+        ('Under', 'Score_Name', 'U_1'),
+        ('Under', 'ScoreXName', 'UX1'),
+        ('Bang', 'Wow!', 'B!1'),
+        ('Conan', "O'Brien", 'OB1'),
+        ('Mary', 'Ann Evans', 'ME1'),
+        ('Mary', 'Shelley', 'MS1'),
+    ]:
+        service.add_customer(first_name, last_name, account_number, '1.00')
+    return service
+
+def search(service, text):
+    return sorted(row['account_number'] for row in service.list_customers(search=text, limit=1000))
+
+def test_escape_like():
+    assert escape_like('a!b%c_d') == 'a!!b!%c!_d'
+
+@pytest.mark.parametrize('text, expected', [
+    ('50', ['500', 'P-1']),
+    ('50%', ['P-1']),
+    ('5_', []),
+    ('50% Off', []),
+    ('Percy 50%', ['P-1']),
+    ('Score_', ['U_1']),
+    ('U_', ['U_1']),
+    ('Wow!', ['B!1']),
+    ('B!', ['B!1']),
+    ("O'Bri", ['OB1']),
+    ('%', []),
+    ('_', []),
+    ('!', []),
+    ('lovelace', ['500']),
+    ('Mary Ann', ['ME1']),
+    ('Mary Ann Ev', ['ME1']),
+    ('Mary S', ['MS1']),
+    ('Ann Evans', []),
+    ('   ', ['500', 'B!1', 'ME1', 'MS1', 'OB1', 'P-1', 'UX1', 'U_1']),
+])
+def test_search_matches_text_literally(customers, text, expected):
+    assert search(customers, text) == expected
+
+def test_search_by_id(customers):
+    customer_id = customers.list_customers(limit=1000)[-1]['id']
+    rows = customers.list_customers(search=str(customer_id), limit=1000)
+
+    assert customer_id in [row['id'] for row in rows]
+
+@pytest.mark.parametrize('text', ["' OR '1'='1", "x'); DELETE FROM customers; --", '" OR ""="'])
+def test_search_text_is_never_sql(customers, text):
+    assert search(customers, text) == []
+    assert len(customers.list_customers(limit=1000)) == 8
+
+def test_fulltext_search_drops_punctuation():
+    condition, data = search_condition("Conan O'Brien", fulltext=True)
+
+    assert condition.startswith('MATCH')
+    assert data == ['+Conan* +OBrien*']
+
+def test_fulltext_search_falls_back_to_prefixes():
+    condition, data = search_condition('Percy %!', fulltext=True)
+
+    assert 'LIKE' in condition
+    assert data == ['Percy%', '!%!!%']
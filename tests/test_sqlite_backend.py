@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from service import BankService
+from sqlite_backend import MIGRATIONS
+
+def test_setup_applies_every_migration_once(config):
+    service = BankService.from_config(config)
+    try:
+        assert service.setup_database() is True
+        assert service.upgrade_schema() == []
+    finally:
+        service.close()
+
+    service = BankService.from_config(config)
+    try:
+        assert service.setup_database() is False
+        with service.db.session() as session:
+            versions = [row[0] for row in session.fetchall("SELECT version FROM schema_migrations ORDER BY version")]
+        assert versions == [version for version, _, _ in MIGRATIONS]
+    finally:
+        service.close()
+
+def test_balances_stay_exact_decimals(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '0.10')
+    for _ in range(10):
+        service.deposit('ACC1', '0.20')
+    service.withdraw('ACC1', '0.30')
+
+    balance = service.current_customer('ACC1')['balance']
+
+    assert isinstance(balance, Decimal)
+    assert balance == Decimal('1.80')
+
+def test_ledger_rows_follow_postings(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '10.00')
+    service.deposit('ACC1', '5')
+    service.withdraw('ACC1', '2.50')
+
+    with service.db.session() as session:
+        rows = session.fetchall("SELECT kind, amount, balance_after FROM transactions ORDER BY id")
+
+    assert rows == [('deposit', Decimal('5.00'), Decimal('15.00')),
+                    ('withdrawal', Decimal('-2.50'), Decimal('12.50'))]
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+import pytest
+
+from database import AccountNotFound, BankError, InsufficientFunds
+
+@pytest.fixture
+def accounts(service):
+    service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+    service.add_customer('Alan', 'Turing', 'ACC2', '50.00')
+    return service
+
+def balances(service):
+    return [service.current_customer(account)['balance'] for account in ('ACC1', 'ACC2')]
+
+def test_transfer_moves_money(accounts):
+    result = accounts.transfer('ACC1', 'ACC2', '30.25')
+
+    assert result['from_balance'] == Decimal('69.75')
+    assert result['to_balance'] == Decimal('80.25')
+    assert balances(accounts) == [Decimal('69.75'), Decimal('80.25')]
+
+@pytest.mark.parametrize('from_account, to_account, amount, error', [
+    ('ACC1', 'ACC1', '10', BankError),
+    ('ACC2', 'ACC1', '50.01', InsufficientFunds),
+    ('ACC1', 'NOPE', '10', AccountNotFound),
+    ('NOPE', 'ACC1', '10', AccountNotFound),
+    ('ACC1', '', '10', BankError),
+    ('ACC1', 2, '10', BankError),
+    ('ACC1', 'ACC2', 'ten', BankError),
+    ('ACC1', 'ACC2', '0', BankError),
+    ('ACC1', 'ACC2', '-5', BankError),
+    ('ACC1', 'ACC2', '0.001', BankError),
+    ('ACC1', 'ACC2', 'NaN', BankError),
+    ('ACC1', 'ACC2', '1e20', BankError),
+])
+def test_transfer_rejects(accounts, from_account, to_account, amount, error):
+    with pytest.raises(error):
+        accounts.transfer(from_account, to_account, amount)
+
+    assert balances(accounts) == [Decimal('100.00'), Decimal('50.00')]
+
+def test_transfer_batch_reports_rejects_by_index(accounts):
+    result = accounts.transfer_batch([
+        {'from_account': 'ACC1', 'to_account': 'ACC2', 'amount': '60'},
+        {'from_account': 'ACC1', 'to_account': 'ACC2', 'amount': '60'},
+        {'from_account': 'ACC2', 'to_account': 'ACC2', 'amount': '1'},
+        {'from_account': 'ACC2', 'to_account': 'NOPE', 'amount': '1'},
+        {'from_account': 'ACC2', 'to_account': 'ACC1', 'amount': 'abc'},
+        {'from_account': 'ACC2', 'to_account': 'ACC1', 'amount': '10'},
+    ])
+
+    assert result['accepted'] == 2
+    assert [reject['index'] for reject in result['rejected']] == [1, 2, 3, 4]
+    assert balances(accounts) == [Decimal('50.00'), Decimal('100.00')]
+
+@pytest.mark.parametrize('transfers', [None, {'from_account': 'ACC1'}, ['ACC1', 'ACC2'], [{}, 'ACC1']])
+def test_transfer_batch_rejects_malformed_payloads(accounts, transfers):
+    with pytest.raises(BankError):
+        accounts.transfer_batch(transfers)
+
+    assert balances(accounts) == [Decimal('100.00'), Decimal('50.00')]
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+import pytest
+
+from database import UpdateConflict
+
+@pytest.fixture
+def customer(service):
+    return service.add_customer('Ada', 'Lovelace', 'ACC1', '100.00')
+
+def test_update_bumps_version(service, customer):
+    updated = service.update_customer('ACC1', first_name='Augusta', expected=customer)
+
+    assert updated['version'] == customer['version'] + 1
+    assert service.current_customer('ACC1') == updated
+
+def test_update_retries_past_changes_to_other_fields(service, customer):
+    service.update_customer('ACC1', last_name='King', expected=customer)
+    updated = service.update_customer('ACC1', balance='75.50', expected=customer)
+
+    assert updated['version'] == customer['version'] + 2
+    current = service.current_customer('ACC1')
+    assert (current['last_name'], current['balance']) == ('King', Decimal('75.50'))
+
+def test_update_conflicts_on_the_same_field(service, customer):
+    service.update_customer('ACC1', first_name='Augusta', expected=customer)
+
+    with pytest.raises(UpdateConflict) as conflict:
+        service.update_customer('ACC1', first_name='Ada Augusta', expected=customer)
+
+    assert conflict.value.fields == ['first_name']
+    assert conflict.value.current['first_name'] == 'Augusta'
+    assert service.current_customer('ACC1')['first_name'] == 'Augusta'
+
+def test_update_conflicts_on_a_bare_version(service, customer):
+    service.update_customer('ACC1', last_name='King', expected=customer)
+
+    with pytest.raises(UpdateConflict) as conflict:
+        service.update_customer('ACC1', first_name='Augusta', expected={'version': customer['version']})
+
+    assert conflict.value.fields == ()
+    assert service.current_customer('ACC1')['first_name'] == 'Ada'
+
+def test_update_retries_when_the_version_moves_underneath(service, customer, monkeypatch):
+    # Another writer commits between the read and the guarded write, once.
+    update = service.customers.update
+    raced = []
+
+    def racing_update(account_number, update_fields, version):
+        if not raced:
+            raced.append(True)
+            update(account_number, [('last_name', 'King')], version)
+        return update(account_number, update_fields, version)
+
+    monkeypatch.setattr(service.customers, 'update', racing_update)
+    updated = service.update_customer('ACC1', first_name='Augusta', expected=customer)
+
+    assert updated['version'] == customer['version'] + 2
+    current = service.current_customer('ACC1')
+    assert (current['first_name'], current['last_name']) == ('Augusta', 'King')
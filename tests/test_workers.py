@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from metrics import Metrics
+from workers import OutcomeUnknown, QueryExecutor, QueryTimeout
+
+class SlowDatabase:
+    pool_size = 1
+    query_timeout = 0.1
+
+    def __init__(self):
+        self.metrics = Metrics()
+        self.killed = []
+
+    def cancel_thread_query(self, thread_ident):
+        self.killed.append(thread_ident)
+
+@pytest.fixture
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+@pytest.fixture
+def db():
+    return SlowDatabase()
+
+def run_until(app, condition, timeout=5):
+    timer = QtCore.QElapsedTimer()
+    timer.start()
+    while not condition() and timer.elapsed() < timeout * 1000:
+        app.processEvents(QtCore.QEventLoop.AllEvents, 10)
+
+def blocking_call(release, finished):
+    def call():
+        release.wait(5)
+        finished.append(True)
+        return 'done'
+    return call
+
+def test_timed_out_read_is_killed(app, db):
+    release, finished, errors = threading.Event(), [], []
+    executor = QueryExecutor(db)
+
+    executor.submit(blocking_call(release, finished), on_error=errors.append)
+    run_until(app, lambda: errors and db.killed)
+    release.set()
+    executor.shutdown()
+
+    assert isinstance(errors[0], QueryTimeout)
+    assert len(db.killed) == 1
+
+def test_timed_out_write_is_left_to_finish(app, db):
+    release, finished, errors, results = threading.Event(), [], [], []
+    executor = QueryExecutor(db)
+
+    executor.submit(blocking_call(release, finished), writes=True, on_error=errors.append, on_result=results.append)
+    run_until(app, lambda: errors)
+    release.set()
+    run_until(app, lambda: finished)
+    executor.shutdown()
+
+    assert isinstance(errors[0], OutcomeUnknown)
+    assert finished == [True]
+    assert db.killed == []
+    assert results == []
+
+def test_queued_write_is_canceled_before_it_starts(app, db):
+    release, finished, errors = threading.Event(), [], []
+    executor = QueryExecutor(db)
+
+    executor.submit(blocking_call(release, finished), writes=True, on_error=errors.append)
+    executor.submit(blocking_call(release, finished), writes=True, on_error=errors.append)
+    run_until(app, lambda: len(errors) == 2)
+    release.set()
+    executor.shutdown()
+
+    assert sorted(type(error).__name__ for error in errors) == ['OutcomeUnknown', 'QueryTimeout']
+    assert finished == [True]
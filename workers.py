@@ -0,0 +1,166 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+
+class QueryCancelled(Exception):
+    pass
+
+class QueryTimeout(QueryCancelled):
+    pass
+
+class OutcomeUnknown(Exception):
+    def __init__(self, message=None):
+        super().__init__(message or "The database did not confirm the operation in time. It may still complete; "
+                                    "check the account before trying again.")
+
+class QueryTaskSignals(QObject):
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+class QueryTask(QRunnable):
+    def __init__(self, db, fn, args, kwargs, writes=False):
+        super().__init__()
+
+        self.db = db
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.writes = writes
+        self.name = getattr(fn, '__qualname__', repr(fn))
+        self.signals = QueryTaskSignals()
+        self.cancelled = False
+        self.started = False
+        self.thread_ident = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.started = True
+            self.thread_ident = threading.get_ident()
+
+        try:
+            with self.db.metrics.measure('operation', self.name):
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        finally:
+            with self.lock:
+                self.thread_ident = None
+
+        if error is not None:
+            self.signals.failed.emit(error)
+        else:
+            self.signals.succeeded.emit(result)
+
+    def cancel(self):
+        # Returns whether the call is stopped. A write that has started is left to finish: by the
+        # time a kill arrives it may have committed, and its caller cannot tell either way.
+        with self.lock:
+            self.cancelled = True
+            thread_ident = self.thread_ident
+            if self.started and self.writes:
+                return False
+
+        # Killing opens a connection of its own, which can take as long as the database is slow
+        # to answer; the GUI thread that cancels must not wait for that.
+        if thread_ident is not None:
+            threading.Thread(target=self.kill, args=(thread_ident,), daemon=True).start()
+        return True
+
+    def kill(self, thread_ident):
+        with self.lock:
+            # The lock stays held while killing so the worker thread cannot move on to another
+            # task and have that task's query killed instead.
+            if self.thread_ident == thread_ident:
+                self.db.cancel_thread_query(thread_ident)
+
+class QueryHandle(QObject):
+    succeeded = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    closed = pyqtSignal()
+
+    def __init__(self, task, timeout, parent=None):
+        super().__init__(parent)
+
+        self.task = task
+        self.finished = False
+
+        task.signals.succeeded.connect(self.deliver_result)
+        task.signals.failed.connect(self.deliver_error)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.timed_out)
+        self.closed.connect(self.timer.stop)
+
+        if timeout:
+            self.timer.start(int(timeout * 1000))
+
+    @pyqtSlot(object)
+    def deliver_result(self, result):
+        if not self.finished:
+            self.finished = True
+            self.closed.emit()
+            self.succeeded.emit(result)
+
+    @pyqtSlot(object)
+    def deliver_error(self, error):
+        if not self.finished:
+            self.finished = True
+            self.closed.emit()
+            self.failed.emit(error)
+
+    def cancel(self, error=None):
+        if self.finished:
+            return
+
+        self.finished = True
+        stopped = self.task.cancel()
+        self.closed.emit()
+
+        if error is not None:
+            self.failed.emit(error if stopped else OutcomeUnknown())
+
+    def timed_out(self):
+        if not self.finished:
+            self.cancel(QueryTimeout("The database did not respond in time. The operation was canceled."))
+
+class QueryExecutor(QObject):
+    def __init__(self, db, timeout=None, parent=None):
+        super().__init__(parent)
+
+        self.db = db
+        self.timeout = db.query_timeout if timeout is None else timeout
+        self.handles = set()
+
+        # One worker per pooled connection; more threads would only wait for a connection.
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(db.pool_size)
+
+    def submit(self, fn, *args, on_result=None, on_error=None, timeout=None, writes=False, **kwargs):
+        task = QueryTask(self.db, fn, args, kwargs, writes)
+        handle = QueryHandle(task, self.timeout if timeout is None else timeout, self)
+
+        if on_result is not None:
+            handle.succeeded.connect(on_result)
+        if on_error is not None:
+            handle.failed.connect(on_error)
+
+        self.handles.add(handle)
+        handle.closed.connect(lambda: self.handles.discard(handle))
+        handle.closed.connect(handle.deleteLater)
+
+        self.thread_pool.start(task)
+        return handle
+
+    def cancel_all(self):
+        for handle in list(self.handles):
+            handle.cancel()
+
+    def shutdown(self, timeout=5):
+        self.cancel_all()
+        self.thread_pool.waitForDone(int(timeout * 1000))